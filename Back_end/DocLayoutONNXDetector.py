@@ -0,0 +1,166 @@
+import ast
+import os
+import numpy as np
+from PIL import Image
+
+
+class DocLayoutONNXDetector:
+    def __init__(self, onnx_path, names=None, imgsz=1024, iou=0.45, max_det=300, num_threads=None):
+        """
+        Chạy model DocLayout-YOLO đã export sang ONNX bằng ONNX Runtime trên CPU.
+        Có cùng kiểu gọi predict(...) và thuộc tính names như model YOLOv10 để dùng
+        trực tiếp với detect_layout / detect_layout_batch.
+
+        Args:
+            onnx_path (str): Đường dẫn file .onnx (đầu vào N x 3 x imgsz x imgsz, N động hoặc cố định)
+            names (dict | None): Mapping class id -> label. None thì đọc từ metadata của file ONNX.
+            imgsz (int): Kích thước ảnh đầu vào của model
+            iou (float): Ngưỡng IoU cho NMS (chỉ dùng khi model chưa có NMS trong graph)
+            max_det (int): Số box tối đa mỗi ảnh
+            num_threads (int | None): Số thread intra-op của ONNX Runtime
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Số ảnh tối đa mỗi lần chạy: file export cũ có batch cố định (thường là 1), None là batch động
+        batch_dim = model_input.shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        if self.max_batch is not None:
+            print(f"⚠️ ONNX detector có batch cố định {self.max_batch}, export lại để detect cả batch trong một lần chạy")
+
+        if names is None:
+            metadata = self.session.get_modelmeta().custom_metadata_map
+            names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        self.names = names
+        self.imgsz = imgsz
+        self.iou = iou
+        self.max_det = max_det
+
+    @staticmethod
+    def export(model_path, onnx_path=None, imgsz=1024):
+        """
+        Export file .pt của DocLayout-YOLO sang ONNX với đầu vào imgsz x imgsz và trục batch động
+
+        Returns:
+            str: Đường dẫn file .onnx
+        """
+        from doclayout_yolo import YOLOv10
+
+        exported_path = YOLOv10(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if onnx_path and os.path.abspath(exported_path) != os.path.abspath(onnx_path):
+            os.replace(exported_path, onnx_path)
+            exported_path = onnx_path
+        print(f"Exported ONNX detector to {exported_path}")
+        return exported_path
+
+    def letterbox(self, image):
+        """
+        Resize giữ tỉ lệ và pad ảnh về imgsz x imgsz (giống LetterBox của ultralytics).
+        Mảng numpy được coi là BGR như ultralytics, PIL Image là RGB.
+
+        Returns:
+            tuple: (tensor 1x3xHxW float32, ratio, (pad_x, pad_y))
+        """
+        if isinstance(image, Image.Image):
+            image = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        else:
+            # Đảo BGR -> RGB bằng view, resize bên dưới mới tạo ảnh mới
+            image = image[..., ::-1]
+        height, width = image.shape[:2]
+        ratio = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+        pad_x = (self.imgsz - new_width) / 2
+        pad_y = (self.imgsz - new_height) / 2
+
+        resized = np.asarray(Image.fromarray(image).resize((new_width, new_height), Image.Resampling.BILINEAR))
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        canvas[top:top + new_height, left:left + new_width] = resized
+
+        tensor = canvas.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return np.ascontiguousarray(tensor), ratio, (left, top)
+
+    def nms(self, boxes, scores, classes):
+        """NMS theo từng class, vectorized bằng numpy (dời box theo class id để không chồng nhau)"""
+        offset_boxes = boxes + (classes * (boxes.max() + 1))[:, None]
+        x1, y1, x2, y2 = offset_boxes.T
+        areas = (x2 - x1) * (y2 - y1)
+        order = np.argsort(-scores)
+        keep = []
+        while order.size > 0 and len(keep) < self.max_det:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
+            inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+            inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+            inter = inter_w * inter_h
+            iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+            order = rest[iou <= self.iou]
+        return np.array(keep, dtype=np.int64)
+
+    def postprocess(self, output, conf, ratio, pad, image_size):
+        """
+        Chuyển output của model về list box trong tọa độ ảnh gốc
+
+        Hỗ trợ hai dạng output:
+        - (N, 6): [x1, y1, x2, y2, score, class] đã qua NMS (head one-to-one của YOLOv10)
+        - (4 + nc, A): [cx, cy, w, h, score_0..score_nc] chưa decode, cần NMS
+        """
+        if output.shape[-1] == 6:
+            boxes, scores, classes = output[:, :4], output[:, 4], output[:, 5].astype(np.int64)
+            mask = scores >= conf
+            boxes, scores, classes = boxes[mask], scores[mask], classes[mask]
+        else:
+            predictions = output.T
+            class_scores = predictions[:, 4:]
+            classes = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(classes)), classes]
+            mask = scores >= conf
+            xywh, scores, classes = predictions[mask, :4], scores[mask], classes[mask]
+            boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            if len(boxes):
+                keep = self.nms(boxes, scores, classes)
+                boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+        # Bỏ padding và scale về ảnh gốc
+        width, height = image_size
+        boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+        return [
+            {
+                'bbox': box.tolist(),
+                'label': self.names.get(int(cls), str(int(cls))),
+                'score': float(score)
+            }
+            for box, score, cls in zip(boxes, scores, classes)
+        ]
+
+    def predict(self, source, imgsz=None, conf=0.3, device="cpu", batch=1, **kwargs):
+        """
+        Phát hiện bố cục cho một ảnh hoặc list ảnh (PIL Image hoặc numpy array BGR như YOLOv10).
+        Các ảnh được letterbox rồi ghép thành một tensor N x 3 x imgsz x imgsz và chạy trong
+        một lần session.run (chia theo max_batch nếu model có batch cố định).
+
+        Returns:
+            list: Với mỗi ảnh, một list các dict {'bbox', 'label', 'score'}
+        """
+        images = source if isinstance(source, (list, tuple)) else [source]
+        chunk_size = self.max_batch or max(len(images), 1)
+        results = []
+        for start in range(0, len(images), chunk_size):
+            chunk = images[start:start + chunk_size]
+            letterboxed = [self.letterbox(image) for image in chunk]
+            tensor = np.concatenate([tensor for tensor, _, _ in letterboxed])
+            outputs = self.session.run(None, {self.input_name: tensor})[0]
+            for image, output, (_, ratio, pad) in zip(chunk, outputs, letterboxed):
+                image_size = image.size if isinstance(image, Image.Image) else (image.shape[1], image.shape[0])
+                results.append(self.postprocess(output, conf, ratio, pad, image_size))
+        return results
@@ -1,19 +1,54 @@
 import os
+import weakref
+from collections import OrderedDict
+import numpy as np
 from PIL import Image
 import torch
 from transformers import LayoutLMv3Processor, LayoutLMv3ForSequenceClassification
 import warnings
 warnings.filterwarnings("ignore")
 
+# Các backend suy luận được hỗ trợ
+BACKENDS = ("torch", "torch_int8", "onnx")
+# Tên các input của model khi export sang ONNX
+ONNX_INPUT_NAMES = ["input_ids", "bbox", "attention_mask", "pixel_values"]
+
+
+class _LogitsOnlyWrapper(torch.nn.Module):
+    """Bọc model để export ONNX với các input cố định và chỉ trả về logits"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, bbox, attention_mask, pixel_values):
+        return self.model(
+            input_ids=input_ids,
+            bbox=bbox,
+            attention_mask=attention_mask,
+            pixel_values=pixel_values
+        ).logits
+
+
 class LayoutLMv3Classifier:
-    def __init__(self, model_path="model/best_Layout_LMv3"):
+    def __init__(self, model_path="model/best_Layout_LMv3", backend="torch", onnx_path=None):
         """
         Khởi tạo classifier với model đã train
 
         Args:
             model_path (str): Đường dẫn đến folder chứa model đã train
+            backend (str): Backend suy luận: "torch" (fp32), "torch_int8" (dynamic quantization)
+                           hoặc "onnx" (ONNX Runtime)
+            onnx_path (str | None): File ONNX của model, mặc định là model_path/model.onnx.
+                                    File sẽ được export nếu chưa tồn tại.
         """
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend không hợp lệ: {backend}. Chọn một trong {BACKENDS}")
+        # Quantization và ONNX Runtime ở đây chỉ dành cho CPU
+        if backend == "torch" and torch.cuda.is_available():
+            self.device = torch.device("cuda")
+        else:
+            self.device = torch.device("cpu")
         print(f"Using device: {self.device}")
 
         # Load processor và model
@@ -44,6 +79,76 @@ class LayoutLMv3Classifier:
         self.LAYOUTLM_IMAGE_SIZE = 224
         self.MAX_SEQ_LENGTH = 512
 
+        # LRU cache pixel_values đã tiền xử lý của các trang gần nhất
+        self.PIXEL_CACHE_SIZE = 8
+        self._pixel_cache = OrderedDict()
+
+        # Chuẩn bị backend suy luận
+        self.backend = "torch"
+        self.onnx_session = None
+        if backend == "torch_int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model.eval()
+            self.backend = backend
+        elif backend == "onnx":
+            try:
+                self.onnx_session = self.load_onnx_session(onnx_path or os.path.join(model_path, "model.onnx"))
+                self.backend = backend
+            except Exception as e:
+                print(f"Error loading ONNX backend: {e}")
+                print("Using PyTorch fp32 backend instead...")
+        print(f"Classifier backend: {self.backend}")
+
+    def export_onnx(self, onnx_path):
+        """
+        Export model sang ONNX với batch size và độ dài chuỗi động
+
+        Args:
+            onnx_path (str): Đường dẫn file .onnx cần tạo
+        """
+        dummy_image = Image.new("RGB", (self.LAYOUTLM_IMAGE_SIZE, self.LAYOUTLM_IMAGE_SIZE), "white")
+        words, boxes = self.prepare_inputs(dummy_image.size, ["dummy", "title"], [[0, 0, 100, 20], [110, 0, 200, 20]])
+        encoding = self.encode([dummy_image], [words], [boxes], padding="longest")
+
+        os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+        torch.onnx.export(
+            _LogitsOnlyWrapper(self.model).eval(),
+            tuple(encoding[name] for name in ONNX_INPUT_NAMES),
+            onnx_path,
+            input_names=ONNX_INPUT_NAMES,
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "bbox": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "pixel_values": {0: "batch"},
+                "logits": {0: "batch"}
+            },
+            opset_version=17
+        )
+        print(f"Exported ONNX model to {onnx_path}")
+
+    def load_onnx_session(self, onnx_path):
+        """Tạo ONNX Runtime session trên CPU, export model trước nếu chưa có file"""
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            self.export_onnx(onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def forward_logits(self, encoding):
+        """Chạy model trên encoding theo backend đã chọn, trả về logits (torch.Tensor)"""
+        if self.onnx_session is not None:
+            inputs = {name: encoding[name].cpu().numpy() for name in ONNX_INPUT_NAMES}
+            logits = self.onnx_session.run(["logits"], inputs)[0]
+            return torch.from_numpy(logits)
+
+        with torch.no_grad():
+            return self.model(**encoding).logits
+
     def normalize_box(self, box, width, height):
         """Normalize bounding box coordinates to 0-1000 scale"""
         return [
@@ -53,15 +158,12 @@ class LayoutLMv3Classifier:
             int(1000 * (box[3] / height))
         ]
 
-    def resize_image_and_boxes(self, image, boxes, target_size=None):
-        """Resize image and adjust bounding boxes"""
+    def adjust_boxes(self, boxes, original_size, target_size=None):
+        """Scale bounding boxes từ kích thước ảnh gốc về ảnh target_size x target_size"""
         if target_size is None:
             target_size = self.LAYOUTLM_IMAGE_SIZE
 
-        original_width, original_height = image.size
-
-        # Resize image
-        resized_image = image.resize((target_size, target_size), Image.Resampling.LANCZOS)
+        original_width, original_height = original_size
 
         # Calculate scaling factors
         width_scale = target_size / original_width
@@ -94,7 +196,51 @@ class LayoutLMv3Classifier:
             else:
                 adjusted_boxes.append([0, 0, 1, 1])  # fallback box
 
-        return resized_image, adjusted_boxes
+        return adjusted_boxes
+
+    def resize_image_and_boxes(self, image, boxes, target_size=None):
+        """Resize image and adjust bounding boxes"""
+        if target_size is None:
+            target_size = self.LAYOUTLM_IMAGE_SIZE
+
+        # Resize image
+        resized_image = image.resize((target_size, target_size), Image.Resampling.LANCZOS)
+
+        return resized_image, self.adjust_boxes(boxes, image.size, target_size)
+
+    def get_pixel_values(self, image):
+        """
+        Lấy tensor pixel_values (1, 3, H, W) của ảnh trang, dùng lại kết quả đã tính
+        nếu cùng đối tượng ảnh vừa được xử lý (các title trong cùng một trang)
+
+        Args:
+            image: Ảnh RGB của trang (PIL Image hoặc np.ndarray (H, W, 3))
+
+        Returns:
+            torch.Tensor: pixel_values đã chuẩn hóa
+        """
+        key = id(image)
+        cached = self._pixel_cache.get(key)
+        # So sánh qua weakref để không nhầm với ảnh khác được cấp lại cùng id
+        if cached is not None and cached[0]() is image:
+            self._pixel_cache.move_to_end(key)
+            return cached[1]
+
+        if isinstance(image, np.ndarray):
+            # Ảnh trang từ pipeline đã là RGB, chỉ dựng PIL Image để resize
+            image_rgb = Image.fromarray(image)
+        else:
+            image_rgb = image if image.mode == "RGB" else image.convert("RGB")
+        resized_image = image_rgb.resize(
+            (self.LAYOUTLM_IMAGE_SIZE, self.LAYOUTLM_IMAGE_SIZE), Image.Resampling.LANCZOS
+        )
+        pixel_values = self.processor.image_processor(resized_image, return_tensors="pt")["pixel_values"]
+
+        self._pixel_cache[key] = (weakref.ref(image), pixel_values)
+        self._pixel_cache.move_to_end(key)
+        while len(self._pixel_cache) > self.PIXEL_CACHE_SIZE:
+            self._pixel_cache.popitem(last=False)
+        return pixel_values
 
     def validate_and_clean_data(self, words, boxes):
         """Validate và clean dữ liệu words và boxes"""
@@ -136,12 +282,108 @@ class LayoutLMv3Classifier:
 
         return clean_words, clean_boxes
 
+    def load_image(self, image, base_dir=""):
+        """Trả về ảnh (PIL Image hoặc np.ndarray giữ nguyên) từ ảnh hoặc đường dẫn ảnh"""
+        if isinstance(image, str):
+            image = Image.open(os.path.join(base_dir, image)).convert("RGB")
+        return image
+
+    @staticmethod
+    def image_size(image):
+        """(width, height) của PIL Image hoặc np.ndarray (H, W, C)"""
+        if isinstance(image, np.ndarray):
+            return image.shape[1], image.shape[0]
+        return image.size
+
+    def prepare_inputs(self, image_size, words, boxes):
+        """
+        Chuẩn bị words và boxes đã chuẩn hóa cho tokenizer của một mẫu
+
+        Args:
+            image_size (tuple): (width, height) của ảnh trang chứa các box
+            words (list): Danh sách các từ
+            boxes (list): Danh sách các bounding box tương ứng
+
+        Returns:
+            tuple: (words, normalized_boxes)
+        """
+        # Validate and clean data
+        words, boxes = self.validate_and_clean_data(words, boxes)
+
+        # Adjust boxes theo ảnh đã resize
+        adjusted_boxes = self.adjust_boxes(boxes, image_size, target_size=self.LAYOUTLM_IMAGE_SIZE)
+
+        # Normalize boxes to 0-1000 scale for LayoutLM
+        normalized_boxes = []
+        for box in adjusted_boxes:
+            normalized_box = self.normalize_box(box, self.LAYOUTLM_IMAGE_SIZE, self.LAYOUTLM_IMAGE_SIZE)
+            normalized_boxes.append(normalized_box)
+
+        # Limit sequence length
+        if len(words) > self.MAX_SEQ_LENGTH - 2:
+            words = words[:self.MAX_SEQ_LENGTH - 2]
+            normalized_boxes = normalized_boxes[:self.MAX_SEQ_LENGTH - 2]
+
+        return words, normalized_boxes
+
+    def encode(self, images, words_list, boxes_list, padding):
+        """
+        Encode một hoặc nhiều mẫu: tokenizer cho words/boxes và pixel_values lấy từ cache
+
+        Args:
+            images (list): Ảnh (PIL Image hoặc np.ndarray RGB) của từng mẫu
+            words_list (list): Danh sách words của từng mẫu
+            boxes_list (list): Danh sách boxes đã chuẩn hóa của từng mẫu
+            padding (str): "max_length" hoặc "longest"
+
+        Returns:
+            dict: Encoding đã chuyển sang device
+        """
+        encoding = self.processor.tokenizer(
+            words_list,
+            boxes=boxes_list,
+            truncation=True,
+            padding=padding,
+            max_length=self.MAX_SEQ_LENGTH,
+            return_tensors="pt"
+        )
+        encoding["pixel_values"] = torch.cat([self.get_pixel_values(image) for image in images])
+
+        # Move to device
+        return {k: v.to(self.device) for k, v in encoding.items()}
+
+    def format_result(self, probabilities, return_probabilities=False):
+        """Tạo dict kết quả từ vector xác suất của một mẫu"""
+        predicted_class = int(torch.argmax(probabilities).item())
+        result = {
+            'predicted_class': predicted_class,
+            'predicted_label': self.id_to_label[predicted_class],
+            'confidence': float(probabilities[predicted_class])
+        }
+
+        if return_probabilities:
+            result['probabilities'] = {
+                self.id_to_label[i]: float(prob)
+                for i, prob in enumerate(probabilities)
+            }
+
+        return result
+
+    def error_result(self, error):
+        """Kết quả mặc định khi dự đoán lỗi"""
+        return {
+            'predicted_class': 0,
+            'predicted_label': self.id_to_label[0],
+            'confidence': 0.0,
+            'error': str(error)
+        }
+
     def predict_single(self, image, words, boxes, return_probabilities=False):
         """
         Dự đoán cho một mẫu duy nhất
 
         Args:
-            image: pil image object
+            image: Ảnh trang (PIL Image, np.ndarray RGB hoặc đường dẫn ảnh)
             words (list): Danh sách các từ
             boxes (list): Danh sách các bounding box tương ứng
             return_probabilities (bool): Có trả về xác suất hay không
@@ -151,72 +393,19 @@ class LayoutLMv3Classifier:
         """
         try:
             # Load image
-            image = image.convert("RGB")
-            original_width, original_height = image.size
-
-            # Validate and clean data
-            words, boxes = self.validate_and_clean_data(words, boxes)
-
-            # Resize image and adjust boxes
-            resized_image, adjusted_boxes = self.resize_image_and_boxes(
-                image, boxes, target_size=self.LAYOUTLM_IMAGE_SIZE
-            )
-
-            # Normalize boxes to 0-1000 scale for LayoutLM
-            normalized_boxes = []
-            for box in adjusted_boxes:
-                normalized_box = self.normalize_box(box, self.LAYOUTLM_IMAGE_SIZE, self.LAYOUTLM_IMAGE_SIZE)
-                normalized_boxes.append(normalized_box)
-
-            # Limit sequence length
-            if len(words) > self.MAX_SEQ_LENGTH - 2:
-                words = words[:self.MAX_SEQ_LENGTH - 2]
-                normalized_boxes = normalized_boxes[:self.MAX_SEQ_LENGTH - 2]
-
-            # Process with LayoutLMv3Processor
-            encoding = self.processor(
-                resized_image,
-                words,
-                boxes=normalized_boxes,
-                truncation=True,
-                padding="max_length",
-                max_length=self.MAX_SEQ_LENGTH,
-                return_tensors="pt"
-            )
-
-            # Move to device
-            encoding = {k: v.to(self.device) for k, v in encoding.items()}
+            image = self.load_image(image)
+            words, normalized_boxes = self.prepare_inputs(self.image_size(image), words, boxes)
 
-            # Inference
-            with torch.no_grad():
-                outputs = self.model(**encoding)
-                logits = outputs.logits
-                probabilities = torch.softmax(logits, dim=-1)
-                predicted_class = torch.argmax(logits, dim=-1).item()
-
-            # Prepare results
-            result = {
-                'predicted_class': predicted_class,
-                'predicted_label': self.id_to_label[predicted_class],
-                'confidence': float(probabilities[0][predicted_class])
-            }
+            encoding = self.encode([image], [words], [normalized_boxes], padding="max_length")
 
-            if return_probabilities:
-                result['probabilities'] = {
-                    self.id_to_label[i]: float(prob)
-                    for i, prob in enumerate(probabilities[0])
-                }
+            # Inference
+            probabilities = torch.softmax(self.forward_logits(encoding), dim=-1)
 
-            return result
+            return self.format_result(probabilities[0], return_probabilities)
 
         except Exception as e:
             print(f"Error in prediction: {e}")
-            return {
-                'predicted_class': 0,
-                'predicted_label': self.id_to_label[0],
-                'confidence': 0.0,
-                'error': str(e)
-            }
+            return self.error_result(e)
 
     def predict_from_json(self, json_data, base_dir="", return_probabilities=False):
         """
@@ -236,14 +425,17 @@ class LayoutLMv3Classifier:
 
         return self.predict_single(image_path, words, boxes, return_probabilities)
 
-    def predict_batch(self, data_list, base_dir="", return_probabilities=False):
+    def predict_batch(self, data_list, base_dir="", return_probabilities=False, batch_size=16):
         """
-        Dự đoán cho một batch dữ liệu
+        Dự đoán cho một batch dữ liệu: các mẫu được encode chung, pad động theo
+        chuỗi dài nhất trong batch và chạy một lần forward cho mỗi batch
 
         Args:
-            data_list (list): Danh sách các dict chứa dữ liệu
+            data_list (list): Danh sách các dict chứa 'words', 'boxes' và 'image'
+                              (PIL Image hoặc np.ndarray RGB) hoặc 'image_path'
             base_dir (str): Thư mục gốc chứa ảnh
             return_probabilities (bool): Có trả về xác suất hay không
+            batch_size (int): Số mẫu tối đa trong một lần forward
 
         Returns:
             list: Danh sách kết quả dự đoán
@@ -251,13 +443,29 @@ class LayoutLMv3Classifier:
         results = []
 
         print(f"Processing {len(data_list)} samples...")
-        for i, data in enumerate(data_list):
-            if i % 10 == 0:
-                print(f"Processing {i+1}/{len(data_list)}")
-
-            result = self.predict_from_json(data, base_dir, return_probabilities)
-            result['sample_index'] = i
-            results.append(result)
+        for start in range(0, len(data_list), batch_size):
+            chunk = data_list[start:start + batch_size]
+            try:
+                images, words_list, boxes_list = [], [], []
+                for data in chunk:
+                    image = self.load_image(data['image'] if 'image' in data else data['image_path'], base_dir)
+                    words, normalized_boxes = self.prepare_inputs(self.image_size(image), data.get('words', []), data.get('boxes', []))
+                    images.append(image)
+                    words_list.append(words)
+                    boxes_list.append(normalized_boxes)
+
+                encoding = self.encode(images, words_list, boxes_list, padding="longest")
+
+                probabilities = torch.softmax(self.forward_logits(encoding), dim=-1)
+
+                chunk_results = [self.format_result(prob, return_probabilities) for prob in probabilities]
+            except Exception as e:
+                print(f"Error in batch prediction: {e}")
+                chunk_results = [self.error_result(e) for _ in chunk]
+
+            for i, result in enumerate(chunk_results, start):
+                result['sample_index'] = i
+                results.append(result)
 
         return results
 
@@ -1,66 +1,295 @@
 import fitz
-from PIL import Image
 import numpy as np
 import time
 import os
+import hashlib
+from result_cache import hash_content
+import pipeline_metrics
+from layout_order import reading_order, FULL_WIDTH_COLUMN
+
+# Số trang được detect bố cục chung trong một lần gọi model
+DETECT_BATCH_SIZE = 4
+
+# Độ phân giải của hệ tọa độ bbox trả về (và của ảnh trang hiển thị ở frontend)
+OUTPUT_DPI = 300
+OUTPUT_SCALE = OUTPUT_DPI / 72
+# Cạnh dài của ảnh dùng để detect bố cục, khớp với imgsz của model
+DETECT_IMAGE_SIZE = 1024
+# Độ phân giải render lại vùng cần OCR bằng EasyOCR
+OCR_DPI = 300
+# "adaptive": render trang ở độ phân giải detect, chỉ render lại vùng cần OCR ở OCR_DPI
+# "full": render cả trang ở OUTPUT_DPI như trước
+RENDER_MODE = "adaptive"
+# Ngưỡng confidence khi detect và ngưỡng score để giữ box (cũng là một phần khóa cache)
+DETECT_CONF = 0.3
+SCORE_THRESHOLD = 0.4
+# Cách OCR các box không có text layer: "page" chạy EasyOCR một lần trên cả trang rồi chia dòng
+# cho các box, "box" OCR từng vùng, "auto" chọn "page" khi có từ FULL_PAGE_OCR_MIN_BOXES box cần OCR
+OCR_MODE = "auto"
+FULL_PAGE_OCR_MIN_BOXES = 3
+# Tỉ lệ diện tích tối thiểu của dòng OCR nằm trong box để được gán cho box đó
+OCR_LINE_MIN_OVERLAP = 0.5
+# Triage trang: gần như không có text layer (ít hơn TRIAGE_MIN_CHARS ký tự) và ảnh phủ từ
+# TRIAGE_SCANNED_IMAGE_COVERAGE diện tích trở lên là trang scan. Trang có text layer nhưng ảnh phủ
+# từ TRIAGE_MIXED_IMAGE_COVERAGE trở lên, hoặc không rõ loại, là trang mixed.
+TRIAGE_MIN_CHARS = 20
+TRIAGE_SCANNED_IMAGE_COVERAGE = 0.5
+TRIAGE_MIXED_IMAGE_COVERAGE = 0.3
+# Cách OCR mặc định theo loại trang: digital chỉ dùng text layer, scanned và mixed OCR
+# những box không có chữ theo OCR_MODE (trang scan bỏ qua text layer, xem process_pdf_page)
+PAGE_KIND_OCR_MODES = {
+    "digital": "none",
+    "scanned": None,
+    "mixed": None,
+}
+
+class PixmapBuffer:
+    """
+    Bộ nhớ samples của một pixmap dưới dạng __array_interface__ để numpy tạo mảng trực tiếp trên đó.
+    Bộ nhớ này chỉ sống cùng pixmap (samples_mv không giữ pixmap) nên đối tượng giữ tham chiếu tới pixmap;
+    mảng tạo từ nó và mọi view cắt từ mảng có .base dẫn về đây nên pixmap được giải phóng sau view cuối cùng.
+    """
 
-def pdf_to_images(documents, output_folder):
+    def __init__(self, pix):
+        self.pixmap = pix
+        self.__array_interface__ = {
+            "shape": (pix.height, pix.width, pix.n),
+            "typestr": "|u1",
+            "data": (pix.samples_ptr, True),  # Chỉ đọc
+            "version": 3,
+        }
+
+
+def pixmap_to_array(pix):
     """
-    Chuyển đổi từng trang của file PDF sang định dạng PIL Image.
-    Args:
-        documents (fitz.Document): Đối tượng PDF.
+    Ảnh (H, W, n) uint8 của pixmap, không sao chép pixel.
     Returns:
-        list: Một list các dictionary, mỗi dict chứa 'image' (PIL Image)
-              và 'page_number' của trang tương ứng.
+        np.ndarray: Mảng chỉ đọc trên bộ nhớ của pixmap.
     """
+    return np.asarray(PixmapBuffer(pix))
 
-    doc_images = []
 
-    for page_index, page in enumerate(documents):
-        image_name = f"page_{page_index}.png"
-        image_path = os.path.join(output_folder, image_name)
-
-        try:
-            pix = page.get_pixmap(dpi=300)
-            if not pix:
-                print(f"Error: Could not get pixmap for page {page_index}")
-                continue
+def crop_page_image(page_image, bbox, box_scale=1.0):
+    """
+    Vùng bbox (hệ tọa độ OUTPUT_DPI) của ảnh trang dưới dạng view, không sao chép pixel.
+    Args:
+        page_image (np.ndarray): Ảnh RGB (H, W, 3) của trang.
+        bbox (list hoặc tuple): [x1, y1, x2, y2] trong hệ tọa độ OUTPUT_DPI.
+        box_scale (float): Hệ số đổi tọa độ ảnh sang OUTPUT_DPI.
+    Returns:
+        np.ndarray: View (h, w, 3) của vùng bbox.
+    """
+    x1, y1, x2, y2 = (max(int(coord / box_scale), 0) for coord in bbox)
+    return page_image[y1:y2, x1:x2]
 
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            if not img:
-                print(f"Error: Could not create PIL Image for page {page_index}")
-                continue
 
-            img.save(image_path, "PNG")
-            print(f"Saved: {image_path}") # Debugging
-            doc_images.append({
-                "image": img,
-                "page_index": page_index,
-                "page": page
-            })
+def iter_pdf_pages(documents, output_folder=None, dpi=OUTPUT_DPI, render_mode=RENDER_MODE, page_indices=None):
+    """
+    Render lần lượt từng trang của file PDF sang ảnh numpy (generator).
+    Mỗi trang chỉ được render khi trang trước đã được xử lý xong, nhờ vậy
+    bộ nhớ chỉ giữ ảnh của một trang tại một thời điểm.
+    Args:
+        documents (fitz.Document): Đối tượng PDF.
+        output_folder (str | None): Thư mục lưu ảnh PNG của trang. None thì không lưu.
+        dpi (int): Độ phân giải render khi render_mode là "full" và của ảnh PNG lưu ra.
+        render_mode (str): "adaptive" render trang với cạnh dài DETECT_IMAGE_SIZE pixel,
+                           "full" render cả trang ở dpi.
+        page_indices (iterable | None): Chỉ render các trang này. None thì render mọi trang.
+    Yields:
+        dict: Chứa 'image' (np.ndarray RGB (H, W, 3) trên bộ nhớ pixmap, chỉ đọc), 'page_index', 'page' (fitz.Page)
+              và 'scale' (số pixel của ảnh trên một point PDF).
+    """
+    if page_indices is None:
+        page_indices = range(len(documents))
+    for page_index in page_indices:
+        try:
+            page = documents[page_index]
+            if render_mode == "adaptive":
+                scale = DETECT_IMAGE_SIZE / max(page.rect.width, page.rect.height)
+            else:
+                scale = dpi / 72
+            with pipeline_metrics.stage("render", page_index):
+                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+                if not pix:
+                    print(f"Error: Could not get pixmap for page {page_index}")
+                    continue
+
+                # Ảnh trang dùng thẳng bộ nhớ của pixmap, không chép sang PIL Image hay mảng mới
+                img = pixmap_to_array(pix)
+
+            if output_folder:
+                image_path = os.path.join(output_folder, f"page_{page_index}.png")
+                if render_mode == "adaptive":
+                    # Ảnh hiển thị vẫn cần đúng độ phân giải của hệ tọa độ bbox
+                    page.get_pixmap(dpi=dpi).save(image_path)
+                else:
+                    pix.save(image_path)
+                print(f"Saved: {image_path}") # Debugging
         except Exception as e:
             print(f"Error processing page {page_index}: {e}")
+            continue
+
+        yield {
+            "image": img,
+            "page_index": page_index,
+            "page": page,
+            "scale": scale
+        }
+        # Trang đã xử lý xong, bỏ tham chiếu (cả pixmap) trước khi render trang tiếp theo
+        del img, pix
 
+
+def pdf_to_images(documents, output_folder):
+    """
+    Chuyển đổi từng trang của file PDF sang ảnh numpy.
+    Args:
+        documents (fitz.Document): Đối tượng PDF.
+    Returns:
+        list: Một list các dictionary, mỗi dict chứa 'image' (np.ndarray RGB)
+              và 'page_number' của trang tương ứng.
+    """
+    doc_images = list(iter_pdf_pages(documents, output_folder, render_mode="full"))
     return doc_images, len(doc_images)
-def detect_layout(model_detect_layout, pil_image_obj):
+
+def detector_input(image):
     """
-    Phát hiện bố cục trên một PIL Image bằng model YOLOv10.
+    Ảnh đưa vào detector. Với mảng numpy, ultralytics (và DocLayoutONNXDetector) coi kênh màu là BGR
+    nên ảnh trang RGB được đảo kênh bằng một view (không sao chép); PIL Image giữ nguyên.
+    """
+    if isinstance(image, np.ndarray):
+        return image[..., ::-1]
+    return image
+
+
+def detect_layout(model_detect_layout, page_image, conf=DETECT_CONF):
+    """
+    Phát hiện bố cục trên ảnh một trang bằng model YOLOv10.
     Args:
         model_detect_layout: Model Doclayout-yolo
-        pil_image_obj (PIL.Image.Image): Đối tượng PIL Image của trang.
+        page_image (np.ndarray | PIL.Image.Image): Ảnh RGB của trang.
+        conf (float): Ngưỡng confidence của box.
     Returns:
         ultralytics.engine.results.Results: Đối tượng kết quả từ YOLOv10 predict.
     """
 
     results = model_detect_layout.predict(
-                  pil_image_obj,   # Image to predict
+                  detector_input(page_image),   # Image to predict
                   imgsz=1024,        # Prediction image size
-                  conf=0.3,          # Confidence threshold
+                  conf=conf,  # Confidence threshold
                   device="cpu"    # Device to use (e.g., 'cuda:0' or 'cpu')
               )
     return results[0]
 
 
+class LayoutBox:
+    """Box bố cục hợp lệ của một trang (bbox theo hệ tọa độ OUTPUT_DPI), dùng qua các bước trích text, OCR và phân loại"""
+    __slots__ = ("bbox", "label", "score", "column")
+
+    def __init__(self, bbox, label, score, column=None):
+        self.bbox = bbox
+        self.label = label
+        self.score = score
+        self.column = column
+
+
+def layout_results_to_arrays(model_detect_layout, layout_results):
+    """
+    Chuyển kết quả detect của một trang về mảng numpy (một lần cho cả trang).
+    Args:
+        model_detect_layout: Model đã dùng để detect (để lấy tên class).
+        layout_results: Results của YOLOv10 hoặc list dict từ DocLayoutONNXDetector.
+    Returns:
+        tuple: (xyxy, labels, scores) - xyxy (N, 4) theo tọa độ ảnh đã detect, labels (N,) tên class, scores (N,).
+    """
+    if isinstance(layout_results, list):
+        if not layout_results:
+            return np.zeros((0, 4), dtype=np.float32), np.array([], dtype=object), np.zeros(0, dtype=np.float32)
+        return (
+            np.array([box['bbox'] for box in layout_results], dtype=np.float32),
+            np.array([box['label'] for box in layout_results], dtype=object),
+            np.array([box['score'] for box in layout_results], dtype=np.float32),
+        )
+    if not (hasattr(layout_results, 'boxes') and layout_results.boxes):
+        return np.zeros((0, 4), dtype=np.float32), np.array([], dtype=object), np.zeros(0, dtype=np.float32)
+    boxes = layout_results.boxes.cpu().numpy()
+    # Đổi class id sang tên: chỉ tra tên của các class có mặt trong trang
+    class_ids, inverse = np.unique(boxes.cls.astype(np.int64), return_inverse=True)
+    label_names = np.array([model_detect_layout.names[int(class_id)] for class_id in class_ids], dtype=object)
+    return boxes.xyxy, label_names[inverse.reshape(-1)], boxes.conf
+
+
+def filter_layout_boxes(xyxy, labels, scores, box_scale=1.0, score_threshold=SCORE_THRESHOLD):
+    """
+    Giữ các box không phải abandon và có score >= score_threshold, đổi bbox sang hệ tọa độ OUTPUT_DPI.
+    Returns:
+        tuple: (bboxes (M, 4) int64, labels, scores)
+    """
+    mask = (labels != 'abandon') & (scores >= score_threshold)
+    return (xyxy[mask] * box_scale).astype(np.int64), labels[mask], scores[mask]
+
+
+def count_layout_boxes(layout_results):
+    """Số box trong kết quả detect (Results của YOLOv10 hoặc list dict của DocLayoutONNXDetector)"""
+    if layout_results is None:
+        return 0
+    if isinstance(layout_results, list):
+        return len(layout_results)
+    boxes = getattr(layout_results, 'boxes', None)
+    return len(boxes) if boxes is not None else 0
+
+
+def detect_layout_batch(model_detect_layout, page_images, batch_size=DETECT_BATCH_SIZE, conf=DETECT_CONF):
+    """
+    Phát hiện bố cục cho nhiều trang, mỗi lần gọi predict xử lý cả một batch ảnh.
+    Args:
+        model_detect_layout: Model Doclayout-yolo
+        page_images (list): Danh sách ảnh RGB (np.ndarray hoặc PIL Image) của các trang.
+        batch_size (int): Số trang tối đa trong một lần gọi predict.
+        conf (float): Ngưỡng confidence của box.
+    Returns:
+        list: Kết quả Results tương ứng với từng ảnh, theo đúng thứ tự đầu vào.
+    """
+    all_results = []
+    for start in range(0, len(page_images), batch_size):
+        batch = [detector_input(image) for image in page_images[start:start + batch_size]]
+        results = model_detect_layout.predict(
+                      batch,             # List ảnh cần predict
+                      imgsz=1024,        # Prediction image size
+                      conf=conf,         # Confidence threshold
+                      device="cpu",      # Device to use (e.g., 'cuda:0' or 'cpu')
+                      batch=len(batch)   # Chạy cả batch trong một forward pass
+                  )
+        all_results.extend(results)
+    return all_results
+
+
+def iter_batches(iterable, batch_size):
+    """Gom các phần tử của iterable thành từng list có tối đa batch_size phần tử"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_clip_for_ocr(page, bbox, dpi=OCR_DPI):
+    """
+    Render lại riêng vùng bbox của trang ở độ phân giải cao để đưa vào EasyOCR.
+    Args:
+        page (fitz.Page): Trang PDF.
+        bbox (list hoặc tuple | None): [x1, y1, x2, y2] trong hệ tọa độ OUTPUT_DPI. None thì render cả trang.
+        dpi (int): Độ phân giải render.
+    Returns:
+        np.ndarray: Ảnh RGB của vùng bbox (H, W, 3).
+    """
+    clip_rect = fitz.Rect(*[coord / OUTPUT_SCALE for coord in bbox]) if bbox is not None else None
+    pix = page.get_pixmap(dpi=dpi, clip=clip_rect)
+    return pixmap_to_array(pix)
+
+
 def recognize_text_from_image(reader, img_array_or_pil_image):
     """
     Thực hiện OCR trên một hình ảnh (NumPy array hoặc PIL Image) bằng EasyOCR.
@@ -72,43 +301,276 @@ def recognize_text_from_image(reader, img_array_or_pil_image):
     """
     results = reader.readtext(img_array_or_pil_image, detail=0)
     return results
-# def recognize_text_from_pymupdf_page(docs, page_index, bbox):
-#     """
-#     Trích xuất văn bản từ một trang PyMuPDF trong một vùng (bounding box) nhất định.
 
-#     Args:
-#         docs (fitz.Document): Đối tượng PDF.
-#         page_index (int): Index của trang trong PDF.
-#         bbox (list hoặc tuple): Bounding box dưới dạng [x1, y1, x2, y2], đây là tọa độ hình ảnh
 
-#     Returns:
-#         str: Văn bản được trích xuất từ vùng đã cho. Trả về chuỗi rỗng nếu không tìm thấy text.
-#     """
-#     try:
+def ocr_page_lines(reader, page_image, scale=1.0):
+    """
+    Chạy EasyOCR (detect + nhận dạng) một lần trên cả ảnh trang.
+    Args:
+        reader: easyocr.Reader
+        page_image (np.ndarray): Ảnh RGB của trang.
+        scale (float): Hệ số đổi tọa độ ảnh sang hệ tọa độ OUTPUT_DPI.
+    Returns:
+        list: Các dòng (bbox [x1, y1, x2, y2] theo OUTPUT_DPI, text).
+    """
+    lines = []
+    for points, text, _ in reader.readtext(page_image, detail=1):
+        if not text.strip():
+            continue
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        lines.append(([min(xs) * scale, min(ys) * scale, max(xs) * scale, max(ys) * scale], text))
+    return lines
 
-#         # chuyển sang tọa độ hình ảnh sang tọa độ PDF
-#         # 300 DPI = 300/72 = 4.167 pixels per point
 
-#         scale = 300/72
-#         # Tạo một fitz.Rect từ bounding box
-#         x1, y1, x2, y2 = [coord / scale for coord in bbox]
+def order_ocr_lines(line_boxes):
+    """
+    Thứ tự đọc của các dòng OCR: gom thành hàng theo tâm dọc, trong hàng đọc từ trái sang phải.
+    Args:
+        line_boxes (np.ndarray): (L, 4) bbox của các dòng.
+    Returns:
+        list: Index các dòng theo thứ tự đọc.
+    """
+    centers = (line_boxes[:, 1] + line_boxes[:, 3]) / 2
+    row_tolerance = 0.5 * np.median(line_boxes[:, 3] - line_boxes[:, 1])
+    rows = []
+    row_center = None
+    for line_idx in np.argsort(centers, kind="stable"):
+        if not rows or centers[line_idx] - row_center > row_tolerance:
+            rows.append([])
+            row_center = centers[line_idx]
+        rows[-1].append(line_idx)
+    return [line_idx for row in rows for line_idx in sorted(row, key=lambda idx: line_boxes[idx, 0])]
+
+
+def assign_ocr_lines_to_boxes(lines, bboxes, min_overlap=OCR_LINE_MIN_OVERLAP):
+    """
+    Gán các dòng OCR của cả trang cho box bố cục chứa phần lớn diện tích của dòng.
+    Args:
+        lines (list): Các dòng (bbox, text) từ ocr_page_lines.
+        bboxes (list): Các box bố cục [x1, y1, x2, y2] cùng hệ tọa độ.
+        min_overlap (float): Tỉ lệ diện tích dòng nằm trong box tối thiểu.
+    Returns:
+        list: Text của từng box (các dòng nối bằng dấu cách), "" nếu box không có dòng nào.
+    """
+    box_lines = [[] for _ in bboxes]
+    if lines and bboxes:
+        line_boxes = np.array([line_bbox for line_bbox, _ in lines], dtype=np.float64)
+        boxes = np.array(bboxes, dtype=np.float64)
+        inter_w = np.clip(np.minimum(line_boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(line_boxes[:, None, 0], boxes[None, :, 0]), 0, None)
+        inter_h = np.clip(np.minimum(line_boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(line_boxes[:, None, 1], boxes[None, :, 1]), 0, None)
+        line_areas = np.maximum((line_boxes[:, 2] - line_boxes[:, 0]) * (line_boxes[:, 3] - line_boxes[:, 1]), 1e-6)
+        overlap = inter_w * inter_h / line_areas[:, None]
+        best_box = overlap.argmax(axis=1)
+        best_overlap = overlap[np.arange(len(lines)), best_box]
+        for line_idx in order_ocr_lines(line_boxes):
+            if best_overlap[line_idx] >= min_overlap:
+                box_lines[best_box[line_idx]].append(lines[line_idx][1])
+    return [' '.join(texts) for texts in box_lines]
+
+
+def ocr_text_boxes(reader, page, page_image, box_scale, text_bboxes, ocr_indices, ocr_mode=None):
+    """
+    OCR các box không có text layer của một trang.
+    Ở chế độ "page", EasyOCR chỉ detect chữ một lần trên cả trang thay vì một lần cho mỗi vùng cắt,
+    các dòng được chia cho mọi box chứa chữ của trang (để dòng của box đã có text layer
+    không bị gán nhầm sang box bên cạnh).
+    Args:
+        page (fitz.Page | None): Trang PDF, None thì dùng page_image.
+        page_image (np.ndarray): Ảnh RGB của trang đã detect.
+        box_scale (float): Hệ số đổi tọa độ ảnh detect sang OUTPUT_DPI.
+        text_bboxes (dict): Box chứa chữ của trang theo index trong thứ tự đọc.
+        ocr_indices (list): Index các box cần OCR.
+        ocr_mode (str | None): "page", "box", "auto" hoặc "none" (không OCR). None thì dùng OCR_MODE.
+    Returns:
+        dict: Text của từng box cần OCR, None nếu OCR box đó bị lỗi.
+    """
+    ocr_mode = ocr_mode or OCR_MODE
+    if ocr_mode == "none":
+        return {i: "" for i in ocr_indices}
+    if ocr_mode == "auto":
+        ocr_mode = "page" if len(ocr_indices) >= FULL_PAGE_OCR_MIN_BOXES else "box"
+
+    if ocr_mode == "page":
+        try:
+            if page is not None:
+                ocr_image = render_clip_for_ocr(page, None)
+                line_scale = OUTPUT_DPI / OCR_DPI
+            else:
+                ocr_image = page_image
+                line_scale = box_scale
+            lines = ocr_page_lines(reader, ocr_image, line_scale)
+            box_indices = list(text_bboxes)
+            box_texts = dict(zip(box_indices, assign_ocr_lines_to_boxes(lines, [text_bboxes[i] for i in box_indices])))
+            print(f"    🔍 OCR cả trang: {len(lines)} dòng cho {len(ocr_indices)} box")
+            return {i: box_texts[i] for i in ocr_indices}
+        except Exception as e:
+            print(f"    ❌ Lỗi khi OCR cả trang, chuyển sang OCR từng box: {str(e)}")
+
+    results = {}
+    for i in ocr_indices:
+        bbox = text_bboxes[i]
+        try:
+            # Chỉ cắt/render ảnh vùng box khi thực sự cần OCR, vùng cắt là view trên ảnh trang
+            if box_scale == 1 or page is None:
+                img_np = crop_page_image(page_image, bbox, box_scale)
+            else:
+                img_np = render_clip_for_ocr(page, bbox)
+            results[i] = ' '.join(recognize_text_from_image(reader, img_np))
+        except Exception as e:
+            print(f"      ❌ Lỗi khi OCR box {i+1}: {str(e)}")
+            results[i] = None
+    return results
 
-#         # Tạo clip rect và trích xuất text
-#         clip_rect = fitz.Rect(x1, y1, x2, y2)
-#         pymupdf_page = docs[page_index]
-#         block = pymupdf_page.get_text('blocks',clip= clip_rect)
 
-#         text = block[0][4]
-#         text = text.replace('.\n','.#')
-#         text = text.replace('\n',' ')
+class PageTextIndex:
+    """
+    Chỉ mục text layer của một trang PDF.
+    Trang chỉ được parse một lần (get_text('rawdict')), sau đó mỗi box chỉ cần
+    một truy vấn hình chữ nhật trên mảng tọa độ ký tự đã sắp xếp theo y0.
+    Kết quả giống get_text('blocks'/'words', clip=...) của PyMuPDF. Khi box cắt ngang
+    bbox của một ký tự, PyMuPDF giữ hay bỏ ký tự đó theo nét chữ (không có trong rawdict)
+    và dựng lại block/line chỉ từ các ký tự còn lại, nên box đó dùng thẳng get_text(clip=...).
+    """
 
-#         return  text
+    def __init__(self, page):
+        self.page = page
+        raw = page.get_text('rawdict', flags=fitz.TEXTFLAGS_BLOCKS)
+        chars, char_boxes, block_ids, line_ids = [], [], [], []
+        line_no = -1
+        for block_no, block in enumerate(raw['blocks']):
+            if block.get('type', 0) != 0:
+                continue
+            for line in block['lines']:
+                line_no += 1
+                for span in line['spans']:
+                    for char in span['chars']:
+                        chars.append(char['c'])
+                        char_boxes.append(char['bbox'])
+                        block_ids.append(block_no)
+                        line_ids.append(line_no)
+
+        codes = np.array([ord(c) if c else 0 for c in chars], dtype=np.int64)
+        self.chars = chars
+        self.num_chars = len(chars)
+        self.char_boxes = np.array(char_boxes, dtype=np.float64).reshape(-1, 4)
+        self.block_ids = np.array(block_ids, dtype=np.int64)
+        self.line_ids = np.array(line_ids, dtype=np.int64)
+        self.is_newline = codes == 10
+        # Ký tự phân tách từ và ký tự viết từ phải sang trái, theo quy tắc của PyMuPDF
+        self.is_delimiter = (codes <= 32) | (codes == 160) | ((codes >= 0x202a) & (codes <= 0x202e))
+        self.is_rtl = (codes >= 0x590) & (codes <= 0x900)
+        # Ký tự có bbox rỗng không làm "mở rộng" line/word khi PyMuPDF hợp các bbox
+        self.has_area = (self.char_boxes[:, 0] < self.char_boxes[:, 2]) & (self.char_boxes[:, 1] < self.char_boxes[:, 3])
+        self._union_boxes = np.where(self.has_area[:, None], self.char_boxes, [np.inf, np.inf, -np.inf, -np.inf])
+
+        # Sắp xếp theo y0 để lọc nhanh theo chiều dọc bằng searchsorted
+        self._order_by_y0 = np.argsort(self.char_boxes[:, 1], kind='stable')
+        self._sorted_y0 = self.char_boxes[self._order_by_y0, 1]
+        heights = self.char_boxes[:, 3] - self.char_boxes[:, 1]
+        self._max_height = float(heights.max()) if self.num_chars else 0.0
+
+    def query_chars(self, rect):
+        """
+        Trả về index (theo thứ tự trong trang) của các ký tự có bbox giao với rect.
+        Args:
+            rect (tuple): (x0, y0, x1, y1) theo tọa độ PDF.
+        """
+        if self.num_chars == 0:
+            return np.empty(0, dtype=np.int64)
+        x0, y0, x1, y1 = rect
+        # Ký tự giao với rect phải có y0 < rect.y1 và y1 > rect.y0 (nên y0 > rect.y0 - max_height)
+        lo = np.searchsorted(self._sorted_y0, y0 - self._max_height, side='left')
+        hi = np.searchsorted(self._sorted_y0, y1, side='left')
+        candidates = self._order_by_y0[lo:hi]
+        boxes = self.char_boxes[candidates]
+        mask = (boxes[:, 0] < x1) & (boxes[:, 2] > x0) & (boxes[:, 1] < y1) & (boxes[:, 3] > y0)
+        return np.sort(candidates[mask])
+
+    def cuts_chars(self, char_indices, rect):
+        """True nếu rect cắt ngang bbox của một trong các ký tự (không chứa trọn ký tự đó)"""
+        x0, y0, x1, y1 = rect
+        boxes = self.char_boxes[char_indices]
+        inside = (boxes[:, 0] >= x0) & (boxes[:, 1] >= y0) & (boxes[:, 2] <= x1) & (boxes[:, 3] <= y1)
+        return not inside.all()
+
+    def extract(self, rect):
+        """
+        Văn bản của block đầu tiên và các từ trong vùng, giống
+        get_text('blocks', clip=rect)[0][4] và get_text('words', clip=rect).
+        Args:
+            rect (tuple): (x0, y0, x1, y1) theo tọa độ PDF.
+        Returns:
+            tuple: (text, words) với text None nếu vùng không có text,
+                   words là list (x0, y0, x1, y1, word).
+        """
+        char_indices = self.query_chars(rect)
+        if not self.cuts_chars(char_indices, rect):
+            return self.first_block_text(char_indices), self.words(char_indices)
+
+        # Box cắt ngang ký tự: dựng text page của vùng clip như get_text(clip=...), một lần cho cả blocks và words
+        textpage = self.page.get_textpage(clip=fitz.Rect(rect), flags=fitz.TEXTFLAGS_BLOCKS)
+        blocks = self.page.get_text('blocks', textpage=textpage)
+        words = [word[:5] for word in self.page.get_text('words', textpage=textpage)]
+        return (blocks[0][4] if blocks else None), words
+
+    def first_block_text(self, char_indices):
+        """
+        Văn bản của block đầu tiên có ký tự trong vùng, giống get_text('blocks')[0][4].
+        Trả về None nếu vùng không có text.
+        """
+        visible = char_indices[self.has_area[char_indices]]
+        if len(visible) == 0:
+            return None
+        block_chars = char_indices[self.block_ids[char_indices] == self.block_ids[visible[0]]]
+
+        text = []
+        last_is_newline = False
+        line_starts = np.flatnonzero(np.diff(self.line_ids[block_chars])) + 1
+        for line_chars in np.split(block_chars, line_starts):
+            text.extend(self.chars[idx] for idx in line_chars)
+            last_is_newline = self.is_newline[line_chars[-1]]
+            # Mỗi dòng có ký tự hiển thị được kết thúc bằng xuống dòng
+            if not last_is_newline and self.has_area[line_chars].any():
+                text.append('\n')
+        return ''.join(text)
+
+    def words(self, char_indices):
+        """Các từ trong vùng, giống get_text('words'): list (x0, y0, x1, y1, word)"""
+        if len(char_indices) == 0:
+            return []
+        keep = ~self.is_delimiter[char_indices]
+        positions = np.flatnonzero(keep)
+        word_chars = char_indices[keep]
+        if len(word_chars) == 0:
+            return []
+
+        # Từ mới bắt đầu sau ký tự phân tách, khi sang dòng mới hoặc khi đổi chiều viết
+        starts = np.ones(len(word_chars), dtype=bool)
+        starts[1:] = (
+            (np.diff(positions) > 1)
+            | (np.diff(self.line_ids[word_chars]) != 0)
+            | (np.diff(self.is_rtl[word_chars].astype(np.int8)) != 0)
+        )
+        start_positions = np.flatnonzero(starts)
+        boxes = self._union_boxes[word_chars]
+        x0 = np.minimum.reduceat(boxes[:, 0], start_positions)
+        y0 = np.minimum.reduceat(boxes[:, 1], start_positions)
+        x1 = np.maximum.reduceat(boxes[:, 2], start_positions)
+        y1 = np.maximum.reduceat(boxes[:, 3], start_positions)
+
+        words = []
+        end_positions = np.append(start_positions[1:], len(word_chars))
+        for i, (start, end) in enumerate(zip(start_positions, end_positions)):
+            # Từ không có ký tự nào có diện tích thì PyMuPDF bỏ qua
+            if x0[i] > x1[i]:
+                continue
+            word = ''.join(self.chars[idx] for idx in word_chars[start:end])
+            words.append((float(x0[i]), float(y0[i]), float(x1[i]), float(y1[i]), word))
+        return words
 
-#     except Exception as e:
-#         print('Không có text trong vùng đã cho')
-#         return "" # Trả về chuỗi rỗng nếu có lỗi
 
-def recognize_text_from_pymupdf_page(docs, page_index, bbox):
+def recognize_text_from_pymupdf_page(docs, page_index, bbox, text_index=None):
     """
     Trích xuất văn bản và bounding box của từng từ từ một trang PyMuPDF
     trong một vùng (bounding box) nhất định.
@@ -118,285 +580,632 @@ def recognize_text_from_pymupdf_page(docs, page_index, bbox):
         page_index (int): Index của trang trong PDF.
         bbox (list hoặc tuple): Bounding box dưới dạng [x1, y1, x2, y2],
                                 là tọa độ hình ảnh (ví dụ: từ ảnh scan).
+        text_index (PageTextIndex | None): Chỉ mục text layer đã dựng sẵn của trang.
+                                           None thì dựng mới cho trang.
 
     Returns:
-        list: Một danh sách các dictionary, mỗi dictionary chứa
-              'text' (nội dung của từ) và 'bbox' (bounding box của từ)
-              trong tọa độ hình ảnh. Trả về danh sách rỗng nếu không tìm thấy text.
+        tuple: (text, bbox_words_of_text) với text là văn bản của block đầu tiên
+               trong vùng và bbox_words_of_text là bbox của từng từ trong tọa độ hình ảnh.
+               Trả về ("", []) nếu không tìm thấy text.
     """
     try:
         # Chuyển đổi tọa độ hình ảnh sang tọa độ PDF
         # Giả định 300 DPI và 72 DPI là mặc định của PDF
-        scale = 300 / 72
-        x1_img, y1_img, x2_img, y2_img = bbox
-
-        # Chuyển đổi tọa độ bbox đầu vào từ ảnh (DPI=300) sang PDF (DPI=72)
-        x1_pdf = x1_img / scale
-        y1_pdf = y1_img / scale
-        x2_pdf = x2_img / scale
-        y2_pdf = y2_img / scale
-
-        # Tạo một fitz.Rect từ bounding box đã chuyển đổi
-        clip_rect_pdf = fitz.Rect(x1_pdf, y1_pdf, x2_pdf, y2_pdf)
-        pymupdf_page = docs[page_index]
-
-        block = pymupdf_page.get_text('blocks',clip= clip_rect_pdf)
-
-        text = block[0][4]
+        scale = OUTPUT_SCALE
+        clip_rect_pdf = tuple(coord / scale for coord in bbox)
+
+        if text_index is None:
+            text_index = PageTextIndex(docs[page_index])
+        text, words = text_index.extract(clip_rect_pdf)
+        if text is None:
+            return "", []
         text = text.replace('.\n','.')
         text = text.replace('\n',' ')
-        # Trích xuất từng từ với bounding box của chúng
-        # 'words' trả về một danh sách các tuple: (x0, y0, x1, y1, word, block_no, line_no, word_no)
-        words_data = pymupdf_page.get_text('words', clip=clip_rect_pdf)
-
-        bbox_words_of_text = []
-        for word_info in words_data:
-            # Lấy thông tin từ tuple
-            x0_word_pdf, y0_word_pdf, x1_word_pdf, y1_word_pdf, word_text = word_info[:5] # Chỉ lấy 5 phần tử đầu
-
-            # Chuyển đổi bounding box của từng từ trở lại tọa độ hình ảnh
-            x0_word_img = int(x0_word_pdf * scale)
-            y0_word_img = int(y0_word_pdf * scale)
-            x1_word_img = int(x1_word_pdf * scale)
-            y1_word_img = int(y1_word_pdf * scale)
 
-            word_bbox_img = [x0_word_img, y0_word_img, x1_word_img, y1_word_img]
-
-            bbox_words_of_text.append(word_bbox_img)
+        # Chuyển đổi bounding box của từng từ trở lại tọa độ hình ảnh
+        bbox_words_of_text = [
+            [int(x0 * scale), int(y0 * scale), int(x1 * scale), int(y1 * scale)]
+            for x0, y0, x1, y1, _ in words
+        ]
 
         return text, bbox_words_of_text
 
     except Exception as e:
         print(f'Lỗi khi trích xuất text hoặc không có text trong vùng đã cho: {e}')
-        return [] # Trả về danh sách rỗng nếu có lỗi
+        return "", []
 
-def sort_boxes_2column_simpler(pil_image, is_first_page, boxes):
+def assign_parent_indices(paragraphs, parent_info, parent_index=-1):
     """
-    Sắp xếp boxes theo thứ tự đọc 2 cột:
-    - Boxes toàn chiều ngang (như tiêu đề): được ưu tiên theo vị trí Y
-    - Cột 1: tất cả boxes từ trên xuống
-    - Cột 2: tất cả boxes từ trên xuống
+    Gán parent_index cho các paragraph theo thứ tự đọc dựa trên cấp của tiêu đề.
+    Args:
+        paragraphs (list): Các paragraph đã có 'index', 'is_title' và 'title_level'.
+        parent_info (dict): Index tiêu đề gần nhất của từng cấp, được cập nhật tại chỗ.
+        parent_index (int): parent_index hiện tại trước paragraph đầu tiên.
+    Returns:
+        int: parent_index sau paragraph cuối cùng.
     """
-    if not boxes:
-        return []
-
-    page_width = pil_image.width
-    if is_first_page:
-        column_divider = page_width / 3
-    else:
-        column_divider = page_width / 2
-
-    # Phân loại boxes
-    full_width_boxes = []
-    column1_boxes = []
-    column2_boxes = []
-
-    for box in boxes:
-        x1, y1, x2, y2 = box['bbox']
-        if x1 < column_divider:
-            column1_boxes.append(box)
-            box['column'] = 1
+    for paragraph in paragraphs:
+        if paragraph['is_title']:
+            level = paragraph['title_level'] or 0
+            parent_info[f'Level {level}'] = paragraph['index']
+            parent_info['parent plain text'] = paragraph['index']
+            if level > 0:
+                parent_index = parent_info[f'Level {level - 1}']
+            else:
+                parent_index = -1
         else:
-            column2_boxes.append(box)
-            box['column'] = 2
-
-    # Sắp xếp từng nhóm theo Y (từ trên xuống)
-    full_width_boxes.sort(key=lambda x: x['bbox'][1])  # Sắp xếp theo y1
-    column1_boxes.sort(key=lambda x: x['bbox'][1])  # Sắp xếp theo y1
-    column2_boxes.sort(key=lambda x: x['bbox'][1])  # Sắp xếp theo y1
+            parent_index = parent_info['parent plain text']
+        paragraph['parent_index'] = parent_index
+    return parent_index
 
-    result = []
 
-    # Thêm tất cả full-width boxes
-    result.extend(full_width_boxes)
-    # Thêm tất cả column 1 boxes
-    result.extend(column1_boxes)
-    # Thêm tất cả column 2 boxes
-    result.extend(column2_boxes)
-
-    return result
-
-def process_pdf_page(docs, model_detect_layout,classifier, reader, pdf_page_data, parent_info, continue_index, parent_index):
+def process_pdf_page(docs, model_detect_layout,classifier, reader, pdf_page_data, parent_info, continue_index, parent_index, layout_results=None, ocr_mode=None, page_kind=None, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD):
     """
-    Xử lý một trang PDF: phát hiện bố cục và nhận dạng văn bản theo thứ tự đọc 2 cột.
+    Xử lý một trang PDF: phát hiện bố cục và nhận dạng văn bản theo thứ tự đọc.
     Args:
         model_detect_layout: model Doclayout_yolo
         pdf_page_data (dict): Dictionary chứa 'image' (PIL Image) và 'page_index'.
         continue_index (int): Index tiếp tục từ lần xử lý trước
+        layout_results: Kết quả detect đã có sẵn (khi detect theo batch). None thì detect ngay tại đây.
+        ocr_mode (str | None): Cách OCR các box không có text layer, xem ocr_text_boxes.
+                               None thì chọn theo page_kind (PAGE_KIND_OCR_MODES), rồi theo OCR_MODE.
+        page_kind (str | None): Loại trang từ triage_document ("digital", "scanned", "mixed").
+                                Trang scan bỏ qua text layer, trang digital không OCR.
+        detect_conf (float): Ngưỡng confidence khi detect (chỉ dùng khi layout_results là None).
+        score_threshold (float): Ngưỡng score để giữ box.
     Returns:
         tuple: (continue_index, processed_paragraphs, page_results)
     """
     page_index = pdf_page_data["page_index"]
-    pil_image = pdf_page_data["image"]
+    page_image = pdf_page_data["image"]
+    page = pdf_page_data.get("page")
+    image_scale = pdf_page_data.get("scale", OUTPUT_SCALE)
+    # Hệ số đổi tọa độ từ ảnh detect sang hệ tọa độ OUTPUT_DPI của bbox trả về
+    box_scale = OUTPUT_SCALE / image_scale
 
     print(f"\n--- Xử lý trang: {page_index} ---")
 
     # 1. Phát hiện bố cục
-    layout_results = detect_layout(model_detect_layout, pil_image)
+    if layout_results is None:
+        with pipeline_metrics.stage("detect", page_index) as stage:
+            layout_results = detect_layout(model_detect_layout, page_image, detect_conf)
+            stage["boxes"] = count_layout_boxes(layout_results)
     processed_paragraphs = []
 
+    xyxy, labels, scores = layout_results_to_arrays(model_detect_layout, layout_results)
+
     # Kiểm tra xem có boxes không
-    if not (hasattr(layout_results, 'boxes') and layout_results.boxes):
+    if not len(xyxy):
         print("    Không tìm thấy đối tượng bố cục nào.")
-        return continue_index, processed_paragraphs
+        return continue_index, parent_index, processed_paragraphs
 
     # 2. Lọc và chuẩn bị boxes
-    valid_boxes = []
-    for box in layout_results.boxes:
-        bbox = box.xyxy[0].tolist()
-        x1, y1, x2, y2 = map(int, bbox)
-        label = model_detect_layout.names[int(box.cls[0])]
-        score = box.conf[0].item()
-
-        # Chỉ xử lý box không phải abandon và có confidence >= threshold
-        if label != 'abandon' and score >= 0.4:
-            valid_boxes.append({
-                'box': box,
-                'bbox': (x1, y1, x2, y2),
-                'label': label,
-                'score': score
-            })
-
-    if not valid_boxes:
-        print("    Không có box hợp lệ nào.")
-        return continue_index, processed_paragraphs
+    bboxes, labels, scores = filter_layout_boxes(xyxy, labels, scores, box_scale, score_threshold)
 
-    # 3. Sắp xếp boxes theo thứ tự đọc 2 cột
-    if page_index == 0:
-        is_first_page = True
+    if not len(bboxes):
+        print("    Không có box hợp lệ nào.")
+        return continue_index, parent_index, processed_paragraphs
+
+    # 3. Sắp xếp boxes theo thứ tự đọc (số cột bất kỳ)
+    with pipeline_metrics.stage("sort", page_index) as stage:
+        order, columns = reading_order(bboxes, page_image.shape[1] * box_scale)
+        sorted_boxes = [
+            LayoutBox(tuple(bbox), label, score, column)
+            for bbox, label, score, column in zip(bboxes[order].tolist(), labels[order].tolist(), scores[order].tolist(), columns.tolist())
+        ]
+        stage["boxes"] = len(sorted_boxes)
+    print(f"    📋 Tìm thấy {len(sorted_boxes)} boxes hợp lệ, đã sắp xếp theo thứ tự đọc")
+
+    # 4. Trích text từ text layer cho các box chứa chữ (None là lỗi khi trích)
+    text_indices = np.flatnonzero(~np.isin(labels[order], ('abandon', 'figure', 'table'))).tolist()
+    text_boxes = [(i, sorted_boxes[i]) for i in text_indices]
+    box_texts = {}
+    box_word_bboxes = {}
+    if page_kind == "scanned":
+        # Trang scan không có text layer, OCR thẳng mọi box
+        box_texts = {i: "" for i, _ in text_boxes}
     else:
-        is_first_page = False
-    s_time = time.time()
-    sorted_boxes = sort_boxes_2column_simpler(pil_image,is_first_page, valid_boxes)
-    e_time = time.time()
-    print(f"    ⏱️  Thời gian sắp xếp boxes: {e_time - s_time:.2f} giây")
-    print(f"    📋 Tìm thấy {len(sorted_boxes)} boxes hợp lệ, đã sắp xếp theo thứ tự đọc 2 cột")
-
-    # 4. Xử lý từng box theo thứ tự đã sắp xếp
-    for i, box_info in enumerate(sorted_boxes):
-        bbox = box_info['bbox']
-        x1, y1, x2, y2 = bbox
-        label = box_info['label']
-        score = box_info['score']
-        if label == 'abandon' or label == 'figure' or label == 'table':
-            continue
-
+        with pipeline_metrics.stage("text_layer", page_index) as stage:
+            stage["boxes"] = len(text_boxes)
+            # Chỉ mục text layer của trang, dựng một lần cho mọi box
+            text_index = PageTextIndex(page if page is not None else docs[page_index])
+            for i, box_info in text_boxes:
+                try:
+                    recognized_text_results, bbox_of_text = recognize_text_from_pymupdf_page(docs, page_index, box_info.bbox, text_index)
+                    box_texts[i] = recognized_text_results.strip()
+                    box_word_bboxes[i] = bbox_of_text
+                except Exception as e:
+                    print(f"      ❌ Lỗi khi trích text box {i+1}: {str(e)}")
+                    box_texts[i] = None
+
+    # 5. OCR các box không có text layer (cả trang một lần hoặc từng vùng)
+    ocr_indices = [i for i, _ in text_boxes if box_texts[i] == ""]
+    if ocr_indices:
+        with pipeline_metrics.stage("ocr", page_index) as stage:
+            stage["boxes"] = len(ocr_indices)
+            box_texts.update(ocr_text_boxes(
+                reader, page, page_image, box_scale,
+                {i: box_info.bbox for i, box_info in text_boxes}, ocr_indices,
+                ocr_mode or PAGE_KIND_OCR_MODES.get(page_kind)
+            ))
+
+    # Các tiêu đề chờ phân loại cấp: (paragraph_info, words, word_boxes)
+    pending_titles = []
+
+    # 6. Tạo paragraph theo thứ tự đã sắp xếp
+    for i, box_info in text_boxes:
+        x1, y1, x2, y2 = box_info.bbox
+        label = box_info.label
+        score = box_info.score
 
         print(f"    📦 Box {i+1}/{len(sorted_boxes)}: {label} (confidence: {score:.2f})")
         print(f"        📍 Vị trí: ({x1}, {y1}) -> ({x2}, {y2})")
 
-        try:
-            # Cắt ảnh theo bbox
-            image_cut = pil_image.crop((x1, y1, x2, y2))
-            img_np = np.array(image_cut)
-
-            # 5. Nhận dạng văn bản
-            start_time = time.time()
-            recognized_text_results, bbox_of_text = recognize_text_from_pymupdf_page(docs, page_index, bbox)
-            recognized_text_results = recognized_text_results.strip()
-            end_time = time.time()
-            print(f"      ⏱️  Thời gian trích text: {end_time - start_time:.2f} giây")
-
-            if recognized_text_results == "":
-                recognized_text_results = recognize_text_from_image(reader, img_np)
-                recognized_text_results = ' '.join(recognized_text_results)
-
-            print(f"      ✅ Nhận dạng được: {recognized_text_results[:100]}..." if len(recognized_text_results) > 100 else f"      ✅ Nhận dạng được: {recognized_text_results}")
-
-            # 6. Tạo thông tin paragraph
-            if recognized_text_results:
-
-                if label == 'title':
-                    sample_words = recognized_text_results.split(' ')
-                    result = classifier.predict_single(
-                        pil_image,
-                        sample_words,
-                        bbox_of_text,
-                        return_probabilities=True
-                    )
-                    parent_info[f'Level {result["predicted_class"]}'] = continue_index
-                    parent_info['parent plain text'] = continue_index
-                    if result["predicted_class"] > 0:
-                        parent_index = parent_info[f'Level {result["predicted_class"] - 1}']
-                        print(result["predicted_class"],'========================', page_index)
-                    else:
-                        parent_index = -1
-                        print(result["predicted_class"],'========================', page_index)
-                else:
-                    parent_index = parent_info['parent plain text']
-                paragraph_info = {
-                    'type': label,
-                    'bbox': [x1, y1, x2, y2],
-                    'full_text': recognized_text_results,
-                    'page_index': page_index,
-                    'parent_index': parent_index,
-                    'index': continue_index,
-                    'is_title': label == 'title',
-                    'reading_order': i + 1,  # Thêm thứ tự đọc
-                    'column': box_info.get('column', 'unknown') # Thông tin cột (1, 2, hoặc 'full')
-                    }
-
-                continue_index += 1
-                processed_paragraphs.append(paragraph_info)
-                print(f"      ✅ Đã lưu paragraph (thứ tự: {i+1}, cột: {paragraph_info['column']}")
-
-            else:
-                print(f"      ⚠ Không nhận dạng được text")
-                continue_index -= 1  # Rollback index nếu không nhận dạng được
+        recognized_text_results = box_texts[i]
+        if recognized_text_results is None:
+            print(f"      ❌ Lỗi khi xử lý box")
+            continue
 
-        except Exception as e:
-            print(f"      ❌ Lỗi khi xử lý box: {str(e)}")
-            continue_index -= 1  # Rollback index nếu có lỗi
+        print(f"      ✅ Nhận dạng được: {recognized_text_results[:100]}..." if len(recognized_text_results) > 100 else f"      ✅ Nhận dạng được: {recognized_text_results}")
+
+        if recognized_text_results:
+            paragraph_info = {
+                'type': label,
+                'bbox': [x1, y1, x2, y2],
+                'full_text': recognized_text_results,
+                'page_index': page_index,
+                'parent_index': parent_index,  # Được gán lại sau khi phân loại cấp tiêu đề
+                'index': continue_index,
+                'is_title': label == 'title',
+                'title_level': None,
+                'reading_order': i + 1,  # Thêm thứ tự đọc
+                'column': box_info.column if box_info.column != FULL_WIDTH_COLUMN else 'full' # Thông tin cột (1, 2, ... hoặc 'full')
+                }
+
+            if label == 'title':
+                # Đưa bbox của từ về hệ tọa độ của ảnh trang đang giữ
+                bbox_of_text_image = [[int(coord / box_scale) for coord in word_bbox] for word_bbox in box_word_bboxes.get(i, [])]
+                pending_titles.append((paragraph_info, recognized_text_results.split(' '), bbox_of_text_image))
+
+            continue_index += 1
+            processed_paragraphs.append(paragraph_info)
+            print(f"      ✅ Đã lưu paragraph (thứ tự: {i+1}, cột: {paragraph_info['column']}")
 
-    print(f"\n  >>> Hoàn thành xử lý trang {page_index}: {len(processed_paragraphs)} paragraphs (theo thứ tự đọc 2 cột)")
+        else:
+            print(f"      ⚠ Không nhận dạng được text")
+
+    # 7. Phân loại cấp của tất cả tiêu đề trong trang bằng một lần gọi model
+    if pending_titles:
+        with pipeline_metrics.stage("classify", page_index) as stage:
+            stage["boxes"] = len(pending_titles)
+            predictions = classifier.predict_batch(
+                [{'image': page_image, 'words': words, 'boxes': boxes} for _, words, boxes in pending_titles],
+                return_probabilities=True
+            )
+        for (paragraph_info, _, _), result in zip(pending_titles, predictions):
+            paragraph_info['title_level'] = result["predicted_class"]
+            print(result["predicted_class"],'========================', page_index)
+
+    # 8. Gán quan hệ cha-con theo thứ tự đọc khi đã có cấp của tiêu đề
+    parent_index = assign_parent_indices(processed_paragraphs, parent_info, parent_index)
+
+    print(f"\n  >>> Hoàn thành xử lý trang {page_index}: {len(processed_paragraphs)} paragraphs (theo thứ tự đọc)")
     return continue_index, parent_index, processed_paragraphs
 
-def process_full_pdf(model_detect_layout, classifier, reader, pdf_path, folder_output_path):
+def page_fingerprint(page, stream_digests=None):
     """
-    Xử lý toàn bộ file PDF: chuyển đổi, phát hiện bố cục và nhận dạng văn bản từng trang.
+    Dấu vân tay nội dung của một trang PDF: content stream, kích thước, góc xoay
+    và dữ liệu các ảnh, font, form XObject mà trang dùng.
+    Hai trang có cùng fingerprint cho cùng kết quả xử lý.
     Args:
-        pdf_path (str): Đường dẫn đến file PDF.
+        page (fitz.Page): Trang PDF.
+        stream_digests (dict | None): sha256 của stream theo xref đã tính ở các trang trước
+                                      của cùng tài liệu, được cập nhật tại chỗ. Font, logo dùng
+                                      chung cho nhiều trang nhờ vậy chỉ được đọc và hash một lần.
     Returns:
-        dict: Dictionary chứa tất cả kết quả xử lý và thống kê
+        bytes: sha256 của nội dung trang.
     """
-    print(f"\n🚀 Bắt đầu xử lý PDF: {pdf_path}")
-    documents = fitz.open(pdf_path)
-    # Chuyển đổi PDF thành ảnh
-    start_time = time.time()
-    all_page_images, total_pages = pdf_to_images(documents, folder_output_path)
-    end_time = time.time()
-    parent_info = {
+    doc = page.parent
+    if stream_digests is None:
+        stream_digests = {}
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)}|{page.rotation}".encode("utf-8"))
+    digest.update(page.read_contents())
+    xrefs = set()
+    xrefs.update(item[0] for item in page.get_images(full=True))
+    xrefs.update(item[0] for item in page.get_fonts(full=True))
+    xrefs.update(item[0] for item in page.get_xobjects())
+    for xref in sorted(xrefs):
+        if xref not in stream_digests:
+            is_stream = xref > 0 and doc.xref_is_stream(xref)
+            stream_digests[xref] = hashlib.sha256(doc.xref_stream_raw(xref)).digest() if is_stream else b""
+        digest.update(stream_digests[xref])
+    return digest.digest()
+
+
+def page_cache_key(page, settings_key="", stream_digests=None):
+    """Khóa cache kết quả của một trang (theo nội dung trang, không phụ thuộc vị trí trang trong tài liệu)"""
+    return hash_content(page_fingerprint(page, stream_digests), settings_key)
+
+
+def triage_page(page):
+    """
+    Phân loại nhanh một trang theo số ký tự của text layer và tỉ lệ diện tích ảnh
+    (không render, không decode ảnh).
+    Args:
+        page (fitz.Page): Trang PDF.
+    Returns:
+        dict: 'page_index', 'kind' ("digital", "scanned", "mixed"), 'text_chars', 'image_coverage'.
+    """
+    text_chars = len("".join(page.get_text("text").split()))
+    page_area = page.rect.get_area()
+    image_area = sum((fitz.Rect(info["bbox"]) & page.rect).get_area() for info in page.get_image_info())
+    image_coverage = min(image_area / page_area, 1.0) if page_area else 0.0
+
+    if text_chars < TRIAGE_MIN_CHARS and image_coverage >= TRIAGE_SCANNED_IMAGE_COVERAGE:
+        kind = "scanned"
+    elif text_chars < TRIAGE_MIN_CHARS or image_coverage >= TRIAGE_MIXED_IMAGE_COVERAGE:
+        # Trang ít chữ không có ảnh (chữ dạng vector, trang trống, ...) vẫn để OCR theo từng box
+        kind = "mixed"
+    else:
+        kind = "digital"
+    return {
+        "page_index": page.number,
+        "kind": kind,
+        "text_chars": text_chars,
+        "image_coverage": round(image_coverage, 4),
+    }
+
+
+def triage_document(documents):
+    """
+    Phân loại mọi trang của tài liệu trước khi xử lý để chọn cách trích text cho từng trang.
+    Args:
+        documents (fitz.Document): Đối tượng PDF.
+    Returns:
+        dict: Số trang theo từng loại và 'pages' là kết quả triage_page của từng trang.
+    """
+    pages = []
+    for page in documents:
+        try:
+            pages.append(triage_page(page))
+        except Exception as e:
+            # Không phân loại được thì xử lý như trang mixed (text layer + OCR khi cần)
+            print(f"⚠ Lỗi khi phân loại trang {page.number + 1}: {e}")
+            pages.append({"page_index": page.number, "kind": "mixed", "text_chars": None, "image_coverage": None})
+    triage = {kind: sum(1 for page_info in pages if page_info["kind"] == kind) for kind in PAGE_KIND_OCR_MODES}
+    triage["pages"] = pages
+    return triage
+
+
+def iter_detected_pages(model_detect_layout, documents, folder_output_path=None, detect_batch_size=DETECT_BATCH_SIZE, page_indices=None, detect_conf=DETECT_CONF):
+    """
+    Render và detect các trang theo từng nhóm detect_batch_size trang với ngưỡng detect_conf.
+    Yields:
+        tuple: (page_data, layout_results) cho từng trang render được.
+    """
+    for page_batch in iter_batches(iter_pdf_pages(documents, folder_output_path, page_indices=page_indices), detect_batch_size):
+        start_time = time.perf_counter()
+        start_peak = pipeline_metrics.peak_rss_mb()
+        try:
+            batch_layout_results = detect_layout_batch(
+                model_detect_layout, [page_data["image"] for page_data in page_batch], detect_batch_size, detect_conf
+            )
+        except Exception as e:
+            print(f"❌ Lỗi khi detect batch trang: {str(e)}")
+            batch_layout_results = [None] * len(page_batch)
+        metrics = pipeline_metrics.current()
+        if metrics is not None:
+            # Cả batch detect trong một lần gọi model, thời gian và phần RSS cao nhất tăng lên chia đều cho các trang
+            page_seconds = (time.perf_counter() - start_time) / len(page_batch)
+            rss_mb = pipeline_metrics.peak_rss_mb()
+            page_rss_growth_mb = (rss_mb - start_peak) / len(page_batch)
+            for page_data, layout_results in zip(page_batch, batch_layout_results):
+                metrics.record("detect", page_seconds, page_data["page_index"], count_layout_boxes(layout_results), rss_mb, page_rss_growth_mb)
+
+        yield from zip(page_batch, batch_layout_results)
+        # Giải phóng ảnh của cả batch trước khi render batch kế tiếp
+        del page_batch, batch_layout_results
+
+
+def new_parent_info():
+    """Trạng thái tiêu đề gần nhất của từng cấp khi bắt đầu một tài liệu"""
+    return {
             "Level 0" : -1,
             "Level 1" : -1,
             "Level 2" : -1,
             "Level 3" : -1,
             "parent plain text" : -1
         }
-    print(f"📄 Tổng số trang: {total_pages}")
-    print(f"⏱️  Thời gian chuyển đổi: {end_time - start_time:.2f} giây")
-    # Khởi tạo kết quả
 
-    all_paragraphs = []
+
+def process_page_standalone(documents, model_detect_layout, classifier, reader, page_data, layout_results=None, page_kind=None, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD, ocr_mode=None):
+    """
+    Xử lý một trang độc lập với các trang khác: index của paragraph tính từ 0 trong trang,
+    parent_index được gán lại khi ghép vào tài liệu (merge_page_paragraphs).
+    Args:
+        page_kind (str | None): Loại trang từ triage_document.
+        detect_conf, score_threshold (float): Ngưỡng detect và ngưỡng giữ box, xem process_pdf_page.
+        ocr_mode (str | None): Cách OCR các box không có text layer, xem process_pdf_page.
+    Returns:
+        tuple: (index_delta, page_paragraphs), index_delta là số index trang đã dùng.
+    """
+    index_delta, _, page_paragraphs = process_pdf_page(
+        documents, model_detect_layout, classifier, reader, page_data, new_parent_info(), 0, -1, layout_results,
+        ocr_mode=ocr_mode, page_kind=page_kind, detect_conf=detect_conf, score_threshold=score_threshold
+    )
+    return index_delta, page_paragraphs
+
+
+def merge_page_paragraphs(page_paragraphs, page_index, index_offset, parent_info, parent_index):
+    """
+    Ghép kết quả của một trang (từ process_page_standalone hoặc cache) vào tài liệu:
+    dời index theo số paragraph của các trang trước và gán parent_index theo thứ tự đọc.
+    Args:
+        index_offset (int): continue_index trước trang này.
+        parent_info (dict): Trạng thái tiêu đề của tài liệu, được cập nhật tại chỗ.
+        parent_index (int): parent_index sau trang trước.
+    Returns:
+        int: parent_index sau trang này.
+    """
+    for paragraph in page_paragraphs:
+        paragraph['page_index'] = page_index
+        paragraph['index'] += index_offset
+    return assign_parent_indices(page_paragraphs, parent_info, parent_index)
+
+
+def iter_process_pdf(model_detect_layout, classifier, reader, documents, folder_output_path=None, detect_batch_size=DETECT_BATCH_SIZE, result_cache=None, cache_settings_key="", page_kinds=None, ocr_mode=None):
+    """
+    Xử lý file PDF theo kiểu pipeline: render -> detect -> trích text/OCR -> phân loại.
+    Các trang được render và detect theo từng nhóm detect_batch_size trang, kết quả
+    của mỗi trang được trả ra ngay khi trang đó xong.
+    Khi có result_cache, trang có nội dung đã từng xử lý được lấy lại từ cache,
+    chỉ các trang mới hoặc đã thay đổi mới được render và chạy model.
+    Args:
+        documents (fitz.Document): Đối tượng PDF đã mở.
+        folder_output_path (str | None): Thư mục lưu ảnh các trang.
+        detect_batch_size (int): Số trang detect chung trong một lần gọi model.
+        result_cache (ResultCache | None): Cache kết quả theo trang.
+        cache_settings_key (str): Phiên bản model/ngưỡng, là một phần của khóa cache.
+        page_kinds (list | None): Loại của từng trang (triage_document). None thì tự phân loại.
+        ocr_mode (str | None): Cách OCR cho mọi trang, None thì theo loại trang và OCR_MODE.
+                               Khác OCR_MODE thì phải có trong cache_settings_key.
+    Yields:
+        tuple: (page_index, page_paragraphs) cho từng trang.
+    """
+    total_pages = len(documents)
+    if page_kinds is None:
+        page_kinds = [page_info["kind"] for page_info in triage_document(documents)["pages"]]
+    page_keys, cached_pages = lookup_cached_pages(documents, result_cache, cache_settings_key)
+    missing_pages = [page_index for page_index in range(total_pages) if page_index not in cached_pages]
+
+    def iter_page_results():
+        for page_data, layout_results in iter_detected_pages(model_detect_layout, documents, folder_output_path, detect_batch_size, missing_pages):
+            page_index = page_data["page_index"]
+            print(f"\n📖 Đang xử lý trang {page_index + 1}/{total_pages}...")
+            try:
+                index_delta, page_paragraphs = process_page_standalone(documents, model_detect_layout, classifier, reader, page_data, layout_results, page_kinds[page_index], ocr_mode=ocr_mode)
+                print(f"✅ Hoàn thành trang {page_index + 1}: {len(page_paragraphs)} paragraphs")
+                yield page_index, True, index_delta, page_paragraphs
+            except Exception as e:
+                print(f"❌ Lỗi khi xử lý trang {page_index + 1}: {str(e)}")
+                yield page_index, False, 0, []
+            del page_data, layout_results
+
+    yield from merge_page_results(documents, iter_page_results(), cached_pages, page_keys, folder_output_path, result_cache)
+
+
+def lookup_cached_pages(documents, result_cache=None, cache_settings_key=""):
+    """
+    Tra cache kết quả của từng trang.
+    Returns:
+        tuple: (page_keys, cached_pages) - khóa cache và kết quả đã cache theo page_index.
+    """
+    page_keys = {}
+    cached_pages = {}
+    if result_cache is None:
+        return page_keys, cached_pages
+    total_pages = len(documents)
+    # Digest của stream dùng chung giữa các trang, chỉ hợp lệ trong tài liệu này
+    stream_digests = {}
+    for page_index in range(total_pages):
+        try:
+            page_keys[page_index] = page_cache_key(documents[page_index], cache_settings_key, stream_digests)
+        except Exception as e:
+            print(f"⚠ Không tạo được khóa cache cho trang {page_index + 1}: {e}")
+            continue
+        cached = result_cache.get("pages", page_keys[page_index])
+        if cached is not None:
+            cached_pages[page_index] = cached
+    print(f"♻️  Lấy lại {len(cached_pages)}/{total_pages} trang từ cache")
+    return page_keys, cached_pages
+
+
+def merge_page_results(documents, page_results, cached_pages, page_keys, folder_output_path=None, result_cache=None):
+    """
+    Ghép kết quả từng trang theo đúng thứ tự trang: gán index, parent_index liên tục
+    qua các trang và lưu kết quả mới vào cache.
+    Args:
+        page_results (iterable): (page_index, ok, index_delta, page_paragraphs) của các trang
+                                 không có trong cache, theo thứ tự page_index tăng dần.
+                                 Trang không render được thì không có mặt.
+        cached_pages (dict): Kết quả đã cache theo page_index.
+        page_keys (dict): Khóa cache theo page_index.
+    Yields:
+        tuple: (page_index, page_paragraphs) cho từng trang.
+    """
+    parent_info = new_parent_info()
     continue_index = 0
     parent_index = -1
-    # Xử lý từng trang
-    for i, page_data in enumerate(all_page_images, 1):
-        print(f"\n📖 Đang xử lý trang {i}/{total_pages}...")
+    total_pages = len(documents)
+    page_results = iter(page_results)
+    next_result = next(page_results, None)
+
+    for page_index in range(total_pages):
+        cached = cached_pages.pop(page_index, None)
+        if cached is not None:
+            index_delta, page_paragraphs = cached["index_delta"], cached["paragraphs"]
+            if folder_output_path:
+                documents[page_index].get_pixmap(dpi=OUTPUT_DPI).save(os.path.join(folder_output_path, f"page_{page_index}.png"))
+            print(f"♻️  Trang {page_index + 1}/{total_pages} lấy từ cache: {len(page_paragraphs)} paragraphs")
+        elif next_result is not None and next_result[0] == page_index:
+            _, ok, index_delta, page_paragraphs = next_result
+            next_result = next(page_results, None)
+            if ok and page_index in page_keys:
+                # Lưu trước khi ghép: index tương đối trong trang, parent_index tính lại khi lấy ra
+                with pipeline_metrics.stage("serialize", page_index):
+                    result_cache.put("pages", page_keys[page_index], {
+                        "index_delta": index_delta,
+                        "paragraphs": page_paragraphs,
+                    })
+        else:
+            # Trang không render được, đã bị bỏ qua trong iter_pdf_pages
+            continue
 
-        try:
-            # Xử lý trang và nhận kết quả
-            start_time = time.time()
-            continue_index, parent_index, page_paragraphs = process_pdf_page(documents, model_detect_layout, classifier, reader, page_data,parent_info, continue_index, parent_index)
-            end_time = time.time()
-            print(f"⏱️  Thời gian detect và trích text trang {i}: {end_time - start_time:.2f} giây")
-            # Thêm paragraphs vào danh sách tổng
-            all_paragraphs.extend(page_paragraphs)
+        parent_index = merge_page_paragraphs(page_paragraphs, page_index, continue_index, parent_info, parent_index)
+        continue_index += index_delta
+        yield page_index, page_paragraphs
 
-            print(f"✅ Hoàn thành trang {i}: {len(page_paragraphs)} paragraphs")
 
-        except Exception as e:
-            print(f"❌ Lỗi khi xử lý trang {i}: {str(e)}")
+def reprocess_pages(model_detect_layout, classifier, reader, documents, page_indices, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD, progress=None, detect_batch_size=DETECT_BATCH_SIZE):
+    """
+    Xử lý lại một số trang của tài liệu (render, detect, trích text, phân loại chỉ các trang này),
+    mỗi trang độc lập như process_page_standalone, có thể với ngưỡng khác lúc xử lý ban đầu.
+    Args:
+        documents (fitz.Document): Đối tượng PDF đã mở.
+        page_indices (list): Các trang cần xử lý lại.
+        detect_conf, score_threshold (float): Ngưỡng detect và ngưỡng giữ box, xem process_pdf_page.
+        progress (JobProgress | None): Đối tượng nhận tiến độ từng trang.
+        detect_batch_size (int): Số trang được detect chung trong một lần gọi model.
+    Returns:
+        dict: page_index -> (index_delta, page_paragraphs), ghép vào tài liệu bằng splice_page_results.
+    """
+    if progress is not None:
+        progress.set_total_pages(len(page_indices))
+    new_pages = {}
+    detected_pages = iter_detected_pages(
+        model_detect_layout, documents, detect_batch_size=detect_batch_size, page_indices=page_indices, detect_conf=detect_conf
+    )
+    for page_data, layout_results in detected_pages:
+        page_index = page_data["page_index"]
+        print(f"\n🔁 Xử lý lại trang {page_index + 1}/{len(documents)}...")
+        start_time = time.time()
+        new_pages[page_index] = process_page_standalone(
+            documents, model_detect_layout, classifier, reader, page_data, layout_results,
+            page_kind=triage_page(page_data["page"])["kind"], detect_conf=detect_conf, score_threshold=score_threshold
+        )
+        if progress is not None:
+            progress.page_done(page_index, len(new_pages[page_index][1]), time.time() - start_time)
+        del page_data, layout_results
+    return new_pages
+
+
+def splice_page_results(load_page, page_offsets, total_paragraphs, new_pages):
+    """
+    Ghép kết quả mới của một số trang (reprocess_pages) vào kết quả đã lưu của tài liệu.
+    Các trang sau được dời index và gán lại parent_index cho tới khi index và trạng thái tiêu đề
+    trở lại giống kết quả cũ, từ đó về sau kết quả không đổi nên không phải đọc hay ghi lại.
+    Args:
+        load_page (callable): page_index -> paragraph đã lưu của trang (ParagraphStore.load_page).
+        page_offsets (list): index của paragraph đầu tiên mỗi trang (meta của ParagraphStore).
+        total_paragraphs (int): Số paragraph của kết quả đã lưu.
+        new_pages (dict): page_index -> (index_delta, page_paragraphs) của các trang xử lý lại.
+    Returns:
+        tuple: (changed_pages, page_offsets, total_paragraphs) - paragraph của các trang cần ghi lại
+               theo page_index, page_offsets và số paragraph mới của tài liệu.
+    """
+    page_offsets = list(page_offsets)
+    if not new_pages:
+        return {}, page_offsets, total_paragraphs
+    first_page = min(new_pages)
+    last_page = max(new_pages)
+
+    # Trạng thái tiêu đề trước trang đầu tiên thay đổi (giống nhau ở kết quả cũ và mới)
+    parent_info = new_parent_info()
+    parent_index = -1
+    for page_index in range(first_page):
+        parent_index = assign_parent_indices(load_page(page_index), parent_info, parent_index)
+    old_parent_info = dict(parent_info)
+    old_parent_index = parent_index
+
+    changed_pages = {}
+    continue_index = page_offsets[first_page]
+    for page_index in range(first_page, len(page_offsets)):
+        if (page_index > last_page and continue_index == page_offsets[page_index]
+                and parent_info == old_parent_info and parent_index == old_parent_index):
+            # Phần còn lại của tài liệu giống kết quả cũ
+            return changed_pages, page_offsets, total_paragraphs
+
+        paragraphs = load_page(page_index)
+        # Trạng thái của kết quả cũ, để biết khi nào phần sau không còn bị ảnh hưởng
+        old_parent_index = assign_parent_indices(paragraphs, old_parent_info, old_parent_index)
+        if page_index in new_pages:
+            paragraphs = new_pages[page_index][1]
+            parent_index = merge_page_paragraphs(paragraphs, page_index, continue_index, parent_info, parent_index)
+            changed_pages[page_index] = paragraphs
+        else:
+            shift = continue_index - page_offsets[page_index]
+            old_parents = [paragraph['parent_index'] for paragraph in paragraphs]
+            for paragraph in paragraphs:
+                paragraph['index'] += shift
+            parent_index = assign_parent_indices(paragraphs, parent_info, parent_index)
+            if shift or old_parents != [paragraph['parent_index'] for paragraph in paragraphs]:
+                changed_pages[page_index] = paragraphs
+        page_offsets[page_index] = continue_index
+        continue_index += len(paragraphs)
+    return changed_pages, page_offsets, continue_index
+
+
+def process_full_pdf(model_detect_layout, classifier, reader, pdf_path, folder_output_path, progress=None, detect_batch_size=DETECT_BATCH_SIZE, result_cache=None, cache_settings_key="", page_processor=None, triage=None, ocr_mode=None):
+    """
+    Xử lý toàn bộ file PDF: chuyển đổi, phát hiện bố cục và nhận dạng văn bản từng trang.
+    Args:
+        pdf_path (str): Đường dẫn đến file PDF.
+        progress (JobProgress | None): Đối tượng nhận tiến độ từng trang (khi chạy dưới dạng job).
+        detect_batch_size (int): Số trang detect chung trong một lần gọi model.
+        result_cache (ResultCache | None): Cache kết quả theo trang.
+        cache_settings_key (str): Phiên bản model/ngưỡng, là một phần của khóa cache.
+        page_processor (PageParallelProcessor | None): Xử lý các trang song song trên nhiều process.
+                                                       None thì xử lý tuần tự bằng các model truyền vào.
+        triage (dict | None): Kết quả triage_document đã có sẵn. None thì phân loại tại đây.
+        ocr_mode (str | None): Cách OCR cho mọi trang, xem iter_process_pdf.
+    Returns:
+        dict: Dictionary chứa tất cả kết quả xử lý và thống kê
+    """
+    print(f"\n🚀 Bắt đầu xử lý PDF: {pdf_path}")
+    documents = fitz.open(pdf_path)
+    print(f"📄 Tổng số trang: {len(documents)}")
+    if progress is not None:
+        progress.set_total_pages(len(documents))
 
+    # Phân loại trang trước để chọn cách trích text cho từng trang
+    if triage is None:
+        triage = triage_document(documents)
+    page_kinds = [page_info["kind"] for page_info in triage["pages"]]
+    print(f"🔎 Triage: {triage['digital']} digital, {triage['scanned']} scanned, {triage['mixed']} mixed")
+
+    start_time = time.time()
+    all_paragraphs = []
+    # Số trang của PDF, kể cả trang render lỗi (không có trong page_iterator) để page_index luôn hợp lệ
+    total_pages = len(documents)
+    # Số đo theo bước/trang; khi gọi từ job, bộ số đo của job (collect() bên ngoài) được dùng lại
+    with pipeline_metrics.collect() as metrics:
+        try:
+            page_start_time = time.time()
+            if page_processor is not None:
+                page_iterator = page_processor.iter_process_pdf(documents, pdf_path, folder_output_path, detect_batch_size, result_cache, cache_settings_key, page_kinds, ocr_mode)
+            else:
+                page_iterator = iter_process_pdf(model_detect_layout, classifier, reader, documents, folder_output_path, detect_batch_size, result_cache, cache_settings_key, page_kinds, ocr_mode)
+            for page_index, page_paragraphs in page_iterator:
+                all_paragraphs.extend(page_paragraphs)
+                if progress is not None:
+                    progress.page_done(page_index, len(page_paragraphs), time.time() - page_start_time, page_paragraphs)
+                page_start_time = time.time()
+        finally:
+            documents.close()
+        metrics_summary = metrics.summary()
+    end_time = time.time()
+    print(f"⏱️  Tổng thời gian xử lý: {end_time - start_time:.2f} giây")
 
     # Tạo thống kê tổng quan
     total_paragraphs = len(all_paragraphs)
@@ -405,4 +1214,6 @@ def process_full_pdf(model_detect_layout, classifier, reader, pdf_path, folder_o
         "total_pages": total_pages,
         "total_paragraphs": total_paragraphs,
         "all_paragraphs": all_paragraphs,
+        "triage": triage,
+        "metrics": metrics_summary,
     }
@@ -0,0 +1,121 @@
+"""
+Kiểm tra độ khớp (parity) và đo độ trễ của các backend LayoutLMv3Classifier.
+
+Fixture là file JSON theo format training: list các dict {image_path, words, boxes}.
+Nếu không có fixture, có thể tạo mẫu từ các block text của một file PDF.
+
+Chạy từ thư mục Back_end:
+    python bench/bench_classifier_backends.py --fixtures fixtures.json --base-dir data/
+    python bench/bench_classifier_backends.py --pdf path/to/file.pdf --backends torch torch_int8 onnx
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from LayoutLMv3Classifier import BACKENDS, LayoutLMv3Classifier
+from Processing_function import OUTPUT_SCALE, iter_pdf_pages
+
+
+def samples_from_pdf(pdf_path, max_samples):
+    """Tạo mẫu từ dòng đầu tiên của mỗi block text (giống một tiêu đề) trong PDF"""
+    samples = []
+    documents = fitz.open(pdf_path)
+    for page_data in iter_pdf_pages(documents, render_mode="full"):
+        words = page_data["page"].get_text("words")
+        lines = {}
+        for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+            lines.setdefault((block_no, line_no), []).append((word, [int(c * OUTPUT_SCALE) for c in (x0, y0, x1, y1)]))
+        seen_blocks = set()
+        for (block_no, _), line_words in lines.items():
+            if block_no in seen_blocks:
+                continue
+            seen_blocks.add(block_no)
+            samples.append({
+                "image": page_data["image"],
+                "words": [word for word, _ in line_words],
+                "boxes": [box for _, box in line_words]
+            })
+            if len(samples) >= max_samples:
+                documents.close()
+                return samples
+    documents.close()
+    return samples
+
+
+def run_backend(classifier, samples, base_dir, batch_size):
+    """Trả về (kết quả predict_batch, ms/mẫu của predict_single, ms/mẫu của predict_batch)"""
+    # Warm-up
+    classifier.predict_batch(samples[:1], base_dir)
+
+    start_time = time.perf_counter()
+    for data in samples:
+        image = data["image"] if "image" in data else os.path.join(base_dir, data["image_path"])
+        classifier.predict_single(image, data["words"], data["boxes"])
+    single_ms = (time.perf_counter() - start_time) * 1000 / len(samples)
+
+    start_time = time.perf_counter()
+    results = classifier.predict_batch(samples, base_dir, return_probabilities=True, batch_size=batch_size)
+    batch_ms = (time.perf_counter() - start_time) * 1000 / len(samples)
+    return results, single_ms, batch_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity và latency của các backend LayoutLMv3Classifier")
+    parser.add_argument("--fixtures", help="File JSON chứa list {image_path, words, boxes}")
+    parser.add_argument("--base-dir", default="", help="Thư mục gốc của image_path trong fixture")
+    parser.add_argument("--pdf", help="Tạo mẫu từ file PDF khi không có fixture")
+    parser.add_argument("--max-samples", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--model-path", default="model/best_Layout_LMv3")
+    parser.add_argument("--output", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        with open(args.fixtures, encoding="utf-8") as f:
+            samples = json.load(f)[:args.max_samples]
+    elif args.pdf:
+        samples = samples_from_pdf(args.pdf, args.max_samples)
+    else:
+        parser.error("Cần --fixtures hoặc --pdf")
+    print(f"Số mẫu: {len(samples)}")
+
+    report = {"num_samples": len(samples), "backends": {}}
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        classifier = LayoutLMv3Classifier(args.model_path, backend=backend)
+        if classifier.backend != backend:
+            print(f"Bỏ qua backend {backend}: không khởi tạo được")
+            continue
+        results, single_ms, batch_ms = run_backend(classifier, samples, args.base_dir, args.batch_size)
+        entry = {"single_ms_per_sample": round(single_ms, 2), "batch_ms_per_sample": round(batch_ms, 2)}
+
+        if reference is None:
+            reference = results
+        else:
+            # So sánh lớp dự đoán và xác suất với PyTorch fp32
+            agree = sum(r["predicted_class"] == ref["predicted_class"] for r, ref in zip(results, reference))
+            max_prob_diff = max(
+                abs(r["probabilities"][label] - ref["probabilities"][label])
+                for r, ref in zip(results, reference) if "probabilities" in r and "probabilities" in ref
+                for label in ref["probabilities"]
+            ) if results else 0.0
+            entry["class_agreement"] = round(agree / len(samples), 4)
+            entry["max_probability_diff"] = round(max_prob_diff, 4)
+
+        report["backends"][backend] = entry
+        print(f"{backend:>10}: {entry}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark tốc độ detect bố cục (pages/sec) theo batch size.
+
+Chạy từ thư mục Back_end:
+    python bench/bench_detect_batch.py path/to/file.pdf --pages 16 --batch-sizes 1 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from doclayout_yolo import YOLOv10
+
+from model_loader import MODEL_PATH
+from Processing_function import detect_layout_batch, iter_pdf_pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched DocLayout-YOLO detection")
+    parser.add_argument("pdf_path", help="File PDF dùng để benchmark")
+    parser.add_argument("--pages", type=int, default=16, help="Số trang dùng để đo")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=2, help="Số lần đo cho mỗi batch size")
+    parser.add_argument("--model", default=MODEL_PATH, help="Mặc định là model mà server dùng")
+    args = parser.parse_args()
+
+    model = YOLOv10(args.model)
+    documents = fitz.open(args.pdf_path)
+    images = []
+    for page_data in iter_pdf_pages(documents):
+        images.append(page_data["image"])
+        if len(images) == args.pages:
+            break
+    documents.close()
+    print(f"Benchmark trên {len(images)} trang")
+
+    # Warm-up để lần đo đầu tiên không tính thời gian khởi tạo model
+    detect_layout_batch(model, images[:1], 1)
+
+    for batch_size in args.batch_sizes:
+        best = None
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            detect_layout_batch(model, images, batch_size)
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"batch_size={batch_size:2d}: {len(images) / best:.2f} pages/sec ({best:.2f} giây)")
+
+
+if __name__ == "__main__":
+    main()
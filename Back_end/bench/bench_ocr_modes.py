@@ -0,0 +1,39 @@
+"""
+Benchmark thời gian xử lý PDF scan với hai cách OCR các box không có text layer:
+"box" (EasyOCR trên từng vùng cắt) và "page" (EasyOCR một lần trên cả trang).
+
+Chạy từ thư mục Back_end:
+    python bench/bench_ocr_modes.py path/to/scanned.pdf --modes box page
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_loader import load_models
+from Processing_function import process_full_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-box vs full-page EasyOCR")
+    parser.add_argument("pdf_path", help="File PDF (scan) dùng để benchmark")
+    parser.add_argument("--modes", nargs="+", default=["box", "page"], choices=["box", "page", "auto"])
+    args = parser.parse_args()
+
+    model, classifier, reader = load_models()
+    results = []
+    for ocr_mode in args.modes:
+        start_time = time.perf_counter()
+        data = process_full_pdf(model, classifier, reader, args.pdf_path, None, ocr_mode=ocr_mode)
+        elapsed = time.perf_counter() - start_time
+        results.append(
+            f"ocr_mode={ocr_mode:4s}: {elapsed / max(data['total_pages'], 1):.2f} giây/trang, "
+            f"{data['total_paragraphs']} paragraphs"
+        )
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Kiểm tra ảnh trang không bị sao chép và đo RSS cao nhất khi render trang và cắt vùng box cần OCR
+trên bộ PDF tổng hợp.
+
+Hai cách được so sánh trên cùng các trang và cùng các box:
+    copy  cách cũ: pix.samples -> PIL Image -> np.array cả trang, crop + np.array cho từng box
+    view  cách hiện tại: iter_pdf_pages (mảng numpy trên bộ nhớ pixmap) và crop_page_image (view)
+
+Mỗi cách chạy trong một process riêng (spawn) và báo phần RSS cao nhất (ru_maxrss) tăng thêm khi
+xử lý cả file, nên bộ nhớ của MuPDF và PIL cũng được tính. Trước khi đo, mọi trang được kiểm tra:
+con trỏ dữ liệu của ảnh trang phải trùng samples_ptr của pixmap và vùng box phải nằm trong bộ nhớ
+đó. Trả exit code 1 khi có ảnh bị sao chép hoặc cách view không tốn ít bộ nhớ hơn cách copy.
+
+Chạy từ thư mục Back_end:
+    python bench/bench_page_memory.py --sizes 1 10 --kinds scanned text
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from Processing_function import OUTPUT_DPI, PixmapBuffer, crop_page_image, iter_pdf_pages
+from pipeline_metrics import peak_rss_mb
+from synthetic_corpus import DEFAULT_SIZES, KINDS, LAYOUTS, build_corpus, load_layout
+
+# Box không đưa vào OCR (giống process_pdf_page)
+NON_TEXT_LABELS = ('abandon', 'figure', 'table')
+
+
+def ocr_bboxes(layout, page_index):
+    """Các box cần OCR của trang: mọi box chứa chữ với file scan, không box nào với file có text layer"""
+    if not layout['scanned']:
+        return []
+    return [box['bbox'] for box in layout['layout'][page_index] if box['label'] not in NON_TEXT_LABELS]
+
+
+def copy_pages(documents, layout):
+    """Cách cũ: mỗi trang chép pixmap sang PIL Image, rồi chép cả trang và từng vùng box sang mảng numpy"""
+    for page_index, page in enumerate(documents):
+        pix = page.get_pixmap(dpi=OUTPUT_DPI)
+        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        del pix
+        page_array = np.array(image)
+        crops = [np.array(image.crop(tuple(bbox))) for bbox in ocr_bboxes(layout, page_index)]
+        yield page_array, crops
+
+
+def view_pages(documents, layout):
+    """Cách hiện tại: ảnh trang là view trên pixmap, vùng box là view trên ảnh trang"""
+    for page_data in iter_pdf_pages(documents, render_mode="full"):
+        image = page_data["image"]
+        crops = [crop_page_image(image, bbox) for bbox in ocr_bboxes(layout, page_data["page_index"])]
+        yield image, crops
+
+
+PAGE_MODES = {"copy": copy_pages, "view": view_pages}
+
+
+def check_zero_copy(pdf_path, layout):
+    """
+    Kiểm tra ảnh trang của iter_pdf_pages nằm đúng trên bộ nhớ samples của pixmap và vùng box là view.
+    Returns:
+        list: Mô tả các trang bị sao chép, rỗng nếu không có.
+    """
+    problems = []
+    with fitz.open(pdf_path) as documents:
+        for page_index, (image, crops) in enumerate(view_pages(documents, layout)):
+            buffer = image.base
+            if not isinstance(buffer, PixmapBuffer):
+                problems.append(f"trang {page_index}: ảnh không nằm trên pixmap ({type(buffer).__name__})")
+                continue
+            if image.__array_interface__["data"][0] != buffer.pixmap.samples_ptr:
+                problems.append(f"trang {page_index}: con trỏ dữ liệu khác samples_ptr của pixmap")
+            if not all(crop.size == 0 or np.shares_memory(crop, image) for crop in crops):
+                problems.append(f"trang {page_index}: vùng box bị sao chép")
+    return problems
+
+
+def measure_mode(mode, pdf_path):
+    """
+    Chạy trong process riêng: xử lý mọi trang của file theo một cách.
+    Returns:
+        dict: 'peak_growth_mb' (RSS cao nhất tăng thêm so với lúc bắt đầu) và 'p50_ms' mỗi trang.
+    """
+    layout = load_layout(pdf_path)
+    latencies = []
+    with fitz.open(pdf_path) as documents:
+        baseline = peak_rss_mb()
+        pages = PAGE_MODES[mode](documents, layout)
+        while True:
+            start_time = time.perf_counter()
+            page = next(pages, None)
+            if page is None:
+                break
+            image, crops = page
+            # Các vùng box được đọc như khi đưa vào OCR
+            for crop in crops:
+                crop.sum(dtype=np.uint64)
+            latencies.append(time.perf_counter() - start_time)
+            del page, image, crops
+        peak_growth = peak_rss_mb() - baseline
+    return {"peak_growth_mb": peak_growth, "p50_ms": float(np.median(latencies)) * 1000 if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero-copy check and peak RSS of copied vs zero-copy page images")
+    parser.add_argument("--corpus-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10], choices=DEFAULT_SIZES)
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    args = parser.parse_args()
+
+    pdf_paths = build_corpus(args.corpus_dir, args.sizes, args.kinds, args.layouts)
+    failures = []
+    # Process mới cho mỗi lần đo vì ru_maxrss chỉ tăng trong suốt đời process
+    context = multiprocessing.get_context("spawn")
+    for pdf_path in pdf_paths:
+        name = os.path.basename(pdf_path)
+        problems = check_zero_copy(pdf_path, load_layout(pdf_path))
+        row = {}
+        for mode in PAGE_MODES:
+            with context.Pool(1) as pool:
+                row[mode] = pool.apply(measure_mode, (mode, pdf_path))
+        print(
+            f"{name:28s} copy: +{row['copy']['peak_growth_mb']:7.1f} MB ({row['copy']['p50_ms']:6.1f} ms/trang)"
+            f"  view: +{row['view']['peak_growth_mb']:7.1f} MB ({row['view']['p50_ms']:6.1f} ms/trang)"
+        )
+        for problem in problems:
+            print(f"  ❌ {name}: {problem}")
+        if row["view"]["peak_growth_mb"] >= row["copy"]["peak_growth_mb"]:
+            problems.append("cách view không tốn ít bộ nhớ hơn cách copy")
+            print(f"  ❌ {name}: RSS cao nhất của cách view không thấp hơn cách copy")
+        if problems:
+            failures.append(name)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark chế độ xử lý song song theo trang (PageParallelProcessor) so với chạy tuần tự,
+đồng thời kiểm tra kết quả của mỗi số worker giống hệt kết quả tuần tự.
+
+Chạy từ thư mục Back_end:
+    python bench/bench_page_parallel.py path/to/file.pdf --workers 2 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_loader import load_models
+from page_parallel import PageParallelProcessor
+from Processing_function import process_full_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page-parallel PDF processing")
+    parser.add_argument("pdf_path", help="File PDF dùng để benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--detector-backend", default="torch")
+    parser.add_argument("--classifier-backend", default="torch")
+    args = parser.parse_args()
+    backends = (args.detector_backend, args.classifier_backend)
+
+    # Tạo pool (fork) trước khi process chính tải model
+    processors = {num_workers: PageParallelProcessor(num_workers, load_models, backends) for num_workers in args.workers}
+    for processor in processors.values():
+        processor.start()
+
+    model, classifier, reader = load_models(*backends)
+    start_time = time.perf_counter()
+    serial = process_full_pdf(model, classifier, reader, args.pdf_path, None)
+    serial_time = time.perf_counter() - start_time
+    serial_json = json.dumps(serial["all_paragraphs"], sort_keys=True)
+
+    results = [f"serial   : {serial['total_pages'] / serial_time:.2f} pages/sec ({serial_time:.2f} giây)"]
+    for num_workers, processor in processors.items():
+        start_time = time.perf_counter()
+        parallel = process_full_pdf(None, None, None, args.pdf_path, None, page_processor=processor)
+        elapsed = time.perf_counter() - start_time
+        identical = json.dumps(parallel["all_paragraphs"], sort_keys=True) == serial_json
+        results.append(
+            f"workers={num_workers}: {parallel['total_pages'] / elapsed:.2f} pages/sec ({elapsed:.2f} giây), "
+            f"speedup x{serial_time / elapsed:.2f}, giống tuần tự: {identical}"
+        )
+        processor.close()
+
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmark toàn bộ pipeline và từng bước riêng lẻ trên bộ PDF tổng hợp (synthetic_corpus.py).
+Mỗi trường hợp (bước, file) báo pages/sec, độ trễ p50/p95 trên một trang và RSS cao nhất, xuất ra JSON.
+Với --baseline, kết quả được so với một lần chạy đã lưu và trả exit code 1 khi có trường hợp chậm đi
+hoặc tốn bộ nhớ hơn quá --tolerance.
+
+Các bước:
+    full        process_full_pdf (độ trễ trang theo tiến độ từng trang)
+    render      render trang sang ảnh (iter_pdf_pages, generator mà pdf_to_images dùng)
+    detect      detect_layout trên ảnh đã render (không tính thời gian render)
+    text_layer  recognize_text_from_pymupdf_page cho các box thật của trang (file có text layer)
+    classify    LayoutLMv3Classifier.predict_single cho các tiêu đề thật của trang (file có text layer)
+    sort        reading_order trên các box thật của trang
+
+Chạy từ thư mục Back_end:
+    python bench/bench_pipeline.py --sizes 1 10 100 --stages sort text_layer render --output bench/baseline.json
+    python bench/bench_pipeline.py --sizes 1 10 100 --stages sort text_layer render --baseline bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+import psutil
+
+import Processing_function
+from Processing_function import (
+    PageTextIndex,
+    detect_layout,
+    iter_pdf_pages,
+    process_full_pdf,
+    recognize_text_from_pymupdf_page,
+)
+from layout_order import reading_order
+from model_loader import ModelRegistry
+from synthetic_corpus import DEFAULT_SIZES, KINDS, LAYOUTS, build_corpus, load_layout
+
+STAGES = ("full", "render", "detect", "text_layer", "classify", "sort")
+# Các bước cần text layer thật của trang
+TEXT_LAYER_STAGES = ("text_layer", "classify")
+# Khoảng lấy mẫu RSS (giây)
+RSS_SAMPLE_INTERVAL = 0.02
+
+
+class PeakRSS:
+    """Lấy mẫu RSS của process trong thread nền, giữ giá trị cao nhất trong khối with"""
+
+    def __init__(self):
+        self.peak_mb = 0.0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        self.peak_mb = max(self.peak_mb, self._process.memory_info().rss / 1024 ** 2)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class PageLatencyProgress:
+    """Nhận tiến độ từng trang của process_full_pdf (cùng giao diện với JobProgress)"""
+
+    def __init__(self):
+        self.latencies = []
+
+    def set_total_pages(self, total_pages):
+        pass
+
+    def page_done(self, page_index, num_paragraphs, elapsed, paragraphs=None):
+        self.latencies.append(elapsed)
+
+
+def bench_full(models, pdf_path, layout):
+    progress = PageLatencyProgress()
+    data = process_full_pdf(*models.models(), pdf_path, None, progress=progress)
+    return progress.latencies, data["total_paragraphs"]
+
+
+def bench_render(models, pdf_path, layout):
+    latencies = []
+    with fitz.open(pdf_path) as documents:
+        pages = iter_pdf_pages(documents)
+        while True:
+            start_time = time.perf_counter()
+            page_data = next(pages, None)
+            if page_data is None:
+                break
+            latencies.append(time.perf_counter() - start_time)
+            del page_data
+    return latencies, len(latencies)
+
+
+def bench_detect(models, pdf_path, layout):
+    model = models.get("detector")
+    latencies = []
+    boxes = 0
+    with fitz.open(pdf_path) as documents:
+        for page_data in iter_pdf_pages(documents):
+            start_time = time.perf_counter()
+            layout_results = detect_layout(model, page_data["image"])
+            latencies.append(time.perf_counter() - start_time)
+            boxes += Processing_function.count_layout_boxes(layout_results)
+    return latencies, boxes
+
+
+def bench_text_layer(models, pdf_path, layout):
+    latencies = []
+    boxes = 0
+    with fitz.open(pdf_path) as documents:
+        for page_index, page_boxes in enumerate(layout["layout"]):
+            start_time = time.perf_counter()
+            # Giống pipeline: chỉ mục text layer dựng một lần cho cả trang
+            text_index = PageTextIndex(documents[page_index])
+            for box in page_boxes:
+                recognize_text_from_pymupdf_page(documents, page_index, box["bbox"], text_index)
+            latencies.append(time.perf_counter() - start_time)
+            boxes += len(page_boxes)
+    return latencies, boxes
+
+
+def bench_classify(models, pdf_path, layout):
+    classifier = models.get("classifier")
+    latencies = []
+    titles = 0
+    with fitz.open(pdf_path) as documents:
+        for page_data, page_boxes in zip(iter_pdf_pages(documents), layout["layout"]):
+            page_index = page_data["page_index"]
+            box_scale = Processing_function.OUTPUT_SCALE / page_data["scale"]
+            samples = []
+            for box in page_boxes:
+                if box["label"] != "title":
+                    continue
+                text, word_bboxes = recognize_text_from_pymupdf_page(documents, page_index, box["bbox"])
+                samples.append((text.split(" "), [[int(coord / box_scale) for coord in word_bbox] for word_bbox in word_bboxes]))
+            start_time = time.perf_counter()
+            for words, word_bboxes in samples:
+                classifier.predict_single(page_data["image"], words, word_bboxes)
+            latencies.append(time.perf_counter() - start_time)
+            titles += len(samples)
+    return latencies, titles
+
+
+def bench_sort(models, pdf_path, layout):
+    with fitz.open(pdf_path) as documents:
+        page_width = documents[0].rect.width * Processing_function.OUTPUT_SCALE
+    latencies = []
+    boxes = 0
+    for page_boxes in layout["layout"]:
+        # Thứ tự detect không theo thứ tự đọc
+        bboxes = np.array([box["bbox"] for box in reversed(page_boxes)], dtype=np.int64).reshape(-1, 4)
+        start_time = time.perf_counter()
+        reading_order(bboxes, page_width)
+        latencies.append(time.perf_counter() - start_time)
+        boxes += len(bboxes)
+    return latencies, boxes
+
+
+BENCHES = {
+    "full": bench_full,
+    "render": bench_render,
+    "detect": bench_detect,
+    "text_layer": bench_text_layer,
+    "classify": bench_classify,
+    "sort": bench_sort,
+}
+
+
+def run_case(stage, models, pdf_path):
+    """
+    Chạy một bước trên một file.
+    Returns:
+        dict: pages, items (box/paragraph đã xử lý), seconds, pages_per_sec, p50_ms, p95_ms, peak_rss_mb.
+    """
+    layout = load_layout(pdf_path)
+    with PeakRSS() as rss:
+        start_time = time.perf_counter()
+        latencies, items = BENCHES[stage](models, pdf_path, layout)
+        seconds = time.perf_counter() - start_time
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "stage": stage,
+        "pdf": os.path.basename(pdf_path),
+        "pages": len(latencies),
+        "items": items,
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(len(latencies) / seconds, 3) if seconds > 0 else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+    }
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """
+    So kết quả với baseline theo từng trường hợp.
+    Chậm đi: pages/sec giảm hoặc p95 tăng quá tolerance (chỉ so khi độ trễ trang lớn hơn min_ms).
+    Tốn bộ nhớ hơn: peak RSS tăng quá tolerance.
+    Returns:
+        list: Mô tả các trường hợp bị chậm đi / tốn bộ nhớ hơn.
+    """
+    regressions = []
+    for case, result in results["cases"].items():
+        base = baseline["cases"].get(case)
+        if base is None:
+            print(f"  {case:40s} (không có trong baseline)")
+            continue
+        speed_ratio = result["pages_per_sec"] / base["pages_per_sec"] if base["pages_per_sec"] else 1.0
+        p95_ratio = result["p95_ms"] / base["p95_ms"] if base["p95_ms"] else 1.0
+        rss_ratio = result["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else 1.0
+        problems = []
+        # Trang xử lý quá nhanh thì sai số đo lớn hơn chênh lệch thật
+        if max(result["p50_ms"], base["p50_ms"]) > min_ms and speed_ratio < 1 - tolerance:
+            problems.append(f"pages/sec x{speed_ratio:.2f}")
+        if max(result["p95_ms"], base["p95_ms"]) > min_ms and p95_ratio > 1 + tolerance:
+            problems.append(f"p95 x{p95_ratio:.2f}")
+        if rss_ratio > 1 + tolerance:
+            problems.append(f"peak RSS x{rss_ratio:.2f}")
+        status = "REGRESSION " + ", ".join(problems) if problems else "ok"
+        print(f"  {case:40s} pages/sec x{speed_ratio:.2f}  p95 x{p95_ratio:.2f}  RSS x{rss_ratio:.2f}  {status}")
+        if problems:
+            regressions.append(f"{case}: {', '.join(problems)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end and per-stage pipeline benchmark on a synthetic corpus")
+    parser.add_argument("--corpus-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--detector-backend", default="torch")
+    parser.add_argument("--classifier-backend", default="torch")
+    parser.add_argument("--output", help="File JSON ghi kết quả (dùng làm baseline cho lần sau)")
+    parser.add_argument("--baseline", help="File JSON kết quả của lần chạy trước để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Mức chênh lệch cho phép so với baseline")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Không so tốc độ khi độ trễ trang của cả hai lần chạy đều nhỏ hơn mức này (ms)")
+    args = parser.parse_args()
+
+    pdf_paths = build_corpus(args.corpus_dir, args.sizes, args.kinds, args.layouts)
+    # Model chỉ được tải (và warm-up) khi bước cần tới
+    models = ModelRegistry(args.detector_backend, args.classifier_backend)
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": fitz.VersionBind,
+            "detector_backend": args.detector_backend,
+            "classifier_backend": args.classifier_backend,
+        },
+        "cases": {},
+    }
+    for stage in args.stages:
+        for pdf_path in pdf_paths:
+            if stage in TEXT_LAYER_STAGES and load_layout(pdf_path)["scanned"]:
+                continue
+            case = f"{stage}/{os.path.splitext(os.path.basename(pdf_path))[0]}"
+            result = run_case(stage, models, pdf_path)
+            results["cases"][case] = result
+            print(
+                f"{case:40s} {result['pages_per_sec']} pages/sec, p50 {result['p50_ms']} ms, "
+                f"p95 {result['p95_ms']} ms, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nSo sánh với {args.baseline} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} trường hợp chậm đi hoặc tốn bộ nhớ hơn:")
+            print("\n".join(f"  {regression}" for regression in regressions))
+            sys.exit(1)
+        print("\n✅ Không có trường hợp nào kém hơn baseline")
+
+
+if __name__ == "__main__":
+    main()
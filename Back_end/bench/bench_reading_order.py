@@ -0,0 +1,143 @@
+"""
+Benchmark tốc độ của reading_order (layout_order.py) trên trang có hàng trăm box
+(các trường hợp kiểm tra độ đúng nằm ở tests/test_layout_order.py).
+
+Trang benchmark dựng từ các phần 1/2/3 cột và box toàn chiều ngang, box được xáo trộn trước khi sắp xếp.
+Nếu có bộ PDF tổng hợp (synthetic_corpus.py), bố cục thật của từng trang cũng được kiểm tra.
+Trả exit code 1 nếu có trang sai thứ tự đọc.
+
+Chạy từ thư mục Back_end:
+    python bench/bench_reading_order.py --corpus-dir bench/corpus --sizes 100 300 1000
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from layout_order import FULL_WIDTH_COLUMN, reading_order
+from synthetic_corpus import load_layout
+
+# Trang A4 theo hệ tọa độ 300 DPI
+PAGE_WIDTH, PAGE_HEIGHT = 2480, 3508
+MARGIN = 200
+COLUMN_GAP = 80
+LINE_GAP = 40
+
+
+def build_page(sections, rng):
+    """
+    Dựng một trang từ các phần xếp từ trên xuống.
+    Args:
+        sections (list): Mỗi phần là số cột và số box mỗi cột (columns, boxes), hoặc "full" cho một box toàn chiều ngang.
+    Returns:
+        tuple: (bboxes theo thứ tự đọc, cột mong đợi)
+    """
+    bboxes = []
+    columns = []
+    multi_column = any(section != "full" and section[0] > 1 for section in sections)
+    y = MARGIN
+    for section in sections:
+        if section == "full":
+            height = rng.randint(80, 400)
+            bboxes.append([MARGIN, y, PAGE_WIDTH - MARGIN, y + height])
+            columns.append(FULL_WIDTH_COLUMN if multi_column else 1)
+            y += height + LINE_GAP
+            continue
+        column_count, boxes_per_column = section
+        usable = PAGE_WIDTH - 2 * MARGIN - (column_count - 1) * COLUMN_GAP
+        column_width = usable / column_count
+        bottom = y
+        x0 = MARGIN
+        for column in range(column_count):
+            column_y = y + rng.randint(0, 30)
+            for row in range(boxes_per_column):
+                height = rng.randint(60, 300)
+                bboxes.append([round(x0), column_y, round(x0 + column_width), column_y + height])
+                if column_count > 1:
+                    columns.append(column + 1)
+                else:
+                    columns.append(FULL_WIDTH_COLUMN if multi_column else 1)
+                column_y += height + LINE_GAP
+            bottom = max(bottom, column_y)
+            x0 += column_width + COLUMN_GAP
+        y = bottom + LINE_GAP
+    return np.array(bboxes, dtype=np.int64).reshape(-1, 4), np.array(columns, dtype=np.int64)
+
+
+def check(bboxes, expected_columns, rng, page_width=PAGE_WIDTH):
+    """Xáo trộn box, sắp xếp lại và so với thứ tự (và cột) mong đợi"""
+    shuffle = np.array(rng.sample(range(len(bboxes)), len(bboxes)), dtype=np.int64)
+    order, columns = reading_order(bboxes[shuffle], page_width)
+    order_ok = shuffle[order].tolist() == list(range(len(bboxes)))
+    columns_ok = expected_columns is None or columns.tolist() == expected_columns.tolist()
+    return order_ok and columns_ok
+
+
+def corpus_cases(corpus_dir):
+    """Bố cục thật của các trang trong bộ PDF tổng hợp (box đã theo thứ tự đọc)"""
+    cases = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*.pdf"))):
+        layout = load_layout(path)
+        for page_index, page_boxes in enumerate(layout["layout"]):
+            bboxes = np.array([box["bbox"] for box in page_boxes], dtype=np.int64).reshape(-1, 4)
+            cases.append((f"{os.path.basename(path)} trang {page_index}", bboxes, None))
+    return cases
+
+
+def benchmark_page(box_count, rng):
+    """Trang trộn 1/2/3 cột có khoảng box_count box (box nhỏ, nhiều phần)"""
+    sections = []
+    total = 0
+    while total < box_count:
+        column_count = rng.choice([1, 2, 3])
+        boxes_per_column = rng.randint(3, 12)
+        sections += ["full", (column_count, boxes_per_column)]
+        total += 1 + column_count * boxes_per_column
+    return build_page(sections, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark for the reading order engine")
+    parser.add_argument("--corpus-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000], help="Số box mỗi trang khi benchmark")
+    parser.add_argument("--repeat", type=int, default=50, help="Số lần đo cho mỗi kích thước")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = corpus_cases(args.corpus_dir) if os.path.isdir(args.corpus_dir) else []
+    failures = [name for name, bboxes, columns in cases if not check(bboxes, columns, rng)]
+    if cases:
+        print(f"Bộ PDF tổng hợp: {len(cases) - len(failures)}/{len(cases)} trang đúng thứ tự đọc")
+    for name in failures:
+        print(f"  ❌ {name}")
+
+    for box_count in args.sizes:
+        bboxes, expected_columns = benchmark_page(box_count, rng)
+        correct = check(bboxes, expected_columns, rng)
+        timings = []
+        for _ in range(args.repeat):
+            shuffled = bboxes[rng.sample(range(len(bboxes)), len(bboxes))]
+            start_time = time.perf_counter()
+            reading_order(shuffled, PAGE_WIDTH)
+            timings.append(time.perf_counter() - start_time)
+        median = float(np.median(timings))
+        print(
+            f"{len(bboxes):5d} box: {median * 1000:.3f} ms/trang, {median * 1e6 / len(bboxes):.2f} µs/box"
+            f"{'' if correct else '  ❌ sai thứ tự'}"
+        )
+        if not correct:
+            failures.append(f"benchmark {box_count} box")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Sinh bộ PDF tổng hợp cho benchmark bằng PyMuPDF: một / hai / ba cột, có text layer / chỉ có ảnh (scan),
+từ 1 tới 500 trang. Nội dung sinh theo seed nên các lần chạy cho cùng một bộ file.
+Mỗi PDF có thêm file .json ghi bố cục thật (bbox theo hệ tọa độ 300 DPI và nhãn của từng box)
+để đo riêng các bước không cần detector (trích text, sắp xếp, phân loại).
+
+Chạy từ thư mục Back_end:
+    python bench/synthetic_corpus.py --sizes 1 10 100 500 --output bench/corpus
+"""
+import argparse
+import json
+import os
+import random
+
+import fitz
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 (point)
+MARGIN = 50
+COLUMN_GAP = 20
+# Hệ tọa độ bbox của pipeline (300 DPI)
+BBOX_SCALE = 300 / 72
+# Ảnh trang của file scan
+SCAN_DPI = 120
+SCAN_JPEG_QUALITY = 60
+
+LAYOUTS = {"1col": 1, "2col": 2, "3col": 3}
+KINDS = ("text", "scanned")
+DEFAULT_SIZES = (1, 10, 100, 500)
+WORDS = (
+    "layout document paragraph section table figure column reading order model page text "
+    "report analysis result method data value system process image region block line word"
+).split()
+
+
+def corpus_name(kind, layout, pages):
+    return f"{kind}_{layout}_{pages}p"
+
+
+def random_sentence(rng, min_words, max_words):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def draw_text_page(page, rng, columns, page_index):
+    """
+    Vẽ một trang: tiêu đề toàn chiều ngang rồi các đoạn văn và tiêu đề mục trong từng cột.
+    Returns:
+        list: Các box {'bbox' (300 DPI), 'label'} theo thứ tự đọc.
+    """
+    boxes = []
+    bottom = PAGE_HEIGHT - MARGIN
+
+    def add_box(x0, y0, x1, text, fontsize, label):
+        """Ghi text vào khung cao vừa đủ, trả về cạnh dưới của khung (None nếu không còn chỗ)"""
+        if bottom - y0 < 2 * fontsize:
+            return None
+        rect = fitz.Rect(x0, y0, x1, bottom)
+        # Shape chỉ ghi lên trang khi commit, số dư trả về cho biết text có vừa khung không
+        shape = page.new_shape()
+        spare = shape.insert_textbox(rect, text, fontsize=fontsize, fontname="helv")
+        if spare < 0:
+            return None
+        shape.commit()
+        rect.y1 = bottom - spare + 2
+        boxes.append({"bbox": [round(coord * BBOX_SCALE) for coord in rect], "label": label})
+        return rect.y1
+
+    y = add_box(MARGIN, MARGIN, PAGE_WIDTH - MARGIN, f"{page_index + 1}. " + random_sentence(rng, 3, 7), 16, "title") + 15
+
+    column_width = (PAGE_WIDTH - 2 * MARGIN - (columns - 1) * COLUMN_GAP) / columns
+    for column in range(columns):
+        x0 = MARGIN + column * (column_width + COLUMN_GAP)
+        column_y = y
+        while column_y is not None:
+            if rng.random() < 0.2:
+                text, fontsize, label = random_sentence(rng, 2, 5), 12, "title"
+            else:
+                text, fontsize, label = " ".join(random_sentence(rng, 6, 14) for _ in range(rng.randint(2, 5))), 10, "plain text"
+            column_y = add_box(x0, column_y, x0 + column_width, text, fontsize, label)
+            if column_y is not None:
+                column_y += 10
+    return boxes
+
+
+def make_pdf(path, pages, columns, scanned, seed=0):
+    """
+    Tạo một PDF tổng hợp và file bố cục .json đi kèm.
+    Args:
+        scanned (bool): True thì mỗi trang chỉ là ảnh JPEG của trang chữ (không có text layer).
+    """
+    rng = random.Random(seed)
+    document = fitz.open()
+    layout = []
+    for page_index in range(pages):
+        if scanned:
+            source = fitz.open()
+            source_page = source.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            boxes = draw_text_page(source_page, rng, columns, page_index)
+            image = source_page.get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY).tobytes("jpeg", jpg_quality=SCAN_JPEG_QUALITY)
+            source.close()
+            page = document.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            page.insert_image(page.rect, stream=image)
+        else:
+            page = document.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            boxes = draw_text_page(page, rng, columns, page_index)
+        layout.append(boxes)
+
+    document.save(path, garbage=3, deflate=True)
+    document.close()
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"pages": pages, "columns": columns, "scanned": scanned, "layout": layout}, f)
+
+
+def build_corpus(output_dir, sizes=DEFAULT_SIZES, kinds=KINDS, layouts=tuple(LAYOUTS)):
+    """
+    Tạo bộ PDF (bỏ qua file đã có).
+    Returns:
+        list: Đường dẫn các PDF theo thứ tự (kind, layout, số trang).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for layout in layouts:
+            for pages in sizes:
+                name = corpus_name(kind, layout, pages)
+                path = os.path.join(output_dir, f"{name}.pdf")
+                if not os.path.exists(path) or not os.path.exists(os.path.splitext(path)[0] + ".json"):
+                    print(f"Đang tạo {path}...")
+                    make_pdf(path, pages, LAYOUTS[layout], kind == "scanned", seed=pages * 31 + LAYOUTS[layout])
+                paths.append(path)
+    return paths
+
+
+def load_layout(pdf_path):
+    """Bố cục thật của một PDF trong bộ (nội dung file .json đi kèm)"""
+    with open(os.path.splitext(pdf_path)[0] + ".json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the synthetic PDF benchmark corpus")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    args = parser.parse_args()
+
+    for path in build_corpus(args.output, args.sizes, args.kinds, args.layouts):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Trạng thái của một file trong registry
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+
+
+class FileRegistry(ABC):
+    """
+    Giao diện lưu thông tin các file đã upload/xử lý, dùng chung cho mọi process của server.
+    Mỗi bản ghi là dict gồm: file_id, filename (tên file PDF đã lưu), original_name, content_hash,
+    status, total_pages, total_paragraphs, upload_time, last_access.
+    Backend khác (Redis, Postgres, ...) phải cài đặt đủ các phương thức dưới đây, thiếu phương thức nào
+    thì lỗi ngay khi tạo đối tượng.
+    """
+
+    @abstractmethod
+    def add_upload(self, file_id, filename, original_name, content_hash):
+        """Ghi nhận file vừa upload (trạng thái processing)"""
+
+    @abstractmethod
+    def mark_processed(self, file_id, total_pages, total_paragraphs):
+        """Đánh dấu file đã xử lý xong"""
+
+    @abstractmethod
+    def mark_reprocessed(self, file_id, total_pages, total_paragraphs):
+        """
+        Cập nhật số liệu của file sau khi xử lý lại một số trang. Kết quả không còn giống kết quả
+        theo nội dung PDF nên file không được dùng lại cho lần upload cùng nội dung (find_by_hash).
+        """
+
+    @abstractmethod
+    def get(self, file_id):
+        """Bản ghi của file, None nếu không có"""
+
+    @abstractmethod
+    def find_by_filename(self, filename):
+        """Bản ghi có tên file PDF đã lưu là filename, None nếu không có"""
+
+    @abstractmethod
+    def find_by_hash(self, content_hash):
+        """File đã xử lý xong có cùng content_hash (mới nhất), None nếu không có"""
+
+    @abstractmethod
+    def touch(self, file_id, min_interval=60):
+        """Cập nhật last_access (bỏ qua nếu vừa cập nhật trong min_interval giây)"""
+
+    @abstractmethod
+    def expired(self, before):
+        """Các bản ghi có last_access trước thời điểm before"""
+
+    @abstractmethod
+    def remove(self, file_id):
+        """Xóa bản ghi của file"""
+
+
+class SQLiteFileRegistry(FileRegistry):
+    def __init__(self, db_path):
+        """
+        FileRegistry lưu trong SQLite (chế độ WAL) để nhiều process/worker đọc ghi cùng lúc.
+        Có index theo content_hash và last_access cho tra cứu file trùng nội dung và dọn file hết hạn.
+
+        Args:
+            db_path (str): Đường dẫn file database
+        """
+        self.db_path = db_path
+        # Mỗi thread (và mỗi process sau khi fork) dùng kết nối riêng
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    original_name TEXT,
+                    content_hash TEXT,
+                    status TEXT NOT NULL,
+                    total_pages INTEGER,
+                    total_paragraphs INTEGER,
+                    upload_time REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename);
+                CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash, status);
+                CREATE INDEX IF NOT EXISTS idx_files_last_access ON files (last_access);
+            """)
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add_upload(self, file_id, filename, original_name, content_hash):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO files (file_id, filename, original_name, content_hash, status, upload_time, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, filename, original_name, content_hash, STATUS_PROCESSING, now, now)
+            )
+
+    def mark_processed(self, file_id, total_pages, total_paragraphs):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE files SET status = ?, total_pages = ?, total_paragraphs = ?, last_access = ? WHERE file_id = ?",
+                (STATUS_DONE, total_pages, total_paragraphs, time.time(), file_id)
+            )
+
+    def mark_reprocessed(self, file_id, total_pages, total_paragraphs):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE files SET content_hash = NULL, total_pages = ?, total_paragraphs = ?, last_access = ? WHERE file_id = ?",
+                (total_pages, total_paragraphs, time.time(), file_id)
+            )
+
+    def get(self, file_id):
+        row = self._connect().execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_by_filename(self, filename):
+        row = self._connect().execute("SELECT * FROM files WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_by_hash(self, content_hash):
+        row = self._connect().execute(
+            "SELECT * FROM files WHERE content_hash = ? AND status = ? ORDER BY upload_time DESC LIMIT 1",
+            (content_hash, STATUS_DONE)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def touch(self, file_id, min_interval=60):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE files SET last_access = ? WHERE file_id = ? AND last_access < ?",
+                (now, file_id, now - min_interval)
+            )
+
+    def expired(self, before):
+        rows = self._connect().execute("SELECT * FROM files WHERE last_access < ?", (before,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, file_id):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+
+def create_file_registry(backend="sqlite", **options):
+    """
+    Tạo FileRegistry theo backend.
+    Args:
+        backend (str): "sqlite" (mặc định, options: db_path)
+    """
+    if backend == "sqlite":
+        return SQLiteFileRegistry(options["db_path"])
+    raise ValueError(f"Không hỗ trợ file registry backend: {backend}")
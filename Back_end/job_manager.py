@@ -0,0 +1,189 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Hàng đợi job đã đầy, không nhận thêm job mới"""
+
+
+class JobManager:
+    def __init__(self, max_workers=1, max_queued_jobs=32, keep_finished_seconds=3600):
+        """
+        Quản lý các job xử lý PDF chạy nền trên một pool worker giới hạn.
+
+        Args:
+            max_workers (int): Số job được chạy đồng thời. Các model được dùng chung
+                               trong cùng process nên mặc định chỉ chạy 1 job một lúc.
+            max_queued_jobs (int): Số job tối đa đang chờ/đang chạy, vượt quá sẽ bị từ chối.
+            keep_finished_seconds (int): Thời gian giữ thông tin job đã xong trong bộ nhớ.
+        """
+        self.max_workers = max_workers
+        self.max_queued_jobs = max_queued_jobs
+        self.keep_finished_seconds = keep_finished_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Báo cho các client đang nghe sự kiện (iter_events) khi job có thay đổi
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, func, *args, job_id=None, metadata=None, **kwargs):
+        """
+        Đưa một job vào hàng đợi và trả về job_id ngay lập tức.
+
+        Args:
+            func (callable): Hàm xử lý, nhận thêm keyword 'progress' (JobProgress).
+            job_id (str | None): ID job, tự sinh nếu không truyền.
+            metadata (dict | None): Thông tin kèm theo job (file_id, tên file, ...).
+
+        Returns:
+            str: ID của job.
+        """
+        self._cleanup_finished()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            if active >= self.max_queued_jobs:
+                raise QueueFullError(f"Đã có {active} job đang chờ xử lý")
+
+            job_id = job_id or str(uuid.uuid4())
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'metadata': metadata or {},
+                'total_pages': None,
+                'processed_pages': 0,
+                'pages': [],
+                'events': [],
+                'result': None,
+                'error': None,
+                'created_time': time.time(),
+                'started_time': None,
+                'finished_time': None,
+            }
+
+        progress = JobProgress(self, job_id)
+        self._executor.submit(self._run, job_id, func, args, kwargs, progress)
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs, progress):
+        self._update(job_id, status='running', started_time=time.time())
+        try:
+            result = func(*args, progress=progress, **kwargs)
+            self._update(job_id, status='done', result=result, finished_time=time.time())
+        except Exception as e:
+            print(f"❌ Job {job_id} lỗi: {e}")
+            self._update(job_id, status='error', error=str(e), finished_time=time.time())
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._changed.notify_all()
+
+    def _cleanup_finished(self):
+        """Xóa các job đã kết thúc quá lâu để bộ nhớ không tăng mãi"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_time'] and now - job['finished_time'] > self.keep_finished_seconds
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Trả về bản sao thông tin job, None nếu không tồn tại"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            job['pages'] = list(job['pages'])
+            job['events'] = list(job['events'])
+            return job
+
+    def status(self, job_id):
+        """Thông tin trạng thái rút gọn của job (không kèm kết quả)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        total = job['total_pages']
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'total_pages': total,
+            'processed_pages': job['processed_pages'],
+            'progress': round(job['processed_pages'] / total, 4) if total else 0.0,
+            'error': job['error'],
+            'created_time': job['created_time'],
+            'started_time': job['started_time'],
+            'finished_time': job['finished_time'],
+            **job['metadata'],
+        }
+
+
+    def iter_events(self, job_id, start=0, heartbeat_seconds=15):
+        """
+        Duyệt các sự kiện của job (mỗi trang xong là một sự kiện), chờ sự kiện mới
+        cho tới khi job kết thúc.
+        Args:
+            start (int): Vị trí sự kiện bắt đầu (để client nối lại từ Last-Event-ID).
+            heartbeat_seconds (int): Sau khoảng này mà không có sự kiện thì trả None để giữ kết nối.
+        Yields:
+            tuple | None: (event_id, event) hoặc None khi chỉ là heartbeat.
+        """
+        position = start
+        while True:
+            with self._changed:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                if position >= len(job['events']) and job['status'] in ('queued', 'running'):
+                    self._changed.wait(timeout=heartbeat_seconds)
+                    job = self._jobs.get(job_id)
+                    if job is None:
+                        return
+                new_events = job['events'][position:]
+                finished = job['status'] not in ('queued', 'running')
+
+            if not new_events and not finished:
+                yield None
+            for event in new_events:
+                yield position, event
+                position += 1
+            if finished and position >= len(job['events']):
+                return
+
+
+class JobProgress:
+    """Đối tượng truyền vào hàm xử lý để báo tiến độ từng trang về JobManager"""
+
+    def __init__(self, manager, job_id):
+        self._manager = manager
+        self.job_id = job_id
+
+    def set_total_pages(self, total_pages):
+        self._manager._update(self.job_id, total_pages=total_pages)
+
+    def page_done(self, page_index, num_paragraphs, elapsed, paragraphs=None):
+        with self._manager._lock:
+            job = self._manager._jobs.get(self.job_id)
+            if job is None:
+                return
+            page_info = {
+                'page_index': page_index,
+                'num_paragraphs': num_paragraphs,
+                'elapsed': round(elapsed, 3),
+            }
+            job['pages'].append(page_info)
+            job['processed_pages'] += 1
+            # Sự kiện cho client đang stream, paragraphs là chính các dict trong kết quả (không sao chép)
+            job['events'].append({
+                **page_info,
+                'processed_pages': job['processed_pages'],
+                'total_pages': job['total_pages'],
+                'paragraphs': paragraphs if paragraphs is not None else [],
+            })
+            self._manager._changed.notify_all()
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Khe trống dọc tối thiểu giữa hai cột, theo tỉ lệ chiều rộng trang
+MIN_GUTTER_RATIO = 0.01
+# Độ sâu tối đa của cây cắt, sâu hơn thì sắp xếp thẳng theo (y1, x1)
+MAX_CUT_DEPTH = 16
+# Cột của box nằm vắt qua nhiều cột (tiêu đề, hình toàn chiều ngang)
+FULL_WIDTH_COLUMN = 0
+
+
+def split_by_gaps(lo, hi, indices, min_gap):
+    """
+    Chia các box theo khe trống trên hình chiếu của chúng lên một trục.
+    Args:
+        lo, hi (np.ndarray): Cạnh đầu/cạnh cuối của mọi box trên trục đó.
+        indices (np.ndarray): Các box cần chia.
+        min_gap (float): Khe trống nhỏ nhất để cắt.
+    Returns:
+        tuple: (parts, gaps) - các nhóm box theo thứ tự trên trục và khe (start, end) giữa hai nhóm liên tiếp.
+    """
+    order = indices[np.argsort(lo[indices], kind="stable")]
+    # Cạnh cuối xa nhất của các box đã gặp: khe trống là chỗ box tiếp theo bắt đầu sau nó
+    reach = np.maximum.accumulate(hi[order])
+    starts = lo[order]
+    cuts = np.flatnonzero(starts[1:] - reach[:-1] >= min_gap) + 1
+    gaps = [(float(reach[cut - 1]), float(starts[cut])) for cut in cuts.tolist()]
+    return np.split(order, cuts), gaps
+
+
+def subtract_intervals(gaps, covered, min_gap):
+    """Phần của các khe trống không bị các đoạn covered che, bỏ phần hẹp hơn min_gap"""
+    remaining = []
+    for start, end in gaps:
+        pieces = [(start, end)]
+        for cover_start, cover_end in covered:
+            pieces = [
+                piece
+                for piece_start, piece_end in pieces
+                for piece in ((piece_start, min(piece_end, cover_start)), (max(piece_start, cover_end), piece_end))
+                if piece[1] > piece[0]
+            ]
+        remaining.extend(piece for piece in pieces if piece[1] - piece[0] >= min_gap)
+    return remaining
+
+
+def group_rows(rows, bboxes, min_gutter):
+    """
+    Gộp các dải ngang liên tiếp còn chung ít nhất một khe cột thành một vùng.
+    Dải chứa box vắt qua mọi khe cột (tiêu đề, hình toàn chiều ngang) tách vùng nhiều cột phía trên
+    và phía dưới nó, nhờ vậy các cột chỉ được đọc trong phạm vi vùng của mình.
+    Returns:
+        list: Các vùng (mảng index box) từ trên xuống.
+    """
+    groups = []
+    gutters = []
+    for row in rows:
+        if len(row) == 1:
+            # Dải một box (trường hợp phổ biến nhất) không có khe cột
+            parts, row_gaps = [row], []
+        else:
+            parts, row_gaps = split_by_gaps(bboxes[:, 0], bboxes[:, 2], row, min_gutter)
+        if groups and gutters:
+            covered = [(float(bboxes[part, 0].min()), float(bboxes[part, 2].max())) for part in parts]
+            shared = subtract_intervals(gutters, covered, min_gutter)
+            if shared:
+                groups[-1].append(row)
+                gutters = shared
+                continue
+        groups.append([row])
+        gutters = row_gaps
+    return [np.concatenate(group) for group in groups]
+
+
+def reading_order(bboxes, page_width):
+    """
+    Thứ tự đọc của các box trên một trang theo XY-cut trên hình chiếu của box.
+    Tại mỗi vùng: nếu hình chiếu lên trục x có khe trống (rộng từ MIN_GUTTER_RATIO chiều rộng trang)
+    thì vùng gồm nhiều cột, đọc từng cột từ trái sang phải; nếu không, vùng bị chặn bởi box vắt qua
+    các cột nên được chia thành các dải ngang theo khe trống trên trục y, các dải liên tiếp còn chung
+    khe cột được gộp lại (group_rows) và đọc từ trên xuống. Các vùng con được xử lý đệ quy, vùng không
+    chia được nữa thì đọc theo (y1, x1). Xử lý được số cột bất kỳ và trang trộn 1/2/3 cột.
+    Mỗi tầng cắt sắp xếp các box của nó một lần nên một trang tốn O(n log n) cho mỗi tầng,
+    số tầng theo độ lồng nhau của bố cục và bị giới hạn bởi MAX_CUT_DEPTH.
+    Args:
+        bboxes (np.ndarray): (N, 4) [x1, y1, x2, y2].
+        page_width (float): Chiều rộng trang trong cùng hệ tọa độ với bbox.
+    Returns:
+        tuple: (order, columns) - chỉ số box theo thứ tự đọc và cột của box theo thứ tự đó
+               (1, 2, ... theo lần chia cột ngoài cùng, FULL_WIDTH_COLUMN cho box vắt qua các cột;
+               trang không chia cột thì mọi box thuộc cột 1).
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    columns = np.full(len(bboxes), FULL_WIDTH_COLUMN, dtype=np.int64)
+    if not len(bboxes):
+        return np.zeros(0, dtype=np.int64), columns
+    min_gutter = max(page_width * MIN_GUTTER_RATIO, 1.0)
+
+    def top_down(indices):
+        return indices[np.lexsort((bboxes[indices, 0], bboxes[indices, 1]))]
+
+    def order_region(indices, depth):
+        if len(indices) <= 1:
+            return indices
+        if depth >= MAX_CUT_DEPTH:
+            return top_down(indices)
+
+        column_parts, _ = split_by_gaps(bboxes[:, 0], bboxes[:, 2], indices, min_gutter)
+        if len(column_parts) > 1:
+            ordered = []
+            for column, part in enumerate(column_parts, start=1):
+                # Cột được tính theo lần chia ngoài cùng
+                unassigned = part[columns[part] == FULL_WIDTH_COLUMN]
+                columns[unassigned] = column
+                ordered.append(order_region(part, depth + 1))
+            return np.concatenate(ordered)
+
+        rows, _ = split_by_gaps(bboxes[:, 1], bboxes[:, 3], indices, 0)
+        if len(rows) == 1:
+            return top_down(indices)
+        return np.concatenate([order_region(region, depth + 1) for region in group_rows(rows, bboxes, min_gutter)])
+
+    order = order_region(np.arange(len(bboxes)), 0)
+    if not columns.any():
+        columns[:] = 1
+    return order, columns[order]
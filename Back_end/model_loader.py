@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+# ********ĐỊNH NGHĨA CÁC ĐƯỜNG DẪN MODEL********
+MODEL_PATH = "model/model_doclayout/doclayout_yolo_docstructbench_imgsz1024.pt"
+CLASSIFIER_MODEL_PATH = "model/best_Layout_LMv3"
+
+
+def load_detector(backend="torch"):
+    """
+    Tải model detect bố cục.
+    Args:
+        backend (str): "torch" (doclayout_yolo) hoặc "onnx" (ONNX Runtime, tự export lần đầu)
+    """
+    if backend == "onnx":
+        from DocLayoutONNXDetector import DocLayoutONNXDetector
+
+        onnx_model_path = os.path.splitext(MODEL_PATH)[0] + '.onnx'
+        if not os.path.exists(onnx_model_path):
+            DocLayoutONNXDetector.export(MODEL_PATH, onnx_model_path)
+        return DocLayoutONNXDetector(onnx_model_path)
+
+    from doclayout_yolo import YOLOv10
+    return YOLOv10(MODEL_PATH)
+
+
+def load_reader():
+    """Tải EasyOCR (tiếng Việt và tiếng Anh)"""
+    import easyocr
+    return easyocr.Reader(['vi', 'en'], gpu=False)
+
+
+def load_classifier(backend="torch"):
+    """Tải classifier phân loại cấp tiêu đề"""
+    from LayoutLMv3Classifier import LayoutLMv3Classifier
+    return LayoutLMv3Classifier(CLASSIFIER_MODEL_PATH, backend=backend)
+
+
+def load_models(detector_backend="torch", classifier_backend="torch"):
+    """
+    Tải đủ bộ model của pipeline. Hàm ở mức module để có thể truyền sang
+    process con (page_parallel) và gọi lại ở đó.
+    Returns:
+        tuple: (model_detect_layout, classifier, reader)
+    """
+    model = load_detector(detector_backend)
+    reader = load_reader()
+    classifier = load_classifier(classifier_backend)
+    return model, classifier, reader
+
+
+def warm_up_detector(model):
+    """Chạy detect một lần trên trang trắng (khởi tạo graph, bộ nhớ đệm của backend)"""
+    from PIL import Image
+    from Processing_function import detect_layout, DETECT_IMAGE_SIZE
+    detect_layout(model, Image.new("RGB", (DETECT_IMAGE_SIZE, DETECT_IMAGE_SIZE), "white"))
+
+
+def warm_up_reader(reader):
+    """Chạy OCR một lần trên ảnh trắng"""
+    import numpy as np
+    reader.readtext(np.full((64, 256, 3), 255, dtype=np.uint8), detail=0)
+
+
+def warm_up_classifier(classifier):
+    """Phân loại một tiêu đề giả"""
+    from PIL import Image
+    classifier.predict_batch([{
+        'image': Image.new("RGB", (224, 224), "white"),
+        'words': ["warm", "up"],
+        'boxes': [[10, 10, 60, 30], [70, 10, 120, 30]],
+    }])
+
+
+class ModelRegistry:
+    # Tên model -> (hàm tải, hàm warm-up)
+    MODELS = {
+        "detector": (load_detector, warm_up_detector),
+        "classifier": (load_classifier, warm_up_classifier),
+        "reader": (load_reader, warm_up_reader),
+    }
+
+    def __init__(self, detector_backend="torch", classifier_backend="torch", warm_up=True):
+        """
+        Quản lý bộ model của server: mỗi model chỉ được tải khi cần lần đầu (hoặc khi gọi load_all),
+        sau khi tải thì chạy warm-up một lần để request đầu tiên không bị chậm.
+        Ghi lại trạng thái và thời gian tải của từng model cho /healthz.
+
+        Chia sẻ model giữa các worker: gọi load_all(warm_up=False) trong process chính rồi mới fork
+        (vd: gunicorn --preload), các worker dùng chung bộ nhớ model theo copy-on-write.
+        Warm-up khi đó chạy trong từng worker ở lần dùng đầu tiên, vì thread pool của torch/OpenMP
+        đã khởi tạo trước khi fork không dùng được trong process con.
+
+        Args:
+            detector_backend (str): Backend của detector ("torch" hoặc "onnx")
+            classifier_backend (str): Backend của classifier ("torch", "torch_int8" hoặc "onnx")
+            warm_up (bool): Có chạy warm-up sau khi tải hay không
+        """
+        self.backends = {"detector": detector_backend, "classifier": classifier_backend}
+        self.warm_up = warm_up
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self.MODELS}
+        self._models = {}
+        # pid của process đã warm-up từng model
+        self._warm_pids = {}
+        self._state = {
+            name: {"status": "not_loaded", "load_seconds": None, "warmup_seconds": None, "error": None}
+            for name in self.MODELS
+        }
+
+    def _set_state(self, name, **state):
+        with self._lock:
+            self._state[name].update(state)
+
+    def get(self, name, warm_up=None):
+        """Lấy một model ("detector", "classifier" hoặc "reader"), tải và warm-up nếu chưa có"""
+        warm_up = self.warm_up if warm_up is None else warm_up
+        with self._locks[name]:
+            if name not in self._models:
+                load, _ = self.MODELS[name]
+                self._set_state(name, status="loading", error=None)
+                print(f"⏳ Đang tải model {name}...")
+                start_time = time.perf_counter()
+                try:
+                    args = (self.backends[name],) if name in self.backends else ()
+                    self._models[name] = load(*args)
+                except Exception as e:
+                    self._set_state(name, status="error", error=str(e))
+                    raise
+                self._set_state(name, status="loaded", load_seconds=round(time.perf_counter() - start_time, 3))
+                print(f"✅ Đã tải model {name} ({time.perf_counter() - start_time:.2f} giây)")
+
+            if warm_up and self._warm_pids.get(name) != os.getpid():
+                _, warm = self.MODELS[name]
+                self._set_state(name, status="warming_up")
+                start_time = time.perf_counter()
+                try:
+                    warm(self._models[name])
+                    self._set_state(name, warmup_seconds=round(time.perf_counter() - start_time, 3))
+                except Exception as e:
+                    # Warm-up lỗi không làm model dùng không được
+                    print(f"⚠ Warm-up model {name} lỗi: {e}")
+                self._warm_pids[name] = os.getpid()
+                self._set_state(name, status="ready")
+            return self._models[name]
+
+    def models(self):
+        """
+        Bộ model cho pipeline, tải những model chưa có.
+        Returns:
+            tuple: (model_detect_layout, classifier, reader)
+        """
+        return self.get("detector"), self.get("classifier"), self.get("reader")
+
+    def load_all(self, warm_up=None):
+        """Tải (và warm-up) mọi model ngay, không đợi request đầu tiên"""
+        for name in self.MODELS:
+            self.get(name, warm_up)
+
+    def load_in_background(self):
+        """Tải mọi model trong thread nền, server nhận request ngay (/healthz báo chưa sẵn sàng)"""
+        def run():
+            try:
+                self.load_all()
+            except Exception as e:
+                print(f"❌ Lỗi khi tải model: {e}")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """
+        Trạng thái của từng model cho /healthz.
+        Returns:
+            dict: 'ready' (mọi model đã tải), 'pid' và 'models' (status, load_seconds, warmup_seconds, error).
+        """
+        with self._lock:
+            models = {name: dict(state) for name, state in self._state.items()}
+        # Model tải trước khi fork đã sẵn sàng nhưng chưa warm-up trong process này
+        ready = all(state["status"] in ("loaded", "ready") for state in models.values())
+        return {"ready": ready, "pid": os.getpid(), "models": models}
@@ -0,0 +1,208 @@
+import math
+import os
+import threading
+
+import fitz
+from PIL import Image
+
+# Hệ tọa độ của bbox trả về (ảnh trang 300 DPI)
+BBOX_DPI = 300
+# Độ rộng ảnh mặc định để xem trên trình duyệt (~150 DPI với trang A4)
+DEFAULT_VIEW_WIDTH = 1240
+MIN_IMAGE_WIDTH = 64
+# Độ rộng được làm tròn theo bước này để giới hạn số phiên bản ảnh của mỗi trang trong cache
+WIDTH_STEP = 64
+# Các mức ảnh dựng sẵn: thumbnail cho danh sách trang, view để xem
+TIERS = {
+    "thumb": 256,
+    "view": DEFAULT_VIEW_WIDTH,
+}
+# Trang có cạnh dài (ở 300 DPI) vượt ngưỡng này thì có thêm tile deep-zoom (DZI)
+LARGE_PAGE_PIXELS = 6000
+TILE_SIZE = 512
+IMAGE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def page_bbox_size(page):
+    """Kích thước (width, height) của trang trong hệ tọa độ bbox (BBOX_DPI)"""
+    return round(page.rect.width * BBOX_DPI / 72), round(page.rect.height * BBOX_DPI / 72)
+
+
+class PageImageCache:
+    def __init__(self, cache_dir, max_bytes=1024 ** 3, quality=80):
+        """
+        Render ảnh trang PDF khi có yêu cầu và lưu vào cache trên đĩa.
+        Mỗi (file, trang, độ rộng, định dạng) chỉ render một lần, khi tổng dung lượng
+        vượt max_bytes thì các ảnh ít được xem gần đây nhất bị xóa.
+
+        Args:
+            cache_dir (str): Thư mục chứa ảnh (mỗi file một thư mục con theo file_id)
+            max_bytes (int): Dung lượng tối đa của cache
+            quality (int): Chất lượng nén WebP/JPEG
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._lock = threading.Lock()
+        # Khóa theo từng ảnh để nhiều request cùng lúc không render trùng
+        self._render_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._iter_entries())
+
+    def _iter_entries(self):
+        """Duyệt (path, size, thời gian xem gần nhất) của mọi ảnh trong cache"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def normalize_width(page, width=None, scale=None, tier=None):
+        """
+        Độ rộng ảnh cần render.
+        Args:
+            width (int | None): Độ rộng mong muốn (pixel).
+            scale (float | None): Tỉ lệ so với ảnh trong hệ tọa độ bbox (1.0 = 300 DPI).
+            tier (str | None): Mức ảnh trong TIERS, dùng khi không có width và scale.
+        Returns:
+            int: Độ rộng đã làm tròn theo WIDTH_STEP, không vượt quá ảnh 300 DPI.
+        """
+        full_width = page_bbox_size(page)[0]
+        if width is None:
+            width = full_width * scale if scale is not None else TIERS.get(tier, DEFAULT_VIEW_WIDTH)
+        width = int(round(width / WIDTH_STEP) * WIDTH_STEP)
+        return max(MIN_IMAGE_WIDTH, min(width, full_width))
+
+    def get(self, file_id, pdf_path, page_index, width=None, scale=None, image_format="webp", tier=None):
+        """
+        Lấy ảnh của một trang, render nếu chưa có trong cache.
+        Returns:
+            tuple: (đường dẫn ảnh, mimetype)
+        """
+        pil_format, mimetype = IMAGE_FORMATS[image_format]
+        with fitz.open(pdf_path) as documents:
+            if not 0 <= page_index < len(documents):
+                raise IndexError(f"Trang {page_index} không tồn tại")
+            page = documents[page_index]
+            width = self.normalize_width(page, width, scale, tier)
+            path = os.path.join(self.cache_dir, file_id, f"page_{page_index}_w{width}.{image_format}")
+            self._get_or_render(page, path, pil_format, width / page.rect.width)
+        return path, mimetype
+
+    @staticmethod
+    def dzi_levels(page):
+        """Số mức deep-zoom của trang (mức cao nhất là ảnh 300 DPI, mỗi mức giảm một nửa)"""
+        return math.ceil(math.log2(max(page_bbox_size(page)))) + 1
+
+    def dzi_descriptor(self, pdf_path, page_index, image_format="webp"):
+        """Mô tả Deep Zoom Image (XML) của một trang, dùng được với OpenSeadragon"""
+        with fitz.open(pdf_path) as documents:
+            width, height = page_bbox_size(documents[page_index])
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{TILE_SIZE}" Overlap="0" Format="{image_format}">'
+            f'<Size Width="{width}" Height="{height}"/></Image>'
+        )
+
+    def get_tile(self, file_id, pdf_path, page_index, level, col, row, image_format="webp"):
+        """
+        Lấy một tile deep-zoom của trang, chỉ render đúng vùng của tile đó.
+        Returns:
+            tuple: (đường dẫn ảnh, mimetype)
+        """
+        pil_format, mimetype = IMAGE_FORMATS[image_format]
+        with fitz.open(pdf_path) as documents:
+            if not 0 <= page_index < len(documents):
+                raise IndexError(f"Trang {page_index} không tồn tại")
+            page = documents[page_index]
+            max_level = self.dzi_levels(page) - 1
+            if not 0 <= level <= max_level:
+                raise IndexError(f"Mức {level} không tồn tại")
+            level_scale = 2 ** (level - max_level)
+            full_width, full_height = page_bbox_size(page)
+            level_width, level_height = math.ceil(full_width * level_scale), math.ceil(full_height * level_scale)
+            x0, y0 = col * TILE_SIZE, row * TILE_SIZE
+            if x0 >= level_width or y0 >= level_height or col < 0 or row < 0:
+                raise IndexError(f"Tile {col}_{row} không tồn tại")
+
+            zoom = level_width / page.rect.width
+            clip = fitz.Rect(x0, y0, min(x0 + TILE_SIZE, level_width), min(y0 + TILE_SIZE, level_height)) / zoom
+            clip = clip + (page.rect.x0, page.rect.y0, page.rect.x0, page.rect.y0)
+            path = os.path.join(self.cache_dir, file_id, f"page_{page_index}_files", str(level), f"{col}_{row}.{image_format}")
+            self._get_or_render(page, path, pil_format, zoom, clip)
+        return path, mimetype
+
+    def _get_or_render(self, page, path, pil_format, zoom, clip=None):
+        with self._lock:
+            render_lock = self._render_locks.setdefault(path, threading.Lock())
+        with render_lock:
+            if os.path.exists(path):
+                # mtime dùng làm thời điểm xem gần nhất cho LRU
+                os.utime(path, None)
+            else:
+                self._render(page, zoom, path, pil_format, clip)
+        with self._lock:
+            self._render_locks.pop(path, None)
+
+    def _render(self, page, zoom, path, pil_format, clip=None):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        del pix
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, pil_format, quality=self.quality)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Rendered: {path}")
+
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict(keep_path=path)
+
+    def _evict(self, keep_path=None):
+        """Xóa các ảnh xem lâu nhất cho tới khi dung lượng còn dưới 90% max_bytes (trừ keep_path)"""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[2])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._total_bytes <= target:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+        print(f"Page image cache sau khi dọn: {self._total_bytes / 1024 ** 2:.1f} MB")
+
+    def remove_file(self, file_id):
+        """Xóa mọi ảnh của một file"""
+        file_folder = os.path.join(self.cache_dir, file_id)
+        if not os.path.isdir(file_folder):
+            return
+        with self._lock:
+            for root, dirs, files in os.walk(file_folder, topdown=False):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        size = os.path.getsize(path)
+                        os.remove(path)
+                        self._total_bytes -= size
+                    except FileNotFoundError:
+                        pass
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
@@ -0,0 +1,296 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+
+import pipeline_metrics
+from model_loader import warm_up_detector, warm_up_classifier, warm_up_reader
+from Processing_function import (
+    DETECT_BATCH_SIZE,
+    DETECT_CONF,
+    SCORE_THRESHOLD,
+    iter_detected_pages,
+    process_page_standalone,
+    lookup_cached_pages,
+    merge_page_results,
+    triage_document,
+    triage_page,
+)
+
+# Bộ model của process worker, được tải một lần trong _init_worker
+_worker_models = None
+# Trạng thái tải model của process worker, trả về qua _ping cho /healthz
+_worker_state = None
+WORKER_MODEL_NAMES = ("detector", "classifier", "reader")
+
+
+def _init_worker(model_factory, factory_args, num_threads):
+    """Khởi tạo process worker: giới hạn số thread của torch và tải model một lần"""
+    global _worker_models, _worker_state
+    if num_threads:
+        try:
+            import torch
+            torch.set_num_threads(num_threads)
+        except ImportError:
+            pass
+    start_time = time.perf_counter()
+    _worker_models = model_factory(*factory_args)
+    load_seconds = round(time.perf_counter() - start_time, 3)
+    models = {}
+    # Warm-up để trang đầu tiên worker nhận không bị chậm
+    for name, warm_up, worker_model in zip(WORKER_MODEL_NAMES, (warm_up_detector, warm_up_classifier, warm_up_reader), _worker_models):
+        start_time = time.perf_counter()
+        try:
+            warm_up(worker_model)
+            models[name] = {"status": "ready", "warmup_seconds": round(time.perf_counter() - start_time, 3), "error": None}
+        except Exception as e:
+            print(f"⚠ Worker {os.getpid()} warm-up lỗi: {e}")
+            models[name] = {"status": "loaded", "warmup_seconds": None, "error": str(e)}
+    _worker_state = {"pid": os.getpid(), "load_seconds": load_seconds, "models": models}
+    print(f"✅ Worker {os.getpid()} đã tải xong model")
+
+
+def _ping():
+    """Trạng thái của worker (chỉ chạy được sau khi _init_worker đã tải xong model)"""
+    return _worker_state
+
+
+def _process_pages(pdf_path, page_indices, page_kinds, folder_output_path, detect_batch_size, ocr_mode=None, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD):
+    """
+    Chạy trong process worker: tự mở PDF theo đường dẫn và xử lý một nhóm trang.
+    Args:
+        page_kinds (dict): Loại của từng trang trong nhóm (triage_document).
+        detect_conf, score_threshold (float): Ngưỡng detect và ngưỡng giữ box, xem process_pdf_page.
+    Returns:
+        tuple: (results, metrics) - results là list (page_index, ok, index_delta, page_paragraphs)
+               theo thứ tự trang, metrics là số đo theo bước của nhóm trang (PipelineMetrics.summary).
+    """
+    model_detect_layout, classifier, reader = _worker_models
+    documents = fitz.open(pdf_path)
+    results = []
+    try:
+        with pipeline_metrics.collect() as metrics:
+            for page_data, layout_results in iter_detected_pages(model_detect_layout, documents, folder_output_path, detect_batch_size, page_indices, detect_conf):
+                page_index = page_data["page_index"]
+                try:
+                    index_delta, page_paragraphs = process_page_standalone(documents, model_detect_layout, classifier, reader, page_data, layout_results, page_kinds[page_index], detect_conf=detect_conf, score_threshold=score_threshold, ocr_mode=ocr_mode)
+                    print(f"✅ [pid {os.getpid()}] Hoàn thành trang {page_index + 1}: {len(page_paragraphs)} paragraphs")
+                    results.append((page_index, True, index_delta, page_paragraphs))
+                except Exception as e:
+                    print(f"❌ [pid {os.getpid()}] Lỗi khi xử lý trang {page_index + 1}: {str(e)}")
+                    results.append((page_index, False, 0, []))
+                del page_data, layout_results
+    finally:
+        documents.close()
+    return results, metrics.summary()
+
+
+class PageParallelProcessor:
+    def __init__(self, num_workers, model_factory, factory_args=(), start_method="fork", threads_per_worker=None):
+        """
+        Xử lý các trang của một PDF song song trên nhiều process.
+        Mỗi worker tải model một lần (model_factory) và tự mở PDF theo đường dẫn,
+        chỉ kết quả paragraph được gửi về. Kết quả được ghép lại theo thứ tự trang
+        nên index, parent_index và reading_order giống hệt khi chạy tuần tự.
+
+        Args:
+            num_workers (int): Số process worker
+            model_factory (callable): Hàm ở mức module trả về (model_detect_layout, classifier, reader)
+            factory_args (tuple): Tham số truyền cho model_factory
+            start_method (str): Cách tạo process. Với "fork", gọi start() trước khi process chính
+                                tải model/khởi tạo thread của torch. "spawn" chạy lại module
+                                __main__ trong worker nên module đó phải có guard __main__.
+            threads_per_worker (int | None): Số thread torch mỗi worker, mặc định chia đều số core
+        """
+        self.num_workers = num_workers
+        self.model_factory = model_factory
+        self.factory_args = tuple(factory_args)
+        self.start_method = start_method
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self._executor = None
+        # Trạng thái của các worker theo pid (từ các lần ping) và các ping chưa có kết quả
+        self._worker_states = {}
+        self._pending_pings = []
+        self._status_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Tạo pool khi cần lần đầu và giữ lại cho các file sau để không phải tải lại model
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.model_factory, self.factory_args, self.threads_per_worker),
+            )
+        return self._executor
+
+    def _discard_executor(self, executor):
+        """
+        Bỏ pool đã hỏng (BrokenProcessPool: một worker bị chết giữa chừng) để lần gọi sau tạo pool mới.
+        Pool hỏng không nhận thêm task nào, giữ lại thì mọi job sau đều lỗi cho tới khi restart server.
+        """
+        executor.shutdown(wait=False, cancel_futures=True)
+        if self._executor is executor:
+            self._executor = None
+            self._worker_states = {}
+            self._pending_pings = []
+
+    def _submit(self, fn, *args):
+        """Gửi task vào pool, tạo lại pool một lần nếu pool đã hỏng từ trước (worker chết ở job trước)"""
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            print("⚠️ Pool worker bị hỏng, tạo lại các process worker")
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(fn, *args)
+
+    def start(self):
+        """Tạo sẵn các worker (và tải model trong đó) thay vì đợi file đầu tiên"""
+        executor, future = self._submit(_ping)
+        try:
+            state = future.result()
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+        self._worker_states[state["pid"]] = state
+        return state["pid"]
+
+    def status(self, timeout=1.0):
+        """
+        Trạng thái các worker cho /healthz: gửi một ping cho mỗi worker (nếu lượt ping trước đã xong)
+        và đợi tối đa timeout giây. Worker đang bận xử lý trang trả lời sau, trạng thái đã biết
+        được giữ lại nên server vẫn sẵn sàng khi mọi worker đang bận.
+        Returns:
+            dict: 'ready' (pool còn chạy và đã có worker tải xong model), 'page_workers' và 'workers'
+                  (pid, load_seconds, models của từng worker đã trả lời).
+        """
+        with self._status_lock:
+            return self._status(timeout)
+
+    def _status(self, timeout):
+        error = None
+        try:
+            if not self._pending_pings:
+                executor = None
+                for _ in range(self.num_workers):
+                    if executor is None:
+                        executor, future = self._submit(_ping)
+                    else:
+                        future = executor.submit(_ping)
+                    self._pending_pings.append(future)
+            done, not_done = wait(self._pending_pings, timeout=timeout)
+            self._pending_pings = list(not_done)
+            for future in done:
+                state = future.result()
+                self._worker_states[state["pid"]] = state
+        except BrokenProcessPool as e:
+            # Worker không tải được model (initializer lỗi) hoặc bị chết: lần gọi sau tạo pool mới
+            if self._executor is not None:
+                self._discard_executor(self._executor)
+            error = str(e) or "BrokenProcessPool"
+        return {
+            "ready": error is None and bool(self._worker_states),
+            "page_workers": self.num_workers,
+            "workers": sorted(self._worker_states.values(), key=lambda state: state["pid"]),
+            "error": error,
+        }
+
+    def _iter_chunk_results(self, pdf_path, page_indices, page_kinds, folder_output_path=None, detect_batch_size=DETECT_BATCH_SIZE, ocr_mode=None, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD):
+        """
+        Gửi các nhóm detect_batch_size trang liên tiếp của page_indices (trùng với các batch detect
+        khi chạy tuần tự) cho các worker và trả kết quả ra theo thứ tự trang.
+        Số đo của worker được gộp vào số đo của tài liệu ở process chính.
+        Yields:
+            tuple: (page_index, ok, index_delta, page_paragraphs), trang không render được thì không có mặt.
+        """
+        chunks = [page_indices[start:start + detect_batch_size] for start in range(0, len(page_indices), detect_batch_size)]
+        futures = []
+        executor = None
+        for chunk in chunks:
+            args = (
+                _process_pages, pdf_path, chunk, {page_index: page_kinds[page_index] for page_index in chunk},
+                folder_output_path, detect_batch_size, ocr_mode, detect_conf, score_threshold,
+            )
+            if executor is None:
+                # Task đầu tiên kiểm tra (và tạo lại nếu cần) pool trước khi gửi cả job
+                executor, future = self._submit(*args)
+            else:
+                future = executor.submit(*args)
+            futures.append(future)
+
+        metrics = pipeline_metrics.current()
+        try:
+            for future in futures:
+                results, worker_metrics = future.result()
+                if metrics is not None:
+                    metrics.merge(worker_metrics)
+                yield from results
+        except BrokenProcessPool:
+            # Worker chết trong job này: chỉ job này lỗi, job sau chạy trên pool mới
+            if executor is not None:
+                self._discard_executor(executor)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def iter_process_pdf(self, documents, pdf_path, folder_output_path=None, detect_batch_size=DETECT_BATCH_SIZE, result_cache=None, cache_settings_key="", page_kinds=None, ocr_mode=None):
+        """
+        Giống iter_process_pdf nhưng các trang được xử lý song song.
+        Mỗi task là một nhóm detect_batch_size trang liên tiếp (trùng với các batch
+        detect khi chạy tuần tự), kết quả được trả ra theo thứ tự trang.
+        Args:
+            documents (fitz.Document): PDF đã mở ở process chính (để tra cache và ghép kết quả).
+            pdf_path (str): Đường dẫn PDF để các worker tự mở.
+            page_kinds (list | None): Loại của từng trang (triage_document). None thì tự phân loại.
+            ocr_mode (str | None): Cách OCR cho mọi trang, None thì theo loại trang và OCR_MODE.
+        Yields:
+            tuple: (page_index, page_paragraphs) cho từng trang.
+        """
+        if page_kinds is None:
+            page_kinds = [page_info["kind"] for page_info in triage_document(documents)["pages"]]
+        page_keys, cached_pages = lookup_cached_pages(documents, result_cache, cache_settings_key)
+        missing_pages = [page_index for page_index in range(len(documents)) if page_index not in cached_pages]
+        page_results = self._iter_chunk_results(pdf_path, missing_pages, page_kinds, folder_output_path, detect_batch_size, ocr_mode)
+        yield from merge_page_results(documents, page_results, cached_pages, page_keys, folder_output_path, result_cache)
+
+    def reprocess_pages(self, documents, pdf_path, page_indices, detect_conf=DETECT_CONF, score_threshold=SCORE_THRESHOLD, progress=None, detect_batch_size=DETECT_BATCH_SIZE):
+        """
+        Giống reprocess_pages nhưng các trang được xử lý lại trên các worker,
+        process chính không phải tải model.
+        Args:
+            documents (fitz.Document): PDF đã mở ở process chính (để phân loại trang).
+            pdf_path (str): Đường dẫn PDF để các worker tự mở.
+        Returns:
+            dict: page_index -> (index_delta, page_paragraphs), ghép vào tài liệu bằng splice_page_results.
+        """
+        if progress is not None:
+            progress.set_total_pages(len(page_indices))
+        page_kinds = {page_index: triage_page(documents[page_index])["kind"] for page_index in page_indices}
+        new_pages = {}
+        start_time = time.time()
+        page_results = self._iter_chunk_results(
+            pdf_path, list(page_indices), page_kinds, detect_batch_size=detect_batch_size,
+            detect_conf=detect_conf, score_threshold=score_threshold
+        )
+        for page_index, ok, index_delta, page_paragraphs in page_results:
+            if not ok:
+                # Như khi chạy tuần tự: trang lỗi làm job lỗi, kết quả đã lưu không bị ghi đè
+                raise RuntimeError(f"Lỗi khi xử lý lại trang {page_index + 1}")
+            new_pages[page_index] = (index_delta, page_paragraphs)
+            if progress is not None:
+                progress.page_done(page_index, len(page_paragraphs), time.time() - start_time)
+            start_time = time.time()
+        return new_pages
+
+    def close(self):
+        """Dừng các process worker"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
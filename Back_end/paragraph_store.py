@@ -0,0 +1,175 @@
+import bisect
+import json
+import os
+import shutil
+import threading
+
+# Các trường của một paragraph (dùng để kiểm tra tham số fields của API)
+PARAGRAPH_FIELDS = (
+    "type", "bbox", "full_text", "page_index", "parent_index", "index",
+    "is_title", "title_level", "reading_order", "column",
+)
+
+
+class ParagraphStore:
+    def __init__(self, store_dir):
+        """
+        Lưu kết quả đã xử lý của từng file trên đĩa, tách theo trang, để truy vấn
+        một khoảng trang mà không phải đọc (và gửi) toàn bộ tài liệu.
+        Mỗi file một thư mục con theo file_id gồm meta.json và page_N.json.
+
+        Args:
+            store_dir (str): Thư mục chứa kết quả
+        """
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        # Cache meta trong bộ nhớ (nhỏ: chỉ số paragraph của từng trang) kèm dấu (mtime, size)
+        # của meta.json lúc đọc; worker khác ghi lại hoặc xóa file thì dấu đổi và meta được đọc lại
+        self._meta = {}
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _folder(self, file_id):
+        return os.path.join(self.store_dir, file_id)
+
+    @staticmethod
+    def _write_json(path, value):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def save(self, file_id, total_pages, all_paragraphs):
+        """
+        Lưu kết quả của một file (ghi đè nếu đã có).
+        Args:
+            total_pages (int): Số trang của PDF
+            all_paragraphs (list): Paragraph của cả tài liệu theo thứ tự index
+        """
+        pages = [[] for _ in range(total_pages)]
+        for paragraph in all_paragraphs:
+            pages[paragraph["page_index"]].append(paragraph)
+
+        folder = self._folder(file_id)
+        os.makedirs(folder, exist_ok=True)
+        page_offsets = []
+        next_index = 0
+        for page_index, page_paragraphs in enumerate(pages):
+            if page_paragraphs:
+                next_index = page_paragraphs[0]["index"]
+            page_offsets.append(next_index)
+            if page_paragraphs:
+                next_index = page_paragraphs[-1]["index"] + 1
+            self._write_json(os.path.join(folder, f"page_{page_index}.json"), page_paragraphs)
+
+        meta = {
+            "total_pages": total_pages,
+            "total_paragraphs": len(all_paragraphs),
+            # index của paragraph đầu tiên của mỗi trang, để tìm trang theo cursor
+            "page_offsets": page_offsets,
+        }
+        # meta ghi sau cùng: có meta nghĩa là mọi trang đã được ghi xong
+        self._cache_meta(file_id, meta)
+
+    def update_pages(self, file_id, pages, page_offsets, total_paragraphs):
+        """
+        Ghi lại một số trang của file đã lưu (sau khi xử lý lại một số trang).
+        Args:
+            pages (dict): page_index -> paragraph mới của trang
+            page_offsets (list): index của paragraph đầu tiên mỗi trang sau khi cập nhật
+            total_paragraphs (int): Số paragraph của cả tài liệu sau khi cập nhật
+        """
+        meta = self.meta(file_id)
+        folder = self._folder(file_id)
+        for page_index, page_paragraphs in pages.items():
+            self._write_json(os.path.join(folder, f"page_{page_index}.json"), page_paragraphs)
+        meta = {**meta, "total_paragraphs": total_paragraphs, "page_offsets": page_offsets}
+        self._cache_meta(file_id, meta)
+
+    def _meta_path(self, file_id):
+        return os.path.join(self._folder(file_id), "meta.json")
+
+    def _meta_stamp(self, file_id):
+        """(mtime, size) của meta.json, None nếu chưa có"""
+        try:
+            stat = os.stat(self._meta_path(file_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _cache_meta(self, file_id, meta):
+        """Ghi meta.json rồi cache meta cùng dấu của file vừa ghi"""
+        self._write_json(self._meta_path(file_id), meta)
+        stamp = self._meta_stamp(file_id)
+        with self._lock:
+            self._meta[file_id] = (stamp, meta)
+
+    def meta(self, file_id):
+        """
+        Thông tin tổng quát của file, None nếu chưa có kết quả.
+        Meta đã cache chỉ được dùng khi meta.json không đổi từ lúc đọc (các process khác có thể
+        đã xử lý lại một số trang hoặc xóa file); mỗi lần gọi chỉ tốn một stat.
+        """
+        stamp = self._meta_stamp(file_id)
+        if stamp is None:
+            with self._lock:
+                self._meta.pop(file_id, None)
+            return None
+        with self._lock:
+            cached = self._meta.get(file_id)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(self._meta_path(file_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        with self._lock:
+            self._meta[file_id] = (stamp, meta)
+        return meta
+
+    def load_page(self, file_id, page_index):
+        """Paragraph của một trang"""
+        with open(os.path.join(self._folder(file_id), f"page_{page_index}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def query(self, file_id, first_page=0, last_page=None, types=None, fields=None, cursor=0, limit=500):
+        """
+        Lấy paragraph theo khoảng trang, có lọc theo loại, chọn trường và phân trang bằng cursor.
+        Chỉ các trang trong khoảng (và từ vị trí cursor) được đọc từ đĩa.
+
+        Args:
+            first_page, last_page (int): Khoảng page_index (tính cả hai đầu), last_page None là tới trang cuối
+            types (set | None): Chỉ lấy các loại này (vd: {"title"})
+            fields (list | None): Chỉ trả các trường này, None là đủ trường
+            cursor (int): index của paragraph bắt đầu (next_cursor của lần gọi trước)
+            limit (int): Số paragraph tối đa trả về
+
+        Returns:
+            tuple: (danh sách paragraph, next_cursor hoặc None nếu đã hết)
+        """
+        meta = self.meta(file_id)
+        page_offsets = meta["page_offsets"]
+        if last_page is None or last_page >= meta["total_pages"]:
+            last_page = meta["total_pages"] - 1
+
+        # Trang chứa paragraph có index = cursor
+        start_page = max(first_page, bisect.bisect_right(page_offsets, cursor) - 1)
+        paragraphs = []
+        for page_index in range(start_page, last_page + 1):
+            for paragraph in self.load_page(file_id, page_index):
+                if paragraph["index"] < cursor:
+                    continue
+                if types is not None and paragraph["type"] not in types:
+                    continue
+                if len(paragraphs) == limit:
+                    return paragraphs, paragraph["index"]
+                if fields is not None:
+                    paragraph = {field: paragraph.get(field) for field in fields}
+                paragraphs.append(paragraph)
+        return paragraphs, None
+
+    def remove_file(self, file_id):
+        """Xóa kết quả của một file"""
+        with self._lock:
+            self._meta.pop(file_id, None)
+        shutil.rmtree(self._folder(file_id), ignore_errors=True)
@@ -0,0 +1,321 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Các bước của pipeline được đo
+STAGES = ("render", "detect", "text_layer", "ocr", "classify", "sort", "serialize")
+# Ngưỡng (giây) của histogram thời gian mỗi bước trên một trang và của cả tài liệu
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DOCUMENT_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Tổng của một bước khi mới bắt đầu ghi
+EMPTY_STAGE_TOTAL = {"seconds": 0.0, "calls": 0, "boxes": 0, "max_rss_mb": 0.0, "peak_rss_growth_mb": 0.0}
+
+_local = threading.local()
+_process = psutil.Process()
+
+
+def current_rss_mb():
+    """Bộ nhớ RSS hiện tại của process (MB)"""
+    return _process.memory_info().rss / 1024 ** 2
+
+
+def peak_rss_mb():
+    """
+    RSS cao nhất của process từ khi khởi động (MB), do hệ điều hành ghi lại (ru_maxrss) nên tính cả
+    bộ nhớ được cấp phát rồi giải phóng giữa hai lần đo. Giá trị chỉ tăng, không giảm.
+    """
+    if resource is None:
+        memory_info = _process.memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss tính bằng byte trên macOS, KB trên Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class PipelineMetrics:
+    def __init__(self):
+        """
+        Số đo của một lần xử lý tài liệu: thời gian và số box theo từng bước, cho cả tài liệu
+        và cho từng trang. Bộ nhớ dùng RSS cao nhất của process (peak_rss_mb):
+        max_rss_mb là đỉnh RSS của process tính tới khi bước kết thúc, peak_rss_growth_mb là
+        phần đỉnh đó tăng lên trong lúc bước chạy (bước nào đẩy high-water mark lên).
+        """
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        # page_index -> {stage: {"seconds", "boxes"}}
+        self.pages = {}
+        self.max_rss_mb = 0.0
+
+    def record(self, stage, seconds, page_index=None, boxes=None, rss_mb=None, rss_growth_mb=0.0):
+        """
+        Ghi một lần chạy của một bước.
+        Args:
+            rss_mb (float | None): RSS cao nhất của process (peak_rss_mb) khi bước kết thúc.
+            rss_growth_mb (float): Phần RSS cao nhất tăng lên trong lúc bước chạy.
+        """
+        with self._lock:
+            total = self.stages.setdefault(stage, dict(EMPTY_STAGE_TOTAL))
+            total["seconds"] += seconds
+            total["calls"] += 1
+            total["boxes"] += boxes or 0
+            total["peak_rss_growth_mb"] += rss_growth_mb
+            if rss_mb is not None:
+                total["max_rss_mb"] = max(total["max_rss_mb"], rss_mb)
+                self.max_rss_mb = max(self.max_rss_mb, rss_mb)
+            if page_index is not None:
+                page = self.pages.setdefault(page_index, {}).setdefault(stage, {"seconds": 0.0, "boxes": 0})
+                page["seconds"] += seconds
+                page["boxes"] += boxes or 0
+
+    @contextlib.contextmanager
+    def stage(self, stage, page_index=None):
+        """
+        Đo một bước. Số box được ghi bằng cách gán info["boxes"] trong khối with.
+        Yields:
+            dict: info của bước.
+        """
+        info = {"boxes": None}
+        start_peak = peak_rss_mb()
+        start_time = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start_time
+            end_peak = peak_rss_mb()
+            self.record(stage, seconds, page_index, info["boxes"], end_peak, end_peak - start_peak)
+
+    def merge(self, summary):
+        """Gộp số đo (summary()) của process khác (worker xử lý song song theo trang)"""
+        with self._lock:
+            for stage, other in summary["stages"].items():
+                total = self.stages.setdefault(stage, dict(EMPTY_STAGE_TOTAL))
+                total["seconds"] += other["seconds"]
+                total["calls"] += other["calls"]
+                total["boxes"] += other["boxes"]
+                total["peak_rss_growth_mb"] += other["peak_rss_growth_mb"]
+                total["max_rss_mb"] = max(total["max_rss_mb"], other["max_rss_mb"])
+            for page in summary["pages"]:
+                self.pages[page["page_index"]] = {stage: dict(value) for stage, value in page["stages"].items()}
+            self.max_rss_mb = max(self.max_rss_mb, summary["max_rss_mb"])
+
+    def summary(self):
+        """Số đo dạng JSON để trả kèm kết quả"""
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.start_time, 4),
+                "max_rss_mb": round(self.max_rss_mb, 1),
+                "stages": {
+                    stage: {
+                        **value,
+                        "seconds": round(value["seconds"], 4),
+                        "max_rss_mb": round(value["max_rss_mb"], 1),
+                        "peak_rss_growth_mb": round(value["peak_rss_growth_mb"], 1),
+                    }
+                    for stage, value in self.stages.items()
+                },
+                "pages": [
+                    {
+                        "page_index": page_index,
+                        "stages": {stage: {**value, "seconds": round(value["seconds"], 4)} for stage, value in stages.items()},
+                    }
+                    for page_index, stages in sorted(self.pages.items())
+                ],
+            }
+
+
+@contextlib.contextmanager
+def collect():
+    """
+    Bật thu số đo cho thread hiện tại. Lồng nhau thì dùng lại bộ số đo bên ngoài,
+    khối ngoài cùng khi kết thúc cộng số đo vào thống kê của process (/metrics).
+    Yields:
+        PipelineMetrics
+    """
+    metrics = getattr(_local, "metrics", None)
+    if metrics is not None:
+        yield metrics
+        return
+    metrics = _local.metrics = PipelineMetrics()
+    try:
+        yield metrics
+    finally:
+        _local.metrics = None
+        process_metrics.add_document(metrics)
+
+
+def current():
+    """Bộ số đo đang thu của thread hiện tại, None nếu không có"""
+    return getattr(_local, "metrics", None)
+
+
+@contextlib.contextmanager
+def stage(name, page_index=None):
+    """Đo một bước vào bộ số đo của thread hiện tại (không làm gì nếu không có collect())"""
+    metrics = current()
+    if metrics is None:
+        yield {"boxes": None}
+        return
+    with metrics.stage(name, page_index) as info:
+        yield info
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels=""):
+        separator = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.total:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class ProcessMetrics:
+    def __init__(self):
+        """Thống kê cộng dồn các tài liệu đã xử lý trong process, xuất theo định dạng Prometheus"""
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.pages = 0
+        self.document_seconds = _Histogram(DOCUMENT_BUCKETS)
+        self.stage_seconds = {stage: _Histogram(STAGE_BUCKETS) for stage in STAGES}
+        self.stage_boxes = {stage: 0 for stage in STAGES}
+        self.stage_max_rss_mb = {stage: 0.0 for stage in STAGES}
+        self.stage_rss_growth_mb = {stage: 0.0 for stage in STAGES}
+
+    def add_document(self, metrics):
+        summary = metrics.summary()
+        with self._lock:
+            self.documents += 1
+            self.pages += len(summary["pages"])
+            self.document_seconds.observe(summary["total_seconds"])
+            for page in summary["pages"]:
+                for stage, value in page["stages"].items():
+                    if stage in self.stage_seconds:
+                        self.stage_seconds[stage].observe(value["seconds"])
+            for stage, value in summary["stages"].items():
+                if stage in self.stage_seconds:
+                    self.stage_boxes[stage] += value["boxes"]
+                    self.stage_max_rss_mb[stage] = max(self.stage_max_rss_mb[stage], value["max_rss_mb"])
+                    self.stage_rss_growth_mb[stage] += value["peak_rss_growth_mb"]
+
+    def render_prometheus(self):
+        """Thống kê ở định dạng text của Prometheus"""
+        with self._lock:
+            lines = [
+                "# HELP pdf_documents_total Số tài liệu đã xử lý.",
+                "# TYPE pdf_documents_total counter",
+                f"pdf_documents_total {self.documents}",
+                "# HELP pdf_pages_total Số trang đã xử lý (không tính trang lấy từ cache).",
+                "# TYPE pdf_pages_total counter",
+                f"pdf_pages_total {self.pages}",
+                "# HELP pdf_document_seconds Thời gian xử lý một tài liệu.",
+                "# TYPE pdf_document_seconds histogram",
+                *self.document_seconds.lines("pdf_document_seconds"),
+                "# HELP pdf_stage_seconds Thời gian của một bước pipeline trên một trang.",
+                "# TYPE pdf_stage_seconds histogram",
+            ]
+            for stage, histogram in self.stage_seconds.items():
+                lines.extend(histogram.lines("pdf_stage_seconds", f'stage="{stage}"'))
+            lines += ["# HELP pdf_stage_boxes_total Số box đã qua từng bước.", "# TYPE pdf_stage_boxes_total counter"]
+            lines += [f'pdf_stage_boxes_total{{stage="{stage}"}} {boxes}' for stage, boxes in self.stage_boxes.items()]
+            lines += [
+                "# HELP pdf_stage_max_rss_megabytes RSS cao nhất của process (ru_maxrss) tính tới khi kết thúc từng bước.",
+                "# TYPE pdf_stage_max_rss_megabytes gauge",
+            ]
+            lines += [f'pdf_stage_max_rss_megabytes{{stage="{stage}"}} {rss:.1f}' for stage, rss in self.stage_max_rss_mb.items()]
+            lines += [
+                "# HELP pdf_stage_peak_rss_growth_megabytes_total Phần RSS cao nhất của process tăng lên trong lúc từng bước chạy.",
+                "# TYPE pdf_stage_peak_rss_growth_megabytes_total counter",
+            ]
+            lines += [
+                f'pdf_stage_peak_rss_growth_megabytes_total{{stage="{stage}"}} {growth:.1f}'
+                for stage, growth in self.stage_rss_growth_mb.items()
+            ]
+        lines += [
+            "# HELP process_peak_resident_memory_megabytes RSS cao nhất của process từ khi khởi động.",
+            "# TYPE process_peak_resident_memory_megabytes gauge",
+            f"process_peak_resident_memory_megabytes {peak_rss_mb():.1f}",
+            "# HELP process_resident_memory_megabytes RSS hiện tại của process.",
+            "# TYPE process_resident_memory_megabytes gauge",
+            f"process_resident_memory_megabytes {current_rss_mb():.1f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# Thống kê của process này (mỗi worker của server có thống kê riêng, phân biệt bằng label instance khi scrape)
+process_metrics = ProcessMetrics()
+
+
+@contextlib.contextmanager
+def profile(output_path, profiler="cprofile"):
+    """
+    Profile khối lệnh trong thread hiện tại và ghi kết quả ra output_path.
+    Các trang xử lý trong process worker (PAGE_WORKERS > 1) không nằm trong profile.
+    Args:
+        profiler (str): "cprofile" (file .prof đọc bằng pstats/snakeviz) hoặc "pyinstrument" (file .html)
+    Yields:
+        dict: 'path' là file profile đã ghi (None nếu không profile được).
+    """
+    info = {"path": None}
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠ Chưa cài pyinstrument, bỏ qua profile")
+            yield info
+            return
+        profiler_obj = Profiler()
+        profiler_obj.start()
+        try:
+            yield info
+        finally:
+            profiler_obj.stop()
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(profiler_obj.output_html())
+            info["path"] = output_path
+        return
+
+    import cProfile
+    profiler_obj = cProfile.Profile()
+    try:
+        profiler_obj.enable()
+    except ValueError as e:
+        # Python 3.12+: chỉ một profiler chạy được tại một thời điểm
+        print(f"⚠ Không bật được cProfile: {e}")
+        yield info
+        return
+    try:
+        yield info
+    finally:
+        profiler_obj.disable()
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        profiler_obj.dump_stats(output_path)
+        info["path"] = output_path
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def hash_content(data, settings_key=""):
+    """
+    Tạo khóa cache từ nội dung (bytes) và chuỗi mô tả cấu hình xử lý
+
+    Args:
+        data (bytes): Nội dung cần hash (file PDF, fingerprint của trang, ...)
+        settings_key (str): Phiên bản model, ngưỡng, ... ảnh hưởng tới kết quả
+
+    Returns:
+        str: sha256 dạng hex
+    """
+    digest = hashlib.sha256()
+    digest.update(settings_key.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def file_version(path):
+    """Định danh phiên bản của một file/thư mục model theo tên, kích thước và thời gian sửa"""
+    if not os.path.exists(path):
+        return f"{path}:missing"
+    if os.path.isdir(path):
+        entries = sorted(
+            (name, os.path.getsize(os.path.join(path, name)), int(os.path.getmtime(os.path.join(path, name))))
+            for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))
+        )
+        return f"{path}:{entries}"
+    return f"{path}:{os.path.getsize(path)}:{int(os.path.getmtime(path))}"
+
+
+class ResultCache:
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        """
+        Cache kết quả xử lý trên đĩa, mỗi entry là một file JSON đặt tên theo khóa.
+        Khi tổng dung lượng vượt max_bytes, các entry ít được dùng gần đây nhất bị xóa.
+
+        Args:
+            cache_dir (str): Thư mục chứa cache
+            max_bytes (int): Dung lượng tối đa của cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._iter_entries())
+
+    def _path(self, namespace, key):
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def _iter_entries(self):
+        """Duyệt (path, size, thời gian dùng gần nhất) của mọi entry"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, namespace, key):
+        """Đọc entry, trả về None nếu không có. Entry được đánh dấu vừa dùng."""
+        path = self._path(namespace, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            # mtime dùng làm thời điểm truy cập gần nhất cho LRU
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, namespace, key, value):
+        """Ghi entry (ghi file tạm rồi đổi tên để không để lại file dở dang)"""
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        new_size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += new_size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Xóa các entry cũ nhất cho tới khi dung lượng còn dưới 90% max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[2])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+        print(f"Result cache sau khi dọn: {self._total_bytes / 1024 ** 2:.1f} MB")
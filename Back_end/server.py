@@ -1,23 +1,60 @@
+import contextlib
+import gzip
 import json
-from flask import Flask, request, jsonify, send_from_directory, url_for
+from flask import Flask, Response, stream_with_context, request, jsonify, send_from_directory, send_file, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import uuid
 import os
+import threading
 import time
-import shutil
-from Processing_function import process_full_pdf
-from doclayout_yolo import YOLOv10
-import easyocr
-from LayoutLMv3Classifier import LayoutLMv3Classifier
-# ********ĐỊNH NGHĨA CÁC ĐƯỜNG DẪN********
-MODEL_PATH = "model/model_doclayout/doclayout_yolo_docstructbench_imgsz1024.pt"
-model = YOLOv10(MODEL_PATH)
-reader = easyocr.Reader(['vi', 'en'], gpu=False)
-classifier = LayoutLMv3Classifier()
+import fitz
+from Processing_function import (
+    process_full_pdf, triage_document, reprocess_pages, splice_page_results, DETECT_CONF, SCORE_THRESHOLD, RENDER_MODE, DETECT_IMAGE_SIZE, OUTPUT_DPI,
+    OCR_MODE, TRIAGE_MIN_CHARS, TRIAGE_SCANNED_IMAGE_COVERAGE, TRIAGE_MIXED_IMAGE_COVERAGE
+)
+from model_loader import MODEL_PATH, CLASSIFIER_MODEL_PATH, load_models, ModelRegistry
+from page_parallel import PageParallelProcessor
+from job_manager import JobManager, QueueFullError
+from result_cache import ResultCache, hash_content, file_version
+from page_images import PageImageCache, page_bbox_size, IMAGE_FORMATS, DEFAULT_VIEW_WIDTH, TIERS, LARGE_PAGE_PIXELS
+from paragraph_store import ParagraphStore, PARAGRAPH_FIELDS
+from file_registry import create_file_registry, STATUS_DONE
+import pipeline_metrics
+try:
+    import brotli  # Tùy chọn: nén brotli cho response JSON, không có thì chỉ dùng gzip
+except ImportError:
+    brotli = None
+# Backend của detector: "torch" (doclayout_yolo) hoặc "onnx" (ONNX Runtime)
+DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'torch')
+# Backend của classifier: "torch", "torch_int8" hoặc "onnx"
+CLASSIFIER_BACKEND = os.environ.get('CLASSIFIER_BACKEND', 'torch')
+
+# Số process xử lý song song các trang của một file (1 = xử lý tuần tự trong process này)
+PAGE_WORKERS = int(os.environ.get('PAGE_WORKERS', 1))
+page_processor = None
+if PAGE_WORKERS > 1:
+    page_processor = PageParallelProcessor(PAGE_WORKERS, load_models, (DETECTOR_BACKEND, CLASSIFIER_BACKEND))
+    # Fork các worker trước khi process chính tải model và khởi tạo thread của torch
+    page_processor.start()
+
+# Cách tải model trong process này:
+#   "background" - tải và warm-up trong thread nền, server nhận request ngay (/healthz báo khi sẵn sàng)
+#   "lazy"       - tải khi có job đầu tiên
+#   "preload"    - tải ngay khi import (không warm-up), dùng với gunicorn --preload để các worker
+#                  fork sau khi tải và dùng chung bộ nhớ model; mỗi worker warm-up ở lần dùng đầu
+MODEL_LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'background')
+model_registry = ModelRegistry(DETECTOR_BACKEND, CLASSIFIER_BACKEND)
+# Khi xử lý song song theo trang, model nằm trong các process worker, process này không cần tải
+if page_processor is None:
+    if MODEL_LOAD_MODE == 'preload':
+        model_registry.load_all(warm_up=False)
+    elif MODEL_LOAD_MODE == 'background':
+        model_registry.load_in_background()
 
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-IMAGES_FOLDER = os.path.join(os.getcwd(), 'page_images')  # Thư mục lưu ảnh các trang
+IMAGES_FOLDER = os.path.join(os.getcwd(), 'page_images')  # Thư mục cache ảnh các trang
+RESULTS_FOLDER = os.path.join(os.getcwd(), 'results')  # Kết quả đã xử lý của từng file, tách theo trang
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(IMAGES_FOLDER, exist_ok=True)
 
@@ -28,45 +65,216 @@ CORS(app)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['IMAGES_FOLDER'] = IMAGES_FOLDER
 
-# Dictionary lưu thông tin các file đã xử lý (trong thực tế nên dùng database)
-processed_files = {}
+# Thông tin các file đã upload/xử lý, dùng chung giữa các worker và giữ lại sau khi khởi động lại.
+# Bản ghi có ngay khi upload (để xem ảnh trang khi job chưa xong)
+FILE_REGISTRY_BACKEND = os.environ.get('FILE_REGISTRY_BACKEND', 'sqlite')
+FILE_REGISTRY_DB = os.environ.get('FILE_REGISTRY_DB', os.path.join(os.getcwd(), 'file_registry.sqlite3'))
+file_registry = create_file_registry(FILE_REGISTRY_BACKEND, db_path=FILE_REGISTRY_DB)
+# File không được xem trong FILE_TTL_HOURS giờ bị xóa (PDF, ảnh trang, kết quả), kiểm tra mỗi CLEANUP_INTERVAL_MINUTES phút
+FILE_TTL_HOURS = float(os.environ.get('FILE_TTL_HOURS', 7 * 24))
+CLEANUP_INTERVAL_MINUTES = float(os.environ.get('CLEANUP_INTERVAL_MINUTES', 60))
+
+# Kết quả của từng file để truy vấn theo trang qua /api/files/<file_id>/paragraphs
+paragraph_store = ParagraphStore(RESULTS_FOLDER)
+# Số paragraph mặc định và tối đa trong một lần gọi /api/files/<file_id>/paragraphs
+PARAGRAPHS_PAGE_SIZE = 500
+PARAGRAPHS_MAX_PAGE_SIZE = 5000
+# Ghép kết quả xử lý lại vào kết quả đã lưu lần lượt từng job (đọc-sửa-ghi cùng các file trang)
+reprocess_lock = threading.Lock()
+# Response JSON nhỏ hơn ngưỡng này không nén
+COMPRESS_MIN_BYTES = 1024
+
+# Profile mặc định cho mọi job: "" (tắt), "cprofile" hoặc "pyinstrument"; upload có thể chọn riêng bằng tham số profile
+JOB_PROFILER = os.environ.get('JOB_PROFILER', '')
+PROFILERS = ('cprofile', 'pyinstrument')
+PROFILE_FOLDER = os.path.join(os.getcwd(), 'profiles')
+
+# Ảnh trang được render khi có yêu cầu và giữ trong cache có giới hạn dung lượng
+PAGE_IMAGE_CACHE_MAX_MB = int(os.environ.get('PAGE_IMAGE_CACHE_MAX_MB', 1024))
+page_image_cache = PageImageCache(IMAGES_FOLDER, max_bytes=PAGE_IMAGE_CACHE_MAX_MB * 1024 ** 2)
+# Ảnh của một file_id không đổi nên trình duyệt được cache lâu dài
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Pool worker chạy nền các job xử lý PDF
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 32))
+job_manager = JobManager(max_workers=JOB_WORKERS, max_queued_jobs=MAX_QUEUED_JOBS)
+
+# Cache kết quả theo nội dung PDF (và theo từng trang) trên đĩa
+PIPELINE_VERSION = "5"
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(os.getcwd(), 'result_cache'))
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 2048))
+result_cache = ResultCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_MB * 1024 ** 2)
+# Mọi thứ ảnh hưởng tới kết quả đều nằm trong khóa cache, đổi model/ngưỡng là cache cũ hết hiệu lực
+CACHE_SETTINGS_KEY = json.dumps({
+    'pipeline': PIPELINE_VERSION,
+    'detector': [DETECTOR_BACKEND, file_version(MODEL_PATH)],
+    'classifier': [CLASSIFIER_BACKEND, file_version(CLASSIFIER_MODEL_PATH)],
+    'detect_conf': DETECT_CONF,
+    'score_threshold': SCORE_THRESHOLD,
+    'render_mode': RENDER_MODE,
+    'detect_image_size': DETECT_IMAGE_SIZE,
+    'output_dpi': OUTPUT_DPI,
+    'ocr_mode': OCR_MODE,
+    'triage': [TRIAGE_MIN_CHARS, TRIAGE_SCANNED_IMAGE_COVERAGE, TRIAGE_MIXED_IMAGE_COVERAGE],
+}, sort_keys=True)
+
+# Route kiểm tra server đã sẵn sàng xử lý (model đã tải), trả 503 khi chưa
+@app.route('/healthz')
+def healthz():
+    if page_processor is not None:
+        # Model nằm trong các process worker: hỏi trạng thái tải model của từng worker
+        health = {**page_processor.status(), "pid": os.getpid()}
+    else:
+        health = {**model_registry.status(), "load_mode": MODEL_LOAD_MODE}
+        health["models_ready"] = health["ready"]
+        if MODEL_LOAD_MODE == 'lazy':
+            # Model chỉ được tải khi có job đầu tiên: đợi model tải xong thì không bao giờ có job,
+            # nên server sẵn sàng trừ khi đã có model tải lỗi (trạng thái chi tiết trong "models")
+            health["ready"] = all(state["status"] != "error" for state in health["models"].values())
+    return jsonify(health), 200 if health['ready'] else 503
+
 
 # Route trả file PDF về cho trình duyệt
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
-# Route trả ảnh trang PDF về cho trình duyệt
+def parse_page_index(page_name):
+    """'page_3', 'page_3.png', 'page_3.dzi' -> 3"""
+    return int(os.path.splitext(page_name)[0].replace('page_', '', 1))
+
+
+def get_image_format():
+    image_format = request.args.get('format', 'webp').lower().replace('jpg', 'jpeg')
+    return image_format if image_format in IMAGE_FORMATS else None
+
+
+def cached_image_response(file_id, file_info, variant, render):
+    """
+    Trả ảnh trang với ETag/Last-Modified và Cache-Control dài hạn.
+    Ảnh của một file_id không bao giờ thay đổi nên ETag chỉ cần file_id và biến thể ảnh,
+    request có If-None-Match khớp được trả 304 mà không cần mở PDF hay render.
+    Range request được send_file xử lý (conditional=True).
+    Args:
+        file_info (dict): Bản ghi của file trong file_registry.
+        variant (str): Mô tả biến thể ảnh (trang, kích thước, định dạng, tile, ...).
+        render (callable): Hàm trả về (đường dẫn ảnh, mimetype), chỉ gọi khi cần gửi ảnh.
+    """
+    etag = f"{file_id}-{variant}"
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['filename'])
+    cache_control = f"public, max-age={IMAGE_MAX_AGE}, immutable"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    try:
+        image_path, mimetype = render(pdf_path)
+    except (IndexError, FileNotFoundError):
+        return jsonify({"error": "Không tìm thấy ảnh trang"}), 404
+
+    response = send_file(
+        image_path, mimetype=mimetype, conditional=True, etag=etag,
+        last_modified=os.path.getmtime(pdf_path), max_age=IMAGE_MAX_AGE
+    )
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+# Route trả ảnh trang PDF về cho trình duyệt, render khi có yêu cầu lần đầu
+# Query: tier (thumb | view), width (pixel) hoặc scale (1.0 = ảnh 300 DPI của hệ tọa độ bbox),
+# format (webp | jpeg). page_N.dzi trả về mô tả deep-zoom của trang.
 @app.route('/page_images/<file_id>/<page_name>')
 def get_page_image(file_id, page_name):
-    file_folder = os.path.join(app.config['IMAGES_FOLDER'], file_id)
-    if not os.path.exists(file_folder):
-        return jsonify({"error": "Không tìm thấy thư mục ảnh của file"}), 404
-    
-    image_path = os.path.join(file_folder, page_name)
-    if not os.path.exists(image_path):
-        return jsonify({"error": "Không tìm thấy ảnh trang"}), 404
-    
-    return send_from_directory(file_folder, page_name)
+    file_info = file_registry.get(file_id)
+    if file_info is None:
+        return jsonify({"error": "Không tìm thấy file"}), 404
+
+    try:
+        page_index = parse_page_index(page_name)
+        width = request.args.get('width', type=int)
+        scale = request.args.get('scale', type=float)
+    except ValueError:
+        return jsonify({"error": "Tên ảnh trang không hợp lệ"}), 400
+    tier = request.args.get('tier')
+    image_format = get_image_format()
+    if image_format is None:
+        return jsonify({"error": f"Chỉ hỗ trợ định dạng: {', '.join(IMAGE_FORMATS)}"}), 400
+    if tier is not None and tier not in TIERS:
+        return jsonify({"error": f"Chỉ hỗ trợ tier: {', '.join(TIERS)}"}), 400
+
+    if page_name.endswith('.dzi'):
+        pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['filename'])
+        try:
+            descriptor = page_image_cache.dzi_descriptor(pdf_path, page_index, image_format)
+        except (IndexError, FileNotFoundError):
+            return jsonify({"error": "Không tìm thấy trang"}), 404
+        response = app.response_class(descriptor, mimetype='application/xml')
+        response.headers['Cache-Control'] = f"public, max-age={IMAGE_MAX_AGE}, immutable"
+        return response
+
+    variant = f"{page_index}-{tier}-{width}-{scale}.{image_format}"
+    return cached_image_response(
+        file_id, file_info, variant,
+        lambda pdf_path: page_image_cache.get(file_id, pdf_path, page_index, width, scale, image_format, tier)
+    )
+
+
+# Route trả một tile deep-zoom theo cấu trúc DZI: page_N_files/<level>/<col>_<row>.<format>
+@app.route('/page_images/<file_id>/<page_stem>_files/<int:level>/<tile_name>')
+def get_page_tile(file_id, page_stem, level, tile_name):
+    file_info = file_registry.get(file_id)
+    if file_info is None:
+        return jsonify({"error": "Không tìm thấy file"}), 404
+
+    try:
+        page_index = parse_page_index(page_stem)
+        tile_stem, tile_extension = os.path.splitext(tile_name)
+        col, row = (int(value) for value in tile_stem.split('_'))
+    except ValueError:
+        return jsonify({"error": "Tên tile không hợp lệ"}), 400
+    image_format = tile_extension.lstrip('.').lower().replace('jpg', 'jpeg')
+    if image_format not in IMAGE_FORMATS:
+        return jsonify({"error": f"Chỉ hỗ trợ định dạng: {', '.join(IMAGE_FORMATS)}"}), 400
+
+    variant = f"{page_index}-tile-{level}-{col}-{row}.{image_format}"
+    return cached_image_response(
+        file_id, file_info, variant,
+        lambda pdf_path: page_image_cache.get_tile(file_id, pdf_path, page_index, level, col, row, image_format)
+    )
 
 # Route lấy danh sách ảnh của một file
+# Query: width - độ rộng ảnh cho các URL trả về (mặc định DEFAULT_VIEW_WIDTH)
 @app.route('/api/get_page_images/<file_id>')
 def get_file_page_images(file_id):
-    if file_id not in processed_files:
+    file_info = file_registry.get(file_id)
+    if file_info is None or file_info['status'] != STATUS_DONE:
         return jsonify({"error": "File không tồn tại hoặc chưa được xử lý"}), 404
-    
-    file_info = processed_files[file_id]
+    file_registry.touch(file_id)
+
+    width = request.args.get('width', DEFAULT_VIEW_WIDTH, type=int)
     page_images = []
-    
-    # THAY ĐỔI DÒNG NÀY: range từ 0 đến total_pages - 1
-    for i in range(0, file_info['total_pages']): 
-        page_name = f"page_{i}.png" # <-- Sử dụng i (page_index) trực tiếp
-        image_url = url_for('get_page_image', file_id=file_id, page_name=page_name, _external=True)
-        page_images.append({
-            "page_number": i + 1, # Vẫn hiển thị page_number từ 1 cho người dùng
-            "image_url": image_url,
-            "page_name": page_name
-        })
+
+    with fitz.open(os.path.join(app.config['UPLOAD_FOLDER'], file_info['filename'])) as documents:
+        for i, page in enumerate(documents):
+            page_name = f"page_{i}"
+            image_url = url_for('get_page_image', file_id=file_id, page_name=page_name, width=width, _external=True)
+            # Kích thước hệ tọa độ bbox của trang, để client đổi bbox theo độ rộng ảnh thật
+            bbox_width, bbox_height = page_bbox_size(page)
+            page_image = {
+                "page_number": i + 1, # Vẫn hiển thị page_number từ 1 cho người dùng
+                "image_url": image_url,
+                "thumb_url": url_for('get_page_image', file_id=file_id, page_name=page_name, tier='thumb', _external=True),
+                "page_name": page_name,
+                "bbox_width": bbox_width,
+                "bbox_height": bbox_height
+            }
+            if max(bbox_width, bbox_height) > LARGE_PAGE_PIXELS:
+                # Trang rất lớn: client có thể xem bằng tile deep-zoom
+                page_image["dzi_url"] = url_for('get_page_image', file_id=file_id, page_name=f"{page_name}.dzi", _external=True)
+            page_images.append(page_image)
     
     return jsonify({
         "file_id": file_id,
@@ -74,6 +282,281 @@ def get_file_page_images(file_id):
         "page_images": page_images
     }), 200
 
+def parse_page_range(value, total_pages):
+    """'3-5' -> (3, 5), '3' -> (3, 3), '3-' -> (3, trang cuối); page_index tính từ 0"""
+    if not value:
+        return 0, total_pages - 1
+    first, separator, last = value.partition('-')
+    first_page = int(first) if first else 0
+    last_page = (int(last) if last else None) if separator else first_page
+    if first_page < 0 or (last_page is not None and last_page < first_page):
+        raise ValueError(value)
+    # Trang cuối bị giới hạn ở trang cuối của file, trang đầu vượt quá số trang do route kiểm tra
+    return first_page, total_pages - 1 if last_page is None else min(last_page, total_pages - 1)
+
+
+# Route lấy paragraph của file đã xử lý theo trang, không phải tải cả tài liệu
+# Query: pages (vd: 3-5, 3, 3-; page_index tính từ 0), type (vd: title hoặc title,plain text),
+# fields (vd: index,full_text), limit, cursor (next_cursor của lần gọi trước)
+@app.route('/api/files/<file_id>/paragraphs')
+def get_file_paragraphs(file_id):
+    meta = paragraph_store.meta(file_id)
+    if meta is None:
+        return jsonify({"error": "File không tồn tại hoặc chưa được xử lý"}), 404
+    file_registry.touch(file_id)
+
+    try:
+        first_page, last_page = parse_page_range(request.args.get('pages'), meta['total_pages'])
+        cursor = int(request.args.get('cursor', 0))
+        limit = int(request.args.get('limit', PARAGRAPHS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "Tham số pages, cursor hoặc limit không hợp lệ"}), 400
+    if first_page >= meta['total_pages']:
+        return jsonify({"error": f"File chỉ có {meta['total_pages']} trang"}), 400
+    if not 1 <= limit <= PARAGRAPHS_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit phải trong khoảng 1-{PARAGRAPHS_MAX_PAGE_SIZE}"}), 400
+
+    types = request.args.get('type')
+    types = set(types.split(',')) if types else None
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else None
+    if fields is not None and not set(fields) <= set(PARAGRAPH_FIELDS):
+        return jsonify({"error": f"Chỉ hỗ trợ các trường: {', '.join(PARAGRAPH_FIELDS)}"}), 400
+
+    paragraphs, next_cursor = paragraph_store.query(file_id, first_page, last_page, types, fields, cursor, limit)
+    next_url = None
+    if next_cursor is not None:
+        next_url = url_for('get_file_paragraphs', file_id=file_id, **{**request.args.to_dict(), 'cursor': next_cursor}, _external=True)
+    return jsonify({
+        "file_id": file_id,
+        "total_pages": meta['total_pages'],
+        "total_paragraphs": meta['total_paragraphs'],
+        "pages": [first_page, last_page],
+        "count": len(paragraphs),
+        "paragraphs": paragraphs,
+        "next_cursor": next_cursor,
+        "next_url": next_url
+    }), 200
+
+
+# Route xử lý lại một số trang của file đã xử lý (vd: khi kết quả của trang bị sai), không phải upload lại
+# Query: pages (bắt buộc, vd: 3-5, 3; page_index tính từ 0), conf (ngưỡng confidence khi detect),
+# score (ngưỡng score để giữ box). Kết quả mới được ghép vào kết quả đã lưu khi job xong.
+@app.route('/api/files/<file_id>/reprocess', methods=['POST'])
+def reprocess_file(file_id):
+    file_info = file_registry.get(file_id)
+    meta = paragraph_store.meta(file_id)
+    if file_info is None or meta is None or file_info['status'] != STATUS_DONE:
+        return jsonify({"error": "File không tồn tại hoặc chưa được xử lý"}), 404
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['filename'])
+    if not os.path.exists(file_path):
+        return jsonify({"error": "File PDF không còn trên server"}), 404
+
+    if not request.args.get('pages'):
+        return jsonify({"error": "Thiếu tham số pages (vd: 3-5)"}), 400
+    try:
+        first_page, last_page = parse_page_range(request.args.get('pages'), meta['total_pages'])
+        detect_conf = float(request.args.get('conf', DETECT_CONF))
+        score_threshold = float(request.args.get('score', SCORE_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "Tham số pages, conf hoặc score không hợp lệ"}), 400
+    if first_page > last_page:
+        return jsonify({"error": f"File chỉ có {meta['total_pages']} trang"}), 400
+    if not (0 < detect_conf <= 1 and 0 <= score_threshold <= 1):
+        return jsonify({"error": "conf phải trong khoảng (0, 1], score trong khoảng [0, 1]"}), 400
+
+    page_indices = list(range(first_page, last_page + 1))
+    try:
+        job_id = job_manager.submit(
+            run_reprocess_job, file_path, file_id, page_indices, detect_conf, score_threshold,
+            metadata={'file_id': file_id, 'original_name': file_info['original_name'], 'reprocess': [first_page, last_page]}
+        )
+    except QueueFullError as e:
+        return jsonify({"error": f"Server đang bận, vui lòng thử lại sau: {str(e)}"}), 503
+    file_registry.touch(file_id)
+
+    return jsonify({
+        "message": "Các trang đã được đưa vào hàng đợi xử lý lại.",
+        "job_id": job_id,
+        "file_id": file_id,
+        "pages": [first_page, last_page],
+        "conf": detect_conf,
+        "score": score_threshold,
+        "status_url": url_for('get_job_status', job_id=job_id, _external=True),
+        "result_url": url_for('get_job_result', job_id=job_id, _external=True),
+        "paragraphs_url": url_for('get_file_paragraphs', file_id=file_id, _external=True),
+    }), 202
+
+
+def remove_file_data(file_id, unique_filename):
+    """Xóa file PDF, ảnh trang, kết quả và bản ghi registry của một file"""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    page_image_cache.remove_file(file_id)
+    paragraph_store.remove_file(file_id)
+    file_registry.remove(file_id)
+
+
+def cleanup_failed_upload(file_path, file_id):
+    """Xóa file PDF và ảnh trang của một lần xử lý bị lỗi"""
+    remove_file_data(file_id, os.path.basename(file_path))
+    print(f"Đã xóa file PDF lỗi: {file_path}")
+
+
+def register_processed_file(file_id, data):
+    """Lưu kết quả của file (để truy vấn theo trang) và đánh dấu file đã xử lý"""
+    paragraph_store.save(file_id, data['total_pages'], data['all_paragraphs'])
+    file_registry.mark_processed(file_id, data['total_pages'], data['total_paragraphs'])
+
+
+def cleanup_expired_files():
+    """
+    Xóa các file không được xem trong FILE_TTL_HOURS giờ, cùng với file trong uploads/,
+    page_images/ và results/ không còn bản ghi trong registry (sót lại từ lần chạy trước)
+    và file profile cũ hơn FILE_TTL_HOURS.
+    Returns:
+        int: Số file đã xóa theo registry.
+    """
+    cutoff = time.time() - FILE_TTL_HOURS * 3600
+    expired = file_registry.expired(cutoff)
+    for file_info in expired:
+        remove_file_data(file_info['file_id'], file_info['filename'])
+
+    def iter_orphans(folder, is_registered):
+        for name in os.listdir(folder):
+            try:
+                if os.path.getmtime(os.path.join(folder, name)) < cutoff and not is_registered(name):
+                    yield name
+            except FileNotFoundError:
+                continue
+
+    for name in iter_orphans(app.config['UPLOAD_FOLDER'], lambda name: file_registry.find_by_filename(name) is not None):
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], name))
+    for file_id in iter_orphans(app.config['IMAGES_FOLDER'], lambda name: file_registry.get(name) is not None):
+        page_image_cache.remove_file(file_id)
+    for file_id in iter_orphans(RESULTS_FOLDER, lambda name: file_registry.get(name) is not None):
+        paragraph_store.remove_file(file_id)
+    if os.path.isdir(PROFILE_FOLDER):
+        for name in iter_orphans(PROFILE_FOLDER, lambda name: False):
+            os.remove(os.path.join(PROFILE_FOLDER, name))
+    if expired:
+        print(f"🧹 Đã xóa {len(expired)} file hết hạn")
+    return len(expired)
+
+
+def run_cleanup_loop():
+    while True:
+        time.sleep(CLEANUP_INTERVAL_MINUTES * 60)
+        try:
+            cleanup_expired_files()
+        except Exception as e:
+            print(f"Lỗi khi dọn file hết hạn: {e}")
+
+
+def run_pdf_job(file_path, file_id, document_key=None, triage=None, profiler=None, progress=None):
+    """
+    Hàm chạy trong worker nền: xử lý PDF và lưu thông tin file đã xử lý.
+    Kết quả được lưu vào result_cache theo document_key (hash nội dung PDF).
+    Args:
+        profiler (str | None): "cprofile" hoặc "pyinstrument" để profile job, file profile nằm trong PROFILE_FOLDER.
+    Returns:
+        dict: Kết quả xử lý (data của process_full_pdf), 'metrics' là số đo theo bước của cả job.
+    """
+    with pipeline_metrics.collect() as metrics:
+        if profiler:
+            extension = 'html' if profiler == 'pyinstrument' else 'prof'
+            profile_context = pipeline_metrics.profile(os.path.join(PROFILE_FOLDER, f"{file_id}.{extension}"), profiler)
+        else:
+            profile_context = contextlib.nullcontext({"path": None})
+        try:
+            print("Đang xử lý nội dung PDF...")
+            with profile_context as profile_info:
+                model, classifier, reader = model_registry.models() if page_processor is None else (None, None, None)
+                # Ảnh trang không được ghi lúc xử lý, get_page_image render khi có người xem
+                data = process_full_pdf(
+                    model, classifier, reader, file_path, None, progress=progress,
+                    result_cache=result_cache, cache_settings_key=CACHE_SETTINGS_KEY, page_processor=page_processor,
+                    triage=triage
+                )
+            print("Xử lý PDF hoàn tất")
+
+            # Lưu kết quả cũng nằm trong try: lỗi khi ghi thì PDF và các file kết quả đã ghi dở bị xóa
+            with metrics.stage('serialize'):
+                register_processed_file(file_id, data)
+                if document_key:
+                    result_cache.put('documents', document_key, {
+                        'total_pages': data['total_pages'],
+                        'total_paragraphs': data['total_paragraphs'],
+                        'all_paragraphs': data['all_paragraphs'],
+                        'triage': data['triage'],
+                    })
+        except Exception as e:
+            print(f"Lỗi khi xử lý PDF: {e}")
+            cleanup_failed_upload(file_path, file_id)
+            raise
+        data['metrics'] = metrics.summary()
+    data['profile'] = os.path.basename(profile_info['path']) if profile_info['path'] else None
+    return data
+
+
+def run_reprocess_job(file_path, file_id, page_indices, detect_conf, score_threshold, progress=None):
+    """
+    Hàm chạy trong worker nền: xử lý lại các trang page_indices của file đã xử lý và ghép
+    kết quả vào kết quả đã lưu (chỉ các trang bị ảnh hưởng được ghi lại).
+    Returns:
+        dict: Như run_pdf_job, 'all_paragraphs' chỉ gồm paragraph của các trang xử lý lại,
+              'changed_pages' là các trang đã ghi lại (gồm cả trang sau bị dời index/parent_index).
+    """
+    with pipeline_metrics.collect() as metrics:
+        with fitz.open(file_path) as documents:
+            if page_processor is not None:
+                # Các trang được xử lý lại trên worker, process này không tải model
+                new_pages = page_processor.reprocess_pages(documents, file_path, page_indices, detect_conf, score_threshold, progress)
+            else:
+                model, classifier, reader = model_registry.models()
+                new_pages = reprocess_pages(model, classifier, reader, documents, page_indices, detect_conf, score_threshold, progress)
+            total_pages = len(documents)
+
+        with metrics.stage('serialize'), reprocess_lock:
+            meta = paragraph_store.meta(file_id)
+            changed_pages, page_offsets, total_paragraphs = splice_page_results(
+                lambda page_index: paragraph_store.load_page(file_id, page_index),
+                meta['page_offsets'], meta['total_paragraphs'], new_pages
+            )
+            paragraph_store.update_pages(file_id, changed_pages, page_offsets, total_paragraphs)
+            file_registry.mark_reprocessed(file_id, total_pages, total_paragraphs)
+        print(f"🔁 Đã xử lý lại {len(new_pages)} trang, ghi lại {len(changed_pages)} trang")
+        data = {
+            'total_pages': total_pages,
+            'total_paragraphs': total_paragraphs,
+            'all_paragraphs': [paragraph for page_index in sorted(new_pages) for paragraph in new_pages[page_index][1]],
+            'triage': None,
+            'reprocessed_pages': sorted(new_pages),
+            'changed_pages': sorted(changed_pages),
+        }
+        data['metrics'] = metrics.summary()
+    data['profile'] = None
+    return data
+
+
+def cached_upload_response(file_id, unique_filename, cached):
+    """Response của upload_pdf khi kết quả đã có sẵn trong cache"""
+    return jsonify({
+        "message": "File PDF đã được xử lý thành công.",
+        "job_id": None,
+        "file_id": file_id,
+        "pdf_url": url_for('uploaded_file', filename=unique_filename, _external=True),
+        "page_images_url": url_for('get_file_page_images', file_id=file_id, _external=True),
+        "paragraphs_url": url_for('get_file_paragraphs', file_id=file_id, _external=True),
+        "total_pages": cached['total_pages'],
+        "total_paragraphs": cached['total_paragraphs'],
+        "info_all_paragraphs": cached['all_paragraphs'],
+        "triage": cached.get('triage'),
+        "cached": True
+    }), 200
+
+
 @app.route(f'/api/upload_pdf', methods=['POST'])
 def upload_pdf():
     if 'pdfFile' not in request.files:
@@ -89,56 +572,216 @@ def upload_pdf():
         file_extension = os.path.splitext(filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
+        pdf_bytes = file.read()
+        document_key = hash_content(pdf_bytes, CACHE_SETTINGS_KEY)
+
+        # File đã từng được xử lý với cùng model/ngưỡng: trả kết quả ngay, không tạo job
+        cached = result_cache.get('documents', document_key)
+        if cached is not None:
+            existing = file_registry.find_by_hash(document_key)
+            if existing is not None and os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], existing['filename'])):
+                # Cùng nội dung với một file còn lưu: dùng lại file_id đó (PDF, ảnh trang, kết quả)
+                print(f"♻️  Dùng lại file đã xử lý {existing['file_id']} cho {filename}")
+                file_registry.touch(existing['file_id'], min_interval=0)
+                return cached_upload_response(existing['file_id'], existing['filename'], cached)
+
+        with open(file_path, 'wb') as f:
+            f.write(pdf_bytes)
+        del pdf_bytes
 
         # Tạo ID duy nhất cho file này
         file_id = str(uuid.uuid4())
-        folder_path = os.path.join(app.config['IMAGES_FOLDER'], file_id)
-        os.makedirs(folder_path, exist_ok=True)
-        try:
-            # Xử lý PDF để lấy data
-            print("Đang xử lý nội dung PDF...")
-            data = process_full_pdf(model, classifier, reader, file_path, folder_path)
-            print("Xử lý PDF hoàn tất")
+        file_registry.add_upload(file_id, unique_filename, filename, document_key)
 
-            # Lưu thông tin file đã xử lý
-            processed_files[file_id] = {
-                'filename': unique_filename,
-                'original_name': filename,
-                'total_pages': data['total_pages'],
-                'total_paragraphs': data['total_paragraphs'],
-                'upload_time': time.time()
-            }
+        if cached is not None:
+            print(f"♻️  Dùng kết quả đã cache cho {filename}")
+            register_processed_file(file_id, cached)
+            return cached_upload_response(file_id, unique_filename, cached)
+
+        profiler = request.args.get('profile', JOB_PROFILER) or None
+        if profiler is not None and profiler not in PROFILERS:
+            cleanup_failed_upload(file_path, file_id)
+            return jsonify({"error": f"Chỉ hỗ trợ profile: {', '.join(PROFILERS)}"}), 400
 
-            pdf_url = url_for('uploaded_file', filename=unique_filename, _external=True)
-            page_images_url = url_for('get_file_page_images', file_id=file_id, _external=True)
-
-            return jsonify({
-                "message": "File PDF đã được xử lý thành công.",
-                "file_id": file_id,  # ID để lấy ảnh các trang
-                "pdf_url": pdf_url,  # URL để hiển thị PDF
-                "page_images_url": page_images_url,  # URL để lấy danh sách ảnh các trang
-                "total_pages": data['total_pages'],
-                "total_paragraphs": data['total_paragraphs'],
-                "info_all_paragraphs": data['all_paragraphs']
-            }), 200
+        # Phân loại trang digital/scanned/mixed (nhanh, không render) để báo trước độ nặng của job
+        try:
+            with fitz.open(file_path) as documents:
+                triage = triage_document(documents)
         except Exception as e:
-            print(f"Lỗi khi xử lý PDF: {e}")
-            # Xóa file PDF lỗi
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Đã xóa file PDF lỗi: {file_path}")
-            
-            # Xóa thư mục ảnh nếu có
-            file_images_folder = os.path.join(app.config['IMAGES_FOLDER'], file_id)
-            if os.path.exists(file_images_folder):
-                shutil.rmtree(file_images_folder)
-                print(f"Đã xóa thư mục ảnh lỗi: {file_images_folder}")
-            
-            return jsonify({"error": f"Lỗi khi xử lý PDF: {str(e)}"}), 500
+            cleanup_failed_upload(file_path, file_id)
+            return jsonify({"error": f"Không đọc được file PDF: {str(e)}"}), 400
+        triage_summary = {kind: triage[kind] for kind in ('digital', 'scanned', 'mixed')}
+
+        try:
+            # Đưa việc xử lý PDF vào hàng đợi, trả về job_id ngay
+            job_id = job_manager.submit(
+                run_pdf_job, file_path, file_id, document_key, triage, profiler,
+                metadata={'file_id': file_id, 'original_name': filename, 'triage': triage_summary}
+            )
+        except QueueFullError as e:
+            cleanup_failed_upload(file_path, file_id)
+            return jsonify({"error": f"Server đang bận, vui lòng thử lại sau: {str(e)}"}), 503
+
+        return jsonify({
+            "message": "File PDF đã được đưa vào hàng đợi xử lý.",
+            "job_id": job_id,
+            "file_id": file_id,  # ID để lấy ảnh các trang
+            "triage": triage_summary,
+            "status_url": url_for('get_job_status', job_id=job_id, _external=True),
+            "result_url": url_for('get_job_result', job_id=job_id, _external=True),
+        }), 202
     else:
         return jsonify({"error": "Chỉ chấp nhận file PDF"}), 400
 
 
+# Route lấy trạng thái của job
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    return jsonify(status), 200
+
+
+# Route lấy tiến độ từng trang của job
+@app.route('/api/jobs/<job_id>/pages')
+def get_job_pages(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    return jsonify({
+        "job_id": job_id,
+        "status": job['status'],
+        "total_pages": job['total_pages'],
+        "processed_pages": job['processed_pages'],
+        "pages": job['pages']
+    }), 200
+
+
+def job_result_summary(job_id, job):
+    """Thông tin kết quả của job đã xong (không kèm danh sách paragraph)"""
+    data = job['result']
+    file_id = job['metadata']['file_id']
+    file_info = file_registry.get(file_id)
+    return {
+        "message": "File PDF đã được xử lý thành công.",
+        "job_id": job_id,
+        "file_id": file_id,  # ID để lấy ảnh các trang
+        "pdf_url": url_for('uploaded_file', filename=file_info['filename'], _external=True),  # URL để hiển thị PDF
+        "page_images_url": url_for('get_file_page_images', file_id=file_id, _external=True),  # URL để lấy danh sách ảnh các trang
+        "paragraphs_url": url_for('get_file_paragraphs', file_id=file_id, _external=True),  # URL để lấy paragraph theo trang
+        "total_pages": data['total_pages'],
+        "total_paragraphs": data['total_paragraphs'],
+        "triage": data['triage'],
+        "metrics": data.get('metrics'),  # Thời gian, số box, RSS theo từng bước và từng trang
+        # Job xử lý lại: các trang đã xử lý lại và các trang đã ghi lại kết quả (None với job upload)
+        "reprocessed_pages": data.get('reprocessed_pages'),
+        "changed_pages": data.get('changed_pages'),
+        "profile_url": url_for('get_job_profile', job_id=job_id, _external=True) if data.get('profile') else None
+    }
+
+
+# Route lấy kết quả của job khi đã xử lý xong
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    if job['status'] == 'error':
+        return jsonify({"error": f"Lỗi khi xử lý PDF: {job['error']}"}), 500
+    if job['status'] != 'done':
+        return jsonify(job_manager.status(job_id)), 202
+
+    return jsonify({
+        **job_result_summary(job_id, job),
+        "info_all_paragraphs": job['result']['all_paragraphs']
+    }), 200
+
+
+# Route tải file profile của job (khi upload với profile=cprofile|pyinstrument hoặc đặt JOB_PROFILER)
+@app.route('/api/jobs/<job_id>/profile')
+def get_job_profile(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job['status'] != 'done' or not job['result'].get('profile'):
+        return jsonify({"error": "Job không có profile"}), 404
+    return send_from_directory(PROFILE_FOLDER, job['result']['profile'], as_attachment=True)
+
+
+# Route thống kê theo bước của pipeline cho Prometheus (thống kê riêng của từng process)
+@app.route('/metrics')
+def get_metrics():
+    return Response(pipeline_metrics.process_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def format_sse(event, data, event_id=None):
+    """Đóng gói một sự kiện Server-Sent Events"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Route stream kết quả của job (Server-Sent Events): mỗi trang xong là một sự kiện 'page'
+# chứa paragraphs, tiến độ và thời gian của trang; kết thúc bằng sự kiện 'done' hoặc 'error'.
+# Client nối lại được từ header Last-Event-ID (EventSource tự gửi khi mất kết nối).
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    if job_manager.status(job_id) is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def generate():
+        yield format_sse('status', job_manager.status(job_id))
+        for item in job_manager.iter_events(job_id, start):
+            if item is None:
+                # Comment SSE để giữ kết nối qua proxy khi trang đang xử lý lâu
+                yield ": heartbeat\n\n"
+                continue
+            event_id, event = item
+            yield format_sse('page', event, event_id)
+
+        job = job_manager.get(job_id)
+        if job is None:
+            return
+        if job['status'] == 'done':
+            yield format_sse('done', job_result_summary(job_id, job))
+        else:
+            yield format_sse('error', {"error": f"Lỗi khi xử lý PDF: {job['error']}"})
+
+    # stream_with_context giữ request context cho url_for trong lúc stream
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Không để nginx gom buffer các sự kiện
+    })
+
+
+@app.after_request
+def compress_response(response):
+    """Nén response JSON lớn bằng brotli (nếu có) hoặc gzip theo Accept-Encoding của client"""
+    if response.is_streamed or response.direct_passthrough or response.mimetype != 'application/json':
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in response.headers or response.status_code not in (200, 202):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# Dọn file hết hạn định kỳ trong thread nền
+threading.Thread(target=run_cleanup_loop, daemon=True).start()
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+WORDS = (
+    "layout document paragraph section table figure column reading order model page text "
+    "report analysis result method data value system process image region block line word"
+).split()
+FONTS = ("helv", "tiro", "cour")
+
+
+def random_paragraph(rng, min_words=8, max_words=40):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+
+def draw_text_page(page, rng, columns=2):
+    """Vẽ các đoạn văn (font, cỡ chữ ngẫu nhiên) theo cột, trả về khung của từng đoạn (tọa độ PDF)"""
+    rects = []
+    margin, gap = 40, 20
+    column_width = (page.rect.width - 2 * margin - (columns - 1) * gap) / columns
+    for column in range(columns):
+        x0 = margin + column * (column_width + gap)
+        y = margin
+        while y < page.rect.height - 120:
+            fontsize = rng.choice((8, 10, 12, 16))
+            rect = fitz.Rect(x0, y, x0 + column_width, page.rect.height - margin)
+            spare = page.insert_textbox(rect, random_paragraph(rng), fontsize=fontsize, fontname=rng.choice(FONTS))
+            if spare < 0:
+                break
+            rect.y1 -= spare
+            rects.append(rect)
+            y = rect.y1 + rng.uniform(4, 20)
+    return rects
+
+
+def build_text_pdf(num_pages, seed=0, overrides=None):
+    """
+    PDF có text layer, nội dung sinh theo seed.
+    Args:
+        overrides (dict | None): page_index -> seed riêng cho trang đó (để tạo trang khác nội dung).
+    Returns:
+        bytes: Nội dung file PDF.
+    """
+    overrides = overrides or {}
+    document = fitz.open()
+    for page_index in range(num_pages):
+        page = document.new_page()
+        draw_text_page(page, random.Random(overrides.get(page_index, seed * 1000 + page_index)))
+    data = document.tobytes()
+    document.close()
+    return data
@@ -0,0 +1,38 @@
+import pytest
+
+from file_registry import STATUS_DONE, STATUS_PROCESSING, FileRegistry, create_file_registry
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class PartialRegistry(FileRegistry):
+        def get(self, file_id):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialRegistry()
+
+
+def test_sqlite_registry_lifecycle(tmp_path):
+    registry = create_file_registry("sqlite", db_path=str(tmp_path / "registry.sqlite3"))
+    registry.add_upload("f1", "f1.pdf", "report.pdf", "hash-1")
+    assert registry.get("f1")["status"] == STATUS_PROCESSING
+    assert registry.find_by_hash("hash-1") is None
+
+    registry.mark_processed("f1", 3, 12)
+    record = registry.find_by_hash("hash-1")
+    assert (record["file_id"], record["status"], record["total_pages"], record["total_paragraphs"]) == ("f1", STATUS_DONE, 3, 12)
+    assert registry.find_by_filename("f1.pdf")["original_name"] == "report.pdf"
+
+    # Kết quả đã xử lý lại không còn dùng được cho lần upload cùng nội dung
+    registry.mark_reprocessed("f1", 3, 13)
+    assert registry.find_by_hash("hash-1") is None
+    assert registry.get("f1")["total_paragraphs"] == 13
+
+    assert [record["file_id"] for record in registry.expired(float("inf"))] == ["f1"]
+    registry.remove("f1")
+    assert registry.get("f1") is None
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_file_registry("redis")
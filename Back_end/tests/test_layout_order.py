@@ -0,0 +1,102 @@
+import random
+
+import numpy as np
+import pytest
+
+from layout_order import FULL_WIDTH_COLUMN, reading_order
+
+# Trang A4 theo hệ tọa độ 300 DPI
+PAGE_WIDTH = 2480
+FULL = FULL_WIDTH_COLUMN
+
+# (tên, bboxes theo thứ tự đọc, cột mong đợi)
+CASES = [
+    ("một box", [[200, 200, 2280, 400]], [1]),
+    ("một cột", [[200, 200, 2280, 400], [200, 440, 2280, 700], [200, 740, 2280, 800]], [1, 1, 1]),
+    (
+        "hai cột",
+        [
+            [200, 200, 1200, 500], [200, 540, 1200, 700], [200, 740, 1200, 1100],
+            [1280, 200, 2280, 350], [1280, 390, 2280, 800], [1280, 840, 2280, 900],
+        ],
+        [1, 1, 1, 2, 2, 2],
+    ),
+    (
+        "ba cột",
+        [
+            [200, 200, 860, 400], [200, 440, 860, 900],
+            [910, 200, 1570, 600], [910, 640, 1570, 700],
+            [1620, 200, 2280, 300], [1620, 340, 2280, 1000],
+        ],
+        [1, 1, 2, 2, 3, 3],
+    ),
+    (
+        "tiêu đề toàn chiều ngang + hai cột",
+        [
+            [200, 100, 2280, 180],
+            [200, 220, 1200, 500], [200, 540, 1200, 800],
+            [1280, 220, 2280, 600], [1280, 640, 2280, 700],
+        ],
+        [FULL, 1, 1, 2, 2],
+    ),
+    (
+        "hai cột, hình toàn chiều ngang ở giữa",
+        [
+            [200, 200, 1200, 500], [1280, 200, 2280, 450],
+            [200, 540, 2280, 1000],
+            [200, 1040, 1200, 1300], [200, 1340, 1200, 1500], [1280, 1040, 2280, 1400],
+        ],
+        [1, 2, FULL, 1, 1, 2],
+    ),
+    (
+        "hai cột thẳng hàng",
+        [
+            [200, 200, 1200, 400], [200, 440, 1200, 700], [200, 740, 1200, 900],
+            [1280, 200, 2280, 400], [1280, 440, 2280, 700], [1280, 740, 2280, 900],
+        ],
+        [1, 1, 1, 2, 2, 2],
+    ),
+    (
+        "hai cột lệch nhau",
+        [
+            [200, 200, 1200, 500], [200, 540, 1200, 800], [200, 840, 1200, 1000],
+            [1280, 260, 2280, 600], [1280, 640, 2280, 900], [1280, 940, 2280, 1200],
+        ],
+        [1, 1, 1, 2, 2, 2],
+    ),
+    (
+        "hai cột rồi ba cột",
+        [
+            [200, 100, 2280, 180],
+            [200, 220, 1200, 500], [1280, 220, 2280, 450],
+            [200, 540, 860, 800], [910, 540, 1570, 700], [1620, 540, 2280, 900],
+        ],
+        [FULL, 1, 2, 1, 2, 3],
+    ),
+    (
+        "cột hẹp bên trái",
+        [
+            [200, 200, 600, 500], [200, 540, 600, 900],
+            [680, 200, 2280, 800], [680, 840, 2280, 1000],
+        ],
+        [1, 1, 2, 2],
+    ),
+]
+
+
+@pytest.mark.parametrize("name, bboxes, expected_columns", CASES, ids=[case[0] for case in CASES])
+def test_reading_order(name, bboxes, expected_columns):
+    bboxes = np.array(bboxes, dtype=np.int64)
+    rng = random.Random(name)
+    for _ in range(5):
+        # Box được xáo trộn trước khi sắp xếp, thứ tự đọc không phụ thuộc thứ tự đầu vào
+        shuffle = np.array(rng.sample(range(len(bboxes)), len(bboxes)), dtype=np.int64)
+        order, columns = reading_order(bboxes[shuffle], PAGE_WIDTH)
+        assert shuffle[order].tolist() == list(range(len(bboxes)))
+        assert columns.tolist() == expected_columns
+
+
+def test_empty_page():
+    order, columns = reading_order(np.zeros((0, 4)), PAGE_WIDTH)
+    assert order.tolist() == []
+    assert columns.tolist() == []
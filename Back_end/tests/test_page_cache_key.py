@@ -0,0 +1,82 @@
+import random
+
+import fitz
+
+from conftest import build_text_pdf, draw_text_page
+from Processing_function import page_cache_key
+
+
+def build_pdf_with_logo(num_pages):
+    """PDF mà mọi trang dùng chung một ảnh logo (cùng xref)"""
+    logo = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 32), False)
+    logo.set_rect(logo.irect, (200, 30, 30))
+    document = fitz.open()
+    logo_xref = 0
+    for page_index in range(num_pages):
+        page = document.new_page()
+        draw_text_page(page, random.Random(page_index))
+        if logo_xref:
+            page.insert_image(fitz.Rect(500, 10, 564, 42), xref=logo_xref)
+        else:
+            logo_xref = page.insert_image(fitz.Rect(500, 10, 564, 42), stream=logo.tobytes("png"))
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def test_shared_streams_are_hashed_once(monkeypatch):
+    document = fitz.open(stream=build_pdf_with_logo(4), filetype="pdf")
+    keys = [page_cache_key(page) for page in document]
+
+    reads = []
+    xref_stream_raw = fitz.Document.xref_stream_raw
+    monkeypatch.setattr(fitz.Document, "xref_stream_raw", lambda self, xref: reads.append(xref) or xref_stream_raw(self, xref))
+    stream_digests = {}
+    assert [page_cache_key(page, "", stream_digests) for page in document] == keys
+    assert len(reads) == len(set(reads))
+    # Ảnh logo dùng chung cho mọi trang
+    shared = set.intersection(*({item[0] for item in page.get_images(full=True)} for page in document))
+    assert shared and shared <= set(reads)
+    document.close()
+
+
+def page_keys(data, settings_key=""):
+    document = fitz.open(stream=data, filetype="pdf")
+    stream_digests = {}
+    keys = [page_cache_key(page, settings_key, stream_digests) for page in document]
+    document.close()
+    return keys
+
+
+def test_keys_stable_across_reuploads():
+    data = build_text_pdf(4)
+    keys = page_keys(data)
+    assert len(set(keys)) == 4
+    assert page_keys(build_text_pdf(4)) == keys
+    # Cùng nội dung nhưng file được ghi lại (xref đánh số lại)
+    document = fitz.open(stream=data, filetype="pdf")
+    resaved = document.tobytes(garbage=4)
+    document.close()
+    assert resaved != data
+    assert page_keys(resaved) == keys
+
+
+def test_editing_one_page_changes_only_its_key():
+    keys = page_keys(build_text_pdf(4))
+    edited = page_keys(build_text_pdf(4, overrides={2: 999}))
+    assert [old == new for old, new in zip(keys, edited)] == [True, True, False, True]
+
+
+def test_key_follows_page_content_not_position():
+    data = build_text_pdf(4)
+    keys = page_keys(data)
+    document = fitz.open(stream=data, filetype="pdf")
+    document.select([3, 0, 1, 2])
+    moved = document.tobytes()
+    document.close()
+    assert page_keys(moved) == [keys[3], keys[0], keys[1], keys[2]]
+
+
+def test_settings_key_changes_every_page():
+    data = build_text_pdf(2)
+    assert not set(page_keys(data)) & set(page_keys(data, "detect_conf=0.5"))
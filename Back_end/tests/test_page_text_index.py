@@ -0,0 +1,66 @@
+import random
+
+import fitz
+import pytest
+
+from conftest import build_text_pdf, draw_text_page
+from Processing_function import OUTPUT_SCALE, PageTextIndex, recognize_text_from_pymupdf_page
+
+
+def clipped_get_text(page, bbox):
+    """Kết quả cũ của recognize_text_from_pymupdf_page: get_text(clip=...) cho từng box"""
+    clip = fitz.Rect(*[coord / OUTPUT_SCALE for coord in bbox])
+    blocks = page.get_text('blocks', clip=clip)
+    if not blocks:
+        return "", []
+    text = blocks[0][4].replace('.\n', '.').replace('\n', ' ')
+    words = [[int(coord * OUTPUT_SCALE) for coord in word[:4]] for word in page.get_text('words', clip=clip)]
+    return text, words
+
+
+@pytest.fixture(scope="module")
+def document():
+    document = fitz.open(stream=build_text_pdf(3), filetype="pdf")
+    yield document
+    document.close()
+
+
+def box_cases(page, rng):
+    """Khung của các block text (đúng khung và lệch ±5, ±15 px) và các box ngẫu nhiên, tọa độ 300 DPI"""
+    block_boxes = [[coord * OUTPUT_SCALE for coord in block[:4]] for block in page.get_text('blocks') if block[6] == 0]
+    boxes = []
+    for jitter in (0, 5, 15):
+        boxes.extend([coord + rng.uniform(-jitter, jitter) for coord in bbox] for bbox in block_boxes)
+    width, height = page.rect.width * OUTPUT_SCALE, page.rect.height * OUTPUT_SCALE
+    for _ in range(3 * len(block_boxes)):
+        x0, y0 = rng.uniform(0, width), rng.uniform(0, height)
+        boxes.append([x0, y0, x0 + rng.uniform(20, width / 2), y0 + rng.uniform(10, height / 4)])
+    return boxes
+
+
+def test_matches_clipped_get_text(document):
+    rng = random.Random(0)
+    for page_index, page in enumerate(document):
+        text_index = PageTextIndex(page)
+        for bbox in box_cases(page, rng):
+            assert recognize_text_from_pymupdf_page(document, page_index, bbox, text_index) == clipped_get_text(page, bbox), bbox
+
+
+def test_box_around_block_does_not_cut_chars(document):
+    page = document[0]
+    text_index = PageTextIndex(page)
+    block = next(block for block in page.get_text('blocks') if block[6] == 0)
+    rect = tuple(block[:4])
+    assert not text_index.cuts_chars(text_index.query_chars(rect), rect)
+    # Box cắt ngang dòng đầu của block
+    cut = (rect[0], rect[1] + 2, rect[2], rect[3])
+    assert text_index.cuts_chars(text_index.query_chars(cut), cut)
+
+
+def test_empty_region_and_empty_page():
+    document = fitz.open()
+    draw_text_page(document.new_page(), random.Random(1))
+    document.new_page()
+    assert recognize_text_from_pymupdf_page(document, 0, [0, 0, 10, 10]) == ("", [])
+    assert recognize_text_from_pymupdf_page(document, 1, [0, 0, 2000, 2000]) == ("", [])
+    document.close()
@@ -0,0 +1,62 @@
+import fitz
+import numpy as np
+
+from conftest import build_text_pdf
+from Processing_function import PixmapBuffer, crop_page_image, detector_input, iter_pdf_pages, pixmap_to_array
+
+
+def render(page, scale=1.0):
+    return page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+
+
+def test_pixmap_to_array_is_a_view_over_samples():
+    document = fitz.open(stream=build_text_pdf(1), filetype="pdf")
+    pix = render(document[0])
+    image = pixmap_to_array(pix)
+    assert image.shape == (pix.height, pix.width, pix.n)
+    assert image.dtype == np.uint8
+    assert isinstance(image.base, PixmapBuffer) and image.base.pixmap is pix
+    assert image.__array_interface__["data"][0] == pix.samples_ptr
+    assert not image.flags.writeable
+    assert image.tobytes() == pix.samples
+    document.close()
+
+
+def test_array_keeps_pixmap_alive():
+    document = fitz.open(stream=build_text_pdf(1), filetype="pdf")
+    pix = render(document[0])
+    expected = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[40:120, 40:200].copy()
+    crop = crop_page_image(pixmap_to_array(pix), [40, 40, 200, 120])
+    del pix
+    document.close()
+    # View cuối cùng vẫn giữ pixmap qua chuỗi .base
+    base = crop.base
+    while isinstance(base, np.ndarray):
+        base = base.base
+    assert isinstance(base, PixmapBuffer)
+    assert np.array_equal(crop, expected)
+
+
+def test_crops_and_detector_input_share_memory():
+    document = fitz.open(stream=build_text_pdf(1), filetype="pdf")
+    image = pixmap_to_array(render(document[0], 2))
+    crop = crop_page_image(image, [100, 150, 400, 300], box_scale=0.5)
+    assert crop.shape == (300, 600, 3)
+    assert np.shares_memory(crop, image)
+    bgr = detector_input(image)
+    assert np.shares_memory(bgr, image)
+    assert np.array_equal(bgr[..., 0], image[..., 2])
+    document.close()
+
+
+def test_iter_pdf_pages_images_are_pixmap_views():
+    document = fitz.open(stream=build_text_pdf(3), filetype="pdf")
+    for render_mode in ("adaptive", "full"):
+        pages = list(iter_pdf_pages(document, render_mode=render_mode))
+        assert [page_data["page_index"] for page_data in pages] == [0, 1, 2]
+        for page_data in pages:
+            image = page_data["image"]
+            assert isinstance(image.base, PixmapBuffer)
+            assert image.__array_interface__["data"][0] == image.base.pixmap.samples_ptr
+            assert image.shape[:2] == (image.base.pixmap.height, image.base.pixmap.width)
+    document.close()
@@ -7,12 +7,15 @@ const API_BASE_URL = 'http://localhost:5000'
 // Tạo axios instance với cấu hình mặc định
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
-  timeout: 300000, // 5 phút timeout cho việc xử lý PDF có thể mất thời gian
+  timeout: 60000, // Server xử lý PDF ở dạng job nền nên request chỉ cần timeout ngắn
   headers: {
     'Content-Type': 'multipart/form-data'
   }
 })
 
+// Khoảng thời gian giữa các lần hỏi trạng thái job (ms)
+const JOB_POLL_INTERVAL = 1500
+
 // Interceptor để xử lý response và error
 apiClient.interceptors.response.use(
   response => response,
@@ -38,12 +41,95 @@ apiClient.interceptors.response.use(
  */
 class ApiBackend {
   /**
-   * Upload file PDF và xử lý
+   * Upload file PDF, chờ job xử lý xong và trả về kết quả
    * @param {File} pdfFile - File PDF cần upload
    * @param {Function} onUploadProgress - Callback function để theo dõi tiến trình upload
+   * @param {Function} onProcessingProgress - Callback nhận trạng thái job trong lúc xử lý
    * @returns {Promise} Promise chứa kết quả xử lý
    */
-  async uploadPdf(pdfFile, onUploadProgress = null) {
+  async uploadPdf(pdfFile, onUploadProgress = null, onProcessingProgress = null, onPage = null) {
+    const submitted = await this.submitPdf(pdfFile, onUploadProgress)
+    if (!submitted.success) {
+      return submitted
+    }
+    // File đã được xử lý trước đó: server trả kết quả ngay từ cache
+    if (submitted.data.info_all_paragraphs) {
+      return submitted
+    }
+    if (typeof EventSource !== 'undefined') {
+      const streamed = await this.streamJobResult(submitted.data.job_id, onProcessingProgress, onPage)
+      if (streamed.success || !streamed.fallback) {
+        return streamed
+      }
+    }
+    return this.waitForJobResult(submitted.data.job_id, onProcessingProgress)
+  }
+
+  /**
+   * Nhận kết quả của job qua Server-Sent Events: paragraphs của mỗi trang
+   * được gửi về ngay khi trang đó xử lý xong.
+   * @param {string} jobId - ID của job
+   * @param {Function} onProcessingProgress - Callback nhận tiến độ (processed_pages, total_pages)
+   * @param {Function} onPage - Callback nhận sự kiện của từng trang (page_index, paragraphs, elapsed, ...)
+   * @returns {Promise} Cùng dạng kết quả với waitForJobResult. fallback = true nếu không stream được
+   */
+  streamJobResult(jobId, onProcessingProgress = null, onPage = null) {
+    return new Promise(resolve => {
+      const source = new EventSource(`${API_BASE_URL}/api/jobs/${jobId}/events`)
+      const paragraphs = []
+      let received = false
+
+      source.addEventListener('status', event => {
+        received = true
+        if (onProcessingProgress) {
+          onProcessingProgress(JSON.parse(event.data))
+        }
+      })
+      source.addEventListener('page', event => {
+        received = true
+        const page = JSON.parse(event.data)
+        paragraphs.push(...page.paragraphs)
+        if (onPage) {
+          onPage(page)
+        }
+        if (onProcessingProgress) {
+          onProcessingProgress({
+            status: 'running',
+            processed_pages: page.processed_pages,
+            total_pages: page.total_pages,
+            progress: page.total_pages ? page.processed_pages / page.total_pages : 0
+          })
+        }
+      })
+      source.addEventListener('done', event => {
+        source.close()
+        resolve({
+          success: true,
+          data: { ...JSON.parse(event.data), info_all_paragraphs: paragraphs }
+        })
+      })
+      source.addEventListener('error', event => {
+        // Sự kiện 'error' do server gửi có data, lỗi kết nối thì không
+        if (event.data) {
+          source.close()
+          resolve({ success: false, error: JSON.parse(event.data).error })
+        } else if (!received) {
+          // Không mở được stream: quay về hỏi trạng thái định kỳ
+          source.close()
+          resolve({ success: false, fallback: true, error: 'Không kết nối được stream kết quả' })
+        }
+        // Mất kết nối giữa chừng: EventSource tự nối lại và gửi Last-Event-ID
+      })
+    })
+  }
+
+  /**
+   * Upload file PDF và đưa vào hàng đợi xử lý
+   * @param {File} pdfFile - File PDF cần upload
+   * @param {Function} onUploadProgress - Callback function để theo dõi tiến trình upload
+   * @returns {Promise} Promise chứa job_id và file_id
+   */
+  async submitPdf(pdfFile, onUploadProgress = null) {
     try {
       const formData = new FormData()
       formData.append('pdfFile', pdfFile)
@@ -78,14 +164,68 @@ class ApiBackend {
     }
   }
 
+  /**
+   * Lấy trạng thái của job xử lý PDF
+   * @param {string} jobId - ID của job
+   * @returns {Promise} Promise chứa trạng thái job
+   */
+  async getJobStatus(jobId) {
+    try {
+      const response = await apiClient.get(`/api/jobs/${jobId}`)
+      return {
+        success: true,
+        data: response.data
+      }
+    } catch (error) {
+      return {
+        success: false,
+        error: error.response?.data?.error || 'Lỗi khi lấy trạng thái xử lý',
+        details: error
+      }
+    }
+  }
+
+  /**
+   * Hỏi trạng thái job định kỳ cho đến khi có kết quả
+   * @param {string} jobId - ID của job
+   * @param {Function} onProcessingProgress - Callback nhận trạng thái job
+   * @returns {Promise} Promise chứa kết quả xử lý
+   */
+  async waitForJobResult(jobId, onProcessingProgress = null) {
+    try {
+      while (true) {
+        const response = await apiClient.get(`/api/jobs/${jobId}/result`)
+        if (response.status === 200) {
+          return {
+            success: true,
+            data: response.data
+          }
+        }
+        if (onProcessingProgress) {
+          onProcessingProgress(response.data)
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL))
+      }
+    } catch (error) {
+      return {
+        success: false,
+        error: error.response?.data?.error || 'Lỗi khi xử lý file PDF',
+        details: error
+      }
+    }
+  }
+
   /**
    * Lấy danh sách ảnh các trang của file đã xử lý
    * @param {string} fileId - ID của file đã được xử lý
+   * @param {number|null} width - Độ rộng ảnh (pixel) mong muốn, server render theo độ rộng này
    * @returns {Promise} Promise chứa danh sách ảnh các trang
    */
-  async getPageImages(fileId) {
+  async getPageImages(fileId, width = null) {
     try {
-      const response = await apiClient.get(`/api/get_page_images/${fileId}`)
+      const response = await apiClient.get(`/api/get_page_images/${fileId}`, {
+        params: width ? { width } : {}
+      })
       return {
         success: true,
         data: response.data
@@ -99,6 +239,76 @@ class ApiBackend {
     }
   }
 
+  /**
+   * Lấy paragraph của file đã xử lý theo trang (không phải tải cả tài liệu)
+   * @param {string} fileId - ID của file đã được xử lý
+   * @param {Object} options - { pages: '3-5' (page_index tính từ 0), type: 'title', fields: 'index,full_text', limit, cursor }
+   * @returns {Promise} Promise chứa paragraphs và next_cursor (null nếu đã hết)
+   */
+  async getParagraphs(fileId, options = {}) {
+    try {
+      const response = await apiClient.get(`/api/files/${fileId}/paragraphs`, {
+        params: options
+      })
+      return {
+        success: true,
+        data: response.data
+      }
+    } catch (error) {
+      return {
+        success: false,
+        error: error.response?.data?.error || 'Lỗi khi lấy danh sách đoạn văn',
+        details: error
+      }
+    }
+  }
+
+  /**
+   * Lấy toàn bộ paragraph của một khoảng trang, tự đi theo next_cursor
+   * @param {string} fileId - ID của file đã được xử lý
+   * @param {Object} options - Giống getParagraphs (không cần cursor)
+   * @returns {Promise} Promise chứa danh sách paragraph
+   */
+  async getAllParagraphs(fileId, options = {}) {
+    const paragraphs = []
+    let cursor = 0
+    while (cursor !== null) {
+      const result = await this.getParagraphs(fileId, { ...options, cursor })
+      if (!result.success) {
+        return result
+      }
+      paragraphs.push(...result.data.paragraphs)
+      cursor = result.data.next_cursor
+    }
+    return {
+      success: true,
+      data: paragraphs
+    }
+  }
+
+  /**
+   * Xử lý lại một số trang của file đã xử lý (không phải upload lại), chờ job xong
+   * @param {string} fileId - ID của file đã được xử lý
+   * @param {string} pages - Khoảng trang, page_index tính từ 0 (vd: '3-5')
+   * @param {Object} options - { conf: ngưỡng confidence khi detect, score: ngưỡng score giữ box }
+   * @param {Function} onProcessingProgress - Callback nhận trạng thái job
+   * @returns {Promise} Promise chứa kết quả job (reprocessed_pages, changed_pages, ...)
+   */
+  async reprocessPages(fileId, pages, options = {}, onProcessingProgress = null) {
+    try {
+      const response = await apiClient.post(`/api/files/${fileId}/reprocess`, null, {
+        params: { pages, ...options }
+      })
+      return this.waitForJobResult(response.data.job_id, onProcessingProgress)
+    } catch (error) {
+      return {
+        success: false,
+        error: error.response?.data?.error || 'Lỗi khi xử lý lại trang',
+        details: error
+      }
+    }
+  }
+
   /**
    * Tạo URL để truy cập file PDF đã upload
    * @param {string} filename - Tên file PDF
@@ -111,11 +321,13 @@ class ApiBackend {
   /**
    * Tạo URL để truy cập ảnh trang cụ thể
    * @param {string} fileId - ID của file
-   * @param {string} pageName - Tên ảnh trang (vd: page_1.png)
+   * @param {string} pageName - Tên ảnh trang (vd: page_1)
+   * @param {number|null} width - Độ rộng ảnh (pixel)
    * @returns {string} URL đầy đủ để truy cập ảnh trang
    */
-  getPageImageUrl(fileId, pageName) {
-    return `${API_BASE_URL}/page_images/${fileId}/${pageName}`
+  getPageImageUrl(fileId, pageName, width = null) {
+    const query = width ? `?width=${width}` : ''
+    return `${API_BASE_URL}/page_images/${fileId}/${pageName}${query}`
   }
 
   /**
@@ -201,6 +413,6 @@ export { ApiBackend }
 // Export các constants nếu cần sử dụng ở nơi khác
 export const API_CONFIG = {
   BASE_URL: API_BASE_URL,
-  TIMEOUT: 300000,
+  TIMEOUT: 60000,
   MAX_FILE_SIZE: 5 * 1024 * 1024 // 5MB
 }
\ No newline at end of file